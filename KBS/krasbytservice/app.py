@@ -1,33 +1,74 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
+from flask import Flask, current_app, render_template, request, redirect, url_for, flash, jsonify, abort, Response, send_file, stream_with_context
 from flask_login import LoginManager, login_user, login_required, logout_user, current_user
-from models import db, User, Client, Order, SparePart, Employee, OrderStatus
+from models import (db, normalize_phone, User, Client, Order, SparePart, Employee, OrderStatus, ProfitLedger, OrderRollup,
+                    StockReservation, Job)
+from queries import paginate_orders, parse_order_filters, count_orders_by_status, client_choices, serialize_order_row
+from queries import (order_with_refs, client_with_orders, get_order, get_client,
+                     clients_with_stats, get_client_stats, query_budget, init_query_counter)
+import ledger
+from report_engine import build_report
+from export import EXPORT_KINDS, export_cli, export_filters, iter_csv, write_xlsx
+from importer import IMPORT_KINDS, import_cli, open_upload, run_import
+from search import search_cli, search_clients, search_orders
+from database import database_cli, init_database, use_replica
+from dashboard_stats import dashboard_snapshot
+from metrics import METRICS_CONTENT_TYPE, init_metrics, render_metrics
+from datagen import ensure_statuses, seed_cli
+from benchmark import bench_cli
+from intake import (init_intake, buy_request_item, submit_buy_request, lookup_order_status,
+                    forget_order_status, forget_client_statuses, status_cache)
+from ratelimit import init_rate_limits, public_endpoint, check_phone_limit
+import stock
+from stock import StockError
+import lifecycle
+from lifecycle import TransitionError
+import lookups
+from jobs import JobError, JobLimitError, cancel_job, fail_dead_jobs, init_jobs, jobs_cli, serialize_job, submit_job
+from lookups import BADGE_CLASSES, badge_class, employee_name, session_user, status_name
+from httpcache import cached_fragment, conditional, init_http_cache
+from assets import assets_cli, init_assets
+from money import MoneyJSONProvider, ZERO, parse_money, to_money
+from finance import finance_cli, order_profit
+import employees as workload
+from employees import EMPTY_PERIOD, EMPTY_WORKLOAD, employees_cli, orders_count_class, position_badge_class
+from migrations import schema_cli, upgrade as upgrade_schema
 from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.middleware.proxy_fix import ProxyFix
+import click
+from flask.cli import with_appcontext
 from datetime import datetime, timedelta
-from flask import request, jsonify
+import hmac
+import json
+import os
+import tempfile
 
 
-app = Flask(__name__)
-app.config['SECRET_KEY'] = 'your-secret-key-here'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///krasbytservice.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-
-db.init_app(app)
 login_manager = LoginManager()
-login_manager.init_app(app)
 login_manager.login_view = 'login'
 
+# Представления собираются декоратором route и подключаются к приложению в create_app
+ROUTES = []
+
+
+def route(rule, **options):
+    def decorator(view):
+        ROUTES.append((rule, view, options))
+        return view
+    return decorator
+
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    # Пользователь сессии берется из кэша, а не из базы на каждый запрос
+    return session_user(int(user_id))
 
 
-@app.route('/')
+@route('/')
 def index():
     return render_template('index.html')
 
 
-@app.route('/login', methods=['GET', 'POST'])
+@route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
         username = request.form['username']
@@ -42,60 +83,98 @@ def login():
     return render_template('login.html')
 
 
-@app.route('/logout')
+@route('/logout')
 @login_required
 def logout():
     logout_user()
     return redirect(url_for('index'))
 
 
-
-def calculate_total_profit():
-    """Расчет общей прибыли по всем заказам"""
-    total_profit = 0
-    for order in Order.query.all():
-        profit = (order.sale_price or 0) - (order.repair_costs or 0) - (order.purchase_price or 0)
-        total_profit += profit
-    return total_profit
+# Функции для шаблонов
+def template_helpers():
+    return {
+        'get_status_badge_class': badge_class,
+        'status_name': status_name,
+        'employee_name': employee_name
+    }
 
 
-def get_status_badge_class(status_id):
-    """Получение класса CSS для статуса"""
-    classes = {
-        1: 'primary',  # Новая
-        2: 'info',  # В обработке
-        3: 'warning',  # В ремонте
-        4: 'success',  # Выполнена
-        5: 'danger'  # Отменена
-    }
-    return classes.get(status_id, 'secondary')
+@route('/metrics')
+def metrics():
+    if not current_app.config.get('METRICS_ENABLED', True):
+        abort(404)
+    # Метрики видны администратору или сборщику с токеном (Authorization: Bearer <METRICS_TOKEN>).
+    # Без проверки они отдаются, только если это явно разрешено METRICS_PUBLIC
+    token = current_app.config.get('METRICS_TOKEN')
+    allowed = (current_app.config.get('METRICS_PUBLIC')
+               or (token and hmac.compare_digest(request.headers.get('Authorization', ''), 'Bearer {}'.format(token)))
+               or (current_user.is_authenticated and current_user.role == 'admin'))
+    if not allowed:
+        abort(403)
+    return Response(render_metrics(current_app.extensions.get('metrics')), content_type=METRICS_CONTENT_TYPE)
 
 
-# Добавляем функции в контекст шаблонов
-@app.context_processor
-def utility_processor():
-    return {
-        'calculate_total_profit': calculate_total_profit,
-        'get_status_badge_class': get_status_badge_class
-    }
+# Таблицы, от которых зависят страницы: их версии входят в ETag и ключи кэша фрагментов
+ORDER_LIST_TABLES = ('order', 'client', 'order_status', 'employee')
+CLIENT_LIST_TABLES = ('client', 'order')
+WAREHOUSE_TABLES = ('spare_part',)
+ORDER_DETAILS_TABLES = ('order', 'client', 'order_status', 'employee')
+EMPLOYEE_TABLES = ('employee', 'order')
+CLIENT_DETAILS_TABLES = ('client', 'order', 'order_status')
 
 
-@app.route('/orders')
+@route('/orders')
 @login_required
+@use_replica
+@conditional(*ORDER_LIST_TABLES)
+@query_budget(10)
 def orders():
-    orders_list = Order.query.order_by(Order.created_at.desc()).all()
-    statuses = OrderStatus.query.all()
-    employees = Employee.query.all()
-    clients = Client.query.all()
+    filters = parse_order_filters(request.args)
+    cursor = request.args.get('cursor')
+    limit = request.args.get('limit', type=int)
+
+    def render_rows():
+        orders_list, next_cursor = paginate_orders(cursor=cursor, limit=limit, **filters)
+        return render_template('_order_rows.html', orders=orders_list), next_cursor
 
+    rows_html, next_cursor = cached_fragment('order_rows', ORDER_LIST_TABLES,
+                                             (tuple(sorted(filters.items())), cursor, limit), render_rows)
     return render_template('orders.html',
-                           orders=orders_list,
-                           statuses=statuses,
-                           employees=employees,
-                           clients=clients)
+                           rows_html=rows_html,
+                           next_cursor=next_cursor,
+                           filters=filters,
+                           status_counts=cached_fragment('order_status_counts', ('order',), None,
+                                                         count_orders_by_status),
+                           total_profit=cached_fragment('total_profit', ('order',), None, ledger.total_profit),
+                           statuses=lookups.statuses(),
+                           employees=lookups.employees(),
+                           masters=masters_by_load(),
+                           clients=cached_fragment('client_choices', ('client',), None, client_choices))
 
 
-@app.route('/add_order', methods=['POST'])
+def masters_by_load():
+    """Активные сотрудники от наименее загруженного для выбора мастера: загрузка из счетчиков"""
+    stats = cached_fragment('employee_workload', EMPLOYEE_TABLES, None, workload.workload_stats)
+    return workload.masters_by_load(lookups.employees(), stats)
+
+
+@route('/api/orders')
+@login_required
+@use_replica
+@query_budget(4)
+def api_orders():
+    filters = parse_order_filters(request.args)
+    orders_list, next_cursor = paginate_orders(cursor=request.args.get('cursor'),
+                                               limit=request.args.get('limit', type=int),
+                                               **filters)
+    return jsonify({
+        'success': True,
+        'orders': [serialize_order_row(order) for order in orders_list],
+        'next_cursor': next_cursor
+    })
+
+
+@route('/add_order', methods=['POST'])
 @login_required
 def add_order():
     if request.method == 'POST':
@@ -105,14 +184,19 @@ def add_order():
                 washing_machine_model=request.form['model'],
                 description=request.form.get('description', ''),
                 status_id=request.form['status_id'],
-                employee_id=request.form.get('employee_id') or None,
-                purchase_price=float(request.form.get('purchase_price', 0)) or None,
-                repair_costs=float(request.form.get('repair_costs', 0)) or None,
-                sale_price=float(request.form.get('sale_price', 0)) or None,
+                employee_id=request.form.get('employee_id', type=int),
+                # Пустое поле — сумма не указана
+                purchase_price=request.form.get('purchase_price', type=parse_money) or None,
+                repair_costs=request.form.get('repair_costs', type=parse_money) or None,
+                sale_price=request.form.get('sale_price', type=parse_money) or None,
                 created_at=datetime.now()
             )
             db.session.add(new_order)
+            lifecycle.open_history(new_order, current_user.id)
+            ledger.record_order(new_order)
+            workload.record_order(new_order)
             db.session.commit()
+            forget_order_status(new_order.id)
             flash('Заказ успешно создан')
         except Exception as e:
             db.session.rollback()
@@ -121,14 +205,19 @@ def add_order():
     return redirect(url_for('orders'))
 
 
-@app.route('/delete_order/<int:order_id>', methods=['DELETE'])
+@route('/delete_order/<int:order_id>', methods=['DELETE'])
 @login_required
 def delete_order(order_id):
     try:
-        order = Order.query.get(order_id)
+        order = db.session.get(Order, order_id)
         if order:
+            stock.release_order(order.id, current_user.id)
+            lifecycle.delete_history([order.id])
+            ledger.record_order(order, sign=-1)
+            workload.record_order(order, sign=-1)
             db.session.delete(order)
             db.session.commit()
+            forget_order_status(order_id)
             return jsonify({'success': True})
         return jsonify({'success': False, 'error': 'Заказ не найден'})
     except Exception as e:
@@ -136,86 +225,188 @@ def delete_order(order_id):
         return jsonify({'success': False, 'error': str(e)})
 
 
-@app.route('/api/order_details/<int:order_id>')
+@route('/api/order_details/<int:order_id>')
 @login_required
+@conditional(*ORDER_DETAILS_TABLES)
+@query_budget(6)
 def order_details(order_id):
     try:
-        order = Order.query.get(order_id)
+        order = cached_fragment('order_details', ORDER_DETAILS_TABLES, order_id,
+                                lambda: serialize_order_details(order_id))
         if order:
-            profit = (order.sale_price or 0) - (order.repair_costs or 0) - (order.purchase_price or 0)
-
-            return jsonify({
-                'success': True,
-                'order': {
-                    'id': order.id,
-                    'client_name': order.client.name,
-                    'client_phone': order.client.phone,
-                    'client_email': order.client.email,
-                    'client_address': order.client.address,
-                    'model': order.washing_machine_model,
-                    'description': order.description,
-                    'status': order.status.name,
-                    'status_class': get_status_badge_class(order.status_id),
-                    'master': order.employee.name if order.employee else None,
-                    'created_date': order.created_at.strftime('%d.%m.%Y'),
-                    'purchase_price': order.purchase_price,
-                    'repair_costs': order.repair_costs,
-                    'sale_price': order.sale_price,
-                    'profit': profit
-                }
-            })
+            return jsonify({'success': True, 'order': order})
         return jsonify({'success': False, 'error': 'Заказ не найден'})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
 
-@app.route('/dashboard')
+def serialize_order_details(order_id):
+    """Карточка заказа для JSON API, None если заказа нет"""
+    order = get_order(order_id, *order_with_refs())
+    if not order:
+        return None
+    status_names = lookups.status_names()
+    return {
+        'id': order.id,
+        'client_name': order.client.name,
+        'client_phone': order.client.phone,
+        'client_email': order.client.email,
+        'client_address': order.client.address,
+        'model': order.washing_machine_model,
+        'description': order.description,
+        'status_id': order.status_id,
+        'status': status_name(order.status_id),
+        'status_class': badge_class(order.status_id),
+        'transitions': [{'id': status_id, 'name': status_names.get(status_id, str(status_id))}
+                        for status_id in lifecycle.allowed_statuses(order.status_id)],
+        'history': [serialize_transition(transition, name)
+                    for transition, name in lifecycle.order_history(order.id)],
+        'completed_date': order.completed_at.strftime('%d.%m.%Y') if order.completed_at else None,
+        'employee_id': order.employee_id,
+        'master': employee_name(order.employee_id),
+        'created_date': order.created_at.strftime('%d.%m.%Y'),
+        'purchase_price': order.purchase_price,
+        'repair_costs': order.repair_costs,
+        'sale_price': order.sale_price,
+        'profit': order_profit(order)
+    }
+
+
+def serialize_transition(transition, status_name):
+    return {
+        'status_id': transition.to_status_id,
+        'status': status_name,
+        'from_status_id': transition.from_status_id,
+        'changed_at': transition.changed_at.strftime('%d.%m.%Y %H:%M'),
+        'left_at': transition.left_at.strftime('%d.%m.%Y %H:%M') if transition.left_at else None,
+        'user_id': transition.user_id,
+        'comment': transition.comment
+    }
+
+
+@route('/api/orders/<int:order_id>/status', methods=['POST'])
 @login_required
-def dashboard():
-    total_orders = Order.query.count()
-    active_orders = Order.query.filter(Order.status_id != 4).count()  # 4 - Выполнена
-    total_clients = Client.query.count()
-    low_stock_parts = SparePart.query.filter(SparePart.quantity <= SparePart.min_stock).count()
+def change_order_status(order_id):
+    try:
+        order = db.session.get(Order, order_id)
+        if not order:
+            return jsonify({'success': False, 'error': 'Заказ не найден'})
+        data = request.get_json(silent=True) or request.form
+        # Счетчики мастера ведутся по статусам: заказ переносится из старого статуса в новый
+        workload.record_order(order, sign=-1)
+        lifecycle.change_status(order, data['status_id'], current_user.id, data.get('comment') or None)
+        workload.record_order(order)
+        db.session.commit()
+        forget_order_status(order_id)
+        return jsonify({'success': True, 'status_id': order.status_id, 'status': status_name(order.status_id)})
+    except (TransitionError, KeyError, ValueError) as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)})
+
+
+@route('/api/orders/<int:order_id>/master', methods=['POST'])
+@login_required
+def assign_order_master(order_id):
+    try:
+        order = db.session.get(Order, order_id)
+        if not order:
+            return jsonify({'success': False, 'error': 'Заказ не найден'})
+        data = request.get_json(silent=True) or request.form
+        employee_id = int(data['employee_id']) if data.get('employee_id') else None
+        if employee_id is not None:
+            employee = db.session.get(Employee, employee_id)
+            if not employee or not employee.is_active:
+                return jsonify({'success': False, 'error': 'Мастер не найден или не активен'}), 400
+        workload.assign(order, employee_id)
+        db.session.commit()
+        return jsonify({'success': True, 'employee_id': employee_id, 'master': employee_name(employee_id)})
+    except (KeyError, ValueError) as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)})
 
-    # Последние 5 заказов
-    recent_orders = Order.query.order_by(Order.created_at.desc()).limit(5).all()
 
+@route('/api/orders/<int:order_id>/history')
+@login_required
+def order_status_history(order_id):
+    return jsonify({'success': True, 'history': [serialize_transition(transition, name)
+                                                 for transition, name in lifecycle.order_history(order_id)]})
+
+
+@route('/api/orders/stuck')
+@login_required
+@use_replica
+def stuck_orders():
+    status_id = request.args.get('status_id', lifecycle.REPAIR_STATUS_ID, type=int)
+    days = request.args.get('days', lifecycle.STUCK_DAYS, type=int)
+    limit = min(request.args.get('limit', 100, type=int), 1000)
+    now = datetime.now()
+    return jsonify({'success': True, 'orders': [{
+        'id': order_id,
+        'client_name': client_name,
+        'model': model,
+        'since': changed_at.strftime('%d.%m.%Y %H:%M'),
+        'days': (now - changed_at).days
+    } for order_id, client_name, model, changed_at in lifecycle.stuck_orders(status_id, days, limit)]})
+
+
+@route('/dashboard')
+@login_required
+@use_replica
+@query_budget(5)
+def dashboard():
+    # Счетчики и последние заказы берутся из снимка, кэшированного по версиям таблиц. Без кэша —
+    # 5 запросов: пользователь сессии, версии, счетчики, последние заказы и справочник статусов
+    snapshot = dashboard_snapshot()
     return render_template('dashboard.html',
-                           total_orders=total_orders,
-                           active_orders=active_orders,
-                           total_clients=total_clients,
-                           low_stock_parts=low_stock_parts,
-                           recent_orders=recent_orders)
+                           recent_orders=snapshot['recent_orders'],
+                           **snapshot['counters'])
 
 
-@app.route('/clients')
+@route('/api/dashboard_stats')
 @login_required
+@use_replica
+@query_budget(5)
+def api_dashboard_stats():
+    return jsonify({'success': True, **dashboard_snapshot()})
+
+
+@route('/clients')
+@login_required
+@use_replica
+@conditional(*CLIENT_LIST_TABLES)
+@query_budget(3)
 def clients():
-    clients_list = Client.query.all()
-    return render_template('clients.html', clients=clients_list)
-def calculate_client_total(client):
-    """Вспомогательная функция для расчета общей суммы заказов клиента"""
-    total = 0
-    for order in client.orders:
-        if order.sale_price:
-            total += order.sale_price
-        elif order.repair_costs:
-            total += order.repair_costs
-    return total
+    def render_rows():
+        clients_list = clients_with_stats()
+
+        # Сводка считается по уже полученным строкам, без дополнительных запросов
+        orders_count = sum(stats.orders_count for _, stats in clients_list)
+        total_amount = sum(stats.total_amount for _, stats in clients_list)
+        summary = {
+            'total': len(clients_list),
+            'active': sum(1 for _, stats in clients_list if stats.orders_count > 0),
+            'repeat': sum(1 for _, stats in clients_list if stats.orders_count > 1),
+            'avg_order': to_money(total_amount / orders_count) if orders_count else ZERO
+        }
+        return render_template('_client_rows.html', clients=clients_list), summary
+
+    rows_html, summary = cached_fragment('client_rows', CLIENT_LIST_TABLES, None, render_rows)
+    return render_template('clients.html', rows_html=rows_html, summary=summary)
+
 
-@app.template_filter('strftime')
 def strftime_filter(date, format_string='%Y-%m-%d'):
     if isinstance(date, str):
         date = datetime.strptime(date, '%Y-%m-%d %H:%M:%S')
     return date.strftime(format_string)
 
-# Добавляем функцию в контекст шаблонов
-@app.context_processor
-def utility_processor():
-    return dict(calculate_client_total=calculate_client_total)
-
 
-@app.route('/add_client', methods=['POST'])
+@route('/add_client', methods=['POST'])
 @login_required
 def add_client():
     if request.method == 'POST':
@@ -236,21 +427,24 @@ def add_client():
     return redirect(url_for('clients'))
 
 
-@app.route('/edit_client', methods=['POST'])
+@route('/edit_client', methods=['POST'])
 @login_required
 def edit_client():
     if request.method == 'POST':
         try:
             client_id = request.form['client_id']
-            client = Client.query.get(client_id)
+            client = db.session.get(Client, client_id)
 
             if client:
+                old_phone = client.phone_normalized
                 client.name = request.form['name']
                 client.phone = request.form['phone']
                 client.email = request.form.get('email', '')
                 client.address = request.form.get('address', '')
 
                 db.session.commit()
+                if client.phone_normalized != old_phone:
+                    forget_client_statuses(client.id)
                 flash('Данные клиента успешно обновлены')
             else:
                 flash('Клиент не найден')
@@ -261,17 +455,24 @@ def edit_client():
     return redirect(url_for('clients'))
 
 
-@app.route('/delete_client/<int:client_id>', methods=['DELETE'])
+@route('/delete_client/<int:client_id>', methods=['DELETE'])
 @login_required
 def delete_client(client_id):
     try:
-        client = Client.query.get(client_id)
+        client = db.session.get(Client, client_id)
         if client:
             # Удаляем связанные заказы
+            order_ids = [order.id for order in client.orders]
+            lifecycle.delete_history(order_ids)
             for order in client.orders:
+                stock.release_order(order.id, current_user.id)
+                ledger.record_order(order, sign=-1)
+                workload.record_order(order, sign=-1)
                 db.session.delete(order)
             db.session.delete(client)
             db.session.commit()
+            for order_id in order_ids:
+                forget_order_status(order_id)
             return jsonify({'success': True})
         return jsonify({'success': False, 'error': 'Клиент не найден'})
     except Exception as e:
@@ -279,68 +480,217 @@ def delete_client(client_id):
         return jsonify({'success': False, 'error': str(e)})
 
 
-@app.route('/api/client_details/<int:client_id>')
+@route('/api/client_details/<int:client_id>')
 @login_required
+@conditional(*CLIENT_DETAILS_TABLES)
+@query_budget(6)
 def client_details(client_id):
     try:
-        client = Client.query.get(client_id)
-        if client:
-            orders_data = []
-            for order in client.orders:
-                orders_data.append({
-                    'id': order.id,
-                    'date': order.created_at.strftime('%d.%m.%Y'),
-                    'service': order.washing_machine_model,
-                    'amount': order.sale_price or order.repair_costs or 0,
-                    'status': order.status.name,
-                    'status_class': 'success' if order.status_id == 4 else 'warning'
-                })
-
-            total_orders = len(client.orders)
-            total_amount = calculate_client_total(client)
-            avg_order = total_amount / total_orders if total_orders > 0 else 0
-
-            return jsonify({
-                'success': True,
-                'client': {
-                    'name': client.name,
-                    'phone': client.phone,
-                    'email': client.email,
-                    'address': client.address,
-                    'created_at': client.created_at.strftime('%d.%m.%Y'),
-                    'orders_count': total_orders,
-                    'total_amount': total_amount,
-                    'avg_order': avg_order,
-                    'last_order': client.orders[-1].created_at.strftime('%d.%m.%Y') if client.orders else None
-                },
-                'orders': orders_data
-            })
+        details = cached_fragment('client_details', CLIENT_DETAILS_TABLES, client_id,
+                                  lambda: serialize_client_details(client_id))
+        if details:
+            return jsonify(dict(details, success=True))
         return jsonify({'success': False, 'error': 'Клиент не найден'})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
 
-@app.route('/warehouse')
+def serialize_client_details(client_id):
+    """Карточка клиента с заказами для JSON API, None если клиента нет"""
+    client = get_client(client_id, *client_with_orders())
+    if not client:
+        return None
+    orders_data = []
+    for order in client.orders:
+        orders_data.append({
+            'id': order.id,
+            'date': order.created_at.strftime('%d.%m.%Y'),
+            'service': order.washing_machine_model,
+            'amount': order.sale_price or order.repair_costs or ZERO,
+            'status': status_name(order.status_id),
+            'status_class': badge_class(order.status_id)
+        })
+
+    stats = get_client_stats(client.id)
+
+    return {
+        'client': {
+            'name': client.name,
+            'phone': client.phone,
+            'email': client.email,
+            'address': client.address,
+            'created_at': client.created_at.strftime('%d.%m.%Y'),
+            'orders_count': stats.orders_count,
+            'total_amount': stats.total_amount,
+            'avg_order': stats.avg_order,
+            'last_order': stats.last_order.strftime('%d.%m.%Y') if stats.last_order else None
+        },
+        'orders': orders_data
+    }
+
+
+@route('/employees')
 @login_required
+@use_replica
+@query_budget(5)
+def employees():
+    # Загрузка и выработка читаются из счетчиков мастеров, заказы не перебираются.
+    # Без ETag: период по умолчанию зависит от текущей даты, а не только от данных
+    date_from, date_to = employee_period(request.args)
+    employees = Employee.query.order_by(Employee.name).all()
+    return render_template('employees.html',
+                           employees=employees,
+                           workload=workload.workload_stats(),
+                           period=workload.period_stats(date_from, date_to),
+                           date_from=date_from,
+                           date_to=date_to,
+                           avg_salary=workload.average_salary(employees) or ZERO,
+                           empty_workload=EMPTY_WORKLOAD,
+                           empty_period=EMPTY_PERIOD)
+
+
+def employee_period(args):
+    """Период выработки из параметров запроса; по умолчанию с начала текущего месяца"""
+    today = datetime.now().date()
+    period = {'date_from': today.replace(day=1), 'date_to': today}
+    for key in period:
+        try:
+            period[key] = datetime.strptime(args.get(key, ''), '%Y-%m-%d').date()
+        except ValueError:
+            pass
+    return period['date_from'], period['date_to']
+
+
+def employee_template_helpers():
+    return dict(get_position_badge_class=position_badge_class, get_orders_count_class=orders_count_class)
+
+
+def read_employee_form(employee):
+    employee.name = request.form['name']
+    employee.position = request.form.get('position', '')
+    employee.phone = request.form.get('phone', '')
+    employee.email = request.form.get('email', '')
+    employee.salary = request.form.get('salary', type=parse_money) or None
+    hire_date = request.form.get('hire_date')
+    employee.hire_date = datetime.strptime(hire_date, '%Y-%m-%d') if hire_date else None
+    employee.is_active = 'is_active' in request.form
+
+
+@route('/add_employee', methods=['POST'])
+@login_required
+def add_employee():
+    try:
+        employee = Employee()
+        read_employee_form(employee)
+        db.session.add(employee)
+        db.session.commit()
+        flash('Сотрудник успешно добавлен')
+    except Exception as e:
+        db.session.rollback()
+        flash('Ошибка при добавлении сотрудника')
+
+    return redirect(url_for('employees'))
+
+
+@route('/edit_employee', methods=['POST'])
+@login_required
+def edit_employee():
+    try:
+        employee = db.session.get(Employee, request.form.get('employee_id', type=int))
+        if employee:
+            read_employee_form(employee)
+            db.session.commit()
+            flash('Данные сотрудника успешно обновлены')
+        else:
+            flash('Сотрудник не найден')
+    except Exception as e:
+        db.session.rollback()
+        flash('Ошибка при обновлении данных сотрудника')
+
+    return redirect(url_for('employees'))
+
+
+@route('/delete_employee/<int:employee_id>', methods=['DELETE'])
+@login_required
+def delete_employee(employee_id):
+    try:
+        employee = db.session.get(Employee, employee_id)
+        if not employee:
+            return jsonify({'success': False, 'error': 'Сотрудник не найден'})
+        # Заказы хранят мастера: сотрудник с заказами снимается с работы, а не удаляется
+        if workload.workload_stats().get(employee_id, EMPTY_WORKLOAD).total_orders:
+            return jsonify({'success': False,
+                            'error': 'У сотрудника есть заказы: снимите отметку «Активный сотрудник» вместо удаления'})
+        db.session.delete(employee)
+        db.session.commit()
+        return jsonify({'success': True})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)})
+
+
+@route('/api/employee_details/<int:employee_id>')
+@login_required
+@use_replica
+@query_budget(5)
+def employee_details(employee_id):
+    employee = db.session.get(Employee, employee_id)
+    if not employee:
+        return jsonify({'success': False, 'error': 'Сотрудник не найден'})
+    stats = workload.workload_stats().get(employee_id, EMPTY_WORKLOAD)
+    date_from, date_to = employee_period(request.args)
+    period = workload.period_stats(date_from, date_to, employee_id).get(employee_id, EMPTY_PERIOD)
+    return jsonify({'success': True, 'employee': {
+        'id': employee.id,
+        'name': employee.name,
+        'position': employee.position,
+        'position_class': position_badge_class(employee.position),
+        'is_active': employee.is_active,
+        'hire_date': employee.hire_date.strftime('%d.%m.%Y') if employee.hire_date else None,
+        'salary': employee.salary,
+        'phone': employee.phone,
+        'email': employee.email,
+        'total_orders': stats.total_orders,
+        'active_orders': stats.open_orders,
+        'completed_orders': stats.completed_orders,
+        'cancelled_orders': stats.cancelled_orders,
+        'revenue': stats.revenue,
+        'period_completed': period.completed_orders,
+        'period_revenue': period.revenue,
+        'period_avg_days': period.avg_turnaround_days
+    }})
+
+
+@route('/warehouse')
+@login_required
+@conditional(*WAREHOUSE_TABLES)
+@query_budget(3)
 def warehouse():
-    spare_parts = SparePart.query.all()
-    return render_template('warehouse.html', spare_parts=spare_parts)
+    rows_html = cached_fragment('spare_part_rows', WAREHOUSE_TABLES, None,
+                                lambda: render_template('_spare_part_rows.html',
+                                                        spare_parts=SparePart.query.all()))
+    return render_template('warehouse.html', rows_html=rows_html)
 
 
-@app.route('/add_spare_part', methods=['POST'])
+@route('/add_spare_part', methods=['POST'])
 @login_required
 def add_spare_part():
     if request.method == 'POST':
         try:
+            quantity = int(request.form['quantity'])
             new_part = SparePart(
                 name=request.form['name'],
                 article=request.form['article'],
-                quantity=int(request.form['quantity']),
+                quantity=0,
                 min_stock=int(request.form['min_stock']),
-                cost_price=float(request.form['cost_price']),
-                retail_price=float(request.form['retail_price'])
+                cost_price=parse_money(request.form['cost_price']),
+                retail_price=parse_money(request.form['retail_price'])
             )
             db.session.add(new_part)
+            db.session.flush()
+            # Начальный остаток проводится как поступление, чтобы попасть в журнал движения
+            if quantity:
+                stock.receive(new_part.id, quantity, current_user.id, 'Начальный остаток')
             db.session.commit()
             flash('Запчасть успешно добавлена')
         except Exception as e:
@@ -350,26 +700,34 @@ def add_spare_part():
     return redirect(url_for('warehouse'))
 
 
-@app.route('/edit_spare_part', methods=['POST'])
+@route('/edit_spare_part', methods=['POST'])
 @login_required
 def edit_spare_part():
     if request.method == 'POST':
         try:
             part_id = request.form['part_id']
-            part = SparePart.query.get(part_id)
+            part = db.session.get(SparePart, part_id)
 
             if part:
+                # Остаток не перезаписывается: разница с показанным в форме значением
+                # применяется атомарно и не затирает резервы, сделанные за это время
+                original_quantity = int(request.form.get('original_quantity', part.quantity))
+                delta = int(request.form['quantity']) - original_quantity
+
                 part.name = request.form['name']
                 part.article = request.form['article']
-                part.quantity = int(request.form['quantity'])
                 part.min_stock = int(request.form['min_stock'])
-                part.cost_price = float(request.form['cost_price'])
-                part.retail_price = float(request.form['retail_price'])
+                part.cost_price = parse_money(request.form['cost_price'])
+                part.retail_price = parse_money(request.form['retail_price'])
+                stock.adjust(part.id, delta, current_user.id, 'Изменение остатка в карточке')
 
                 db.session.commit()
                 flash('Запчасть успешно обновлена')
             else:
                 flash('Запчасть не найдена')
+        except StockError as e:
+            db.session.rollback()
+            flash(str(e))
         except Exception as e:
             db.session.rollback()
             flash('Ошибка при обновлении запчасти')
@@ -377,12 +735,15 @@ def edit_spare_part():
     return redirect(url_for('warehouse'))
 
 
-@app.route('/delete_spare_part/<int:part_id>', methods=['DELETE'])
+@route('/delete_spare_part/<int:part_id>', methods=['DELETE'])
 @login_required
 def delete_spare_part(part_id):
     try:
-        part = SparePart.query.get(part_id)
+        part = db.session.get(SparePart, part_id)
         if part:
+            if part.reserved:
+                return jsonify({'success': False, 'error': 'Запчасть зарезервирована под заказы'})
+            StockReservation.query.filter_by(spare_part_id=part.id).delete(synchronize_session=False)
             db.session.delete(part)
             db.session.commit()
             return jsonify({'success': True})
@@ -392,12 +753,145 @@ def delete_spare_part(part_id):
         return jsonify({'success': False, 'error': str(e)})
 
 
+def serialize_reservation(reservation):
+    return {
+        'id': reservation.id,
+        'order_id': reservation.order_id,
+        'spare_part_id': reservation.spare_part_id,
+        'quantity': reservation.quantity,
+        'status': reservation.status,
+        'created_at': reservation.created_at.strftime('%d.%m.%Y %H:%M'),
+        'closed_at': reservation.closed_at.strftime('%d.%m.%Y %H:%M') if reservation.closed_at else None
+    }
+
+
+def stock_payload():
+    return request.get_json(silent=True) or request.form
+
+
+def stock_operation(operation):
+    """Выполняет операцию со складом в транзакции и возвращает JSON-ответ"""
+    try:
+        result = operation()
+        db.session.commit()
+        return jsonify({'success': True, **result})
+    except (StockError, KeyError, ValueError) as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)})
+
 
-@app.route('/reports')
+@route('/api/orders/<int:order_id>/reservations', methods=['GET', 'POST'])
 @login_required
+def order_reservations(order_id):
+    if request.method == 'GET':
+        return jsonify({'success': True, 'reservations': [
+            dict(serialize_reservation(reservation), spare_part_name=reservation.spare_part.name)
+            for reservation in stock.order_reservations(order_id)]})
+
+    def operation():
+        if db.session.get(Order, order_id) is None:
+            raise StockError('Заказ не найден')
+        data = stock_payload()
+        reservation = stock.reserve(order_id, int(data['spare_part_id']), data['quantity'], current_user.id)
+        return {'reservation': serialize_reservation(reservation)}
+    return stock_operation(operation)
+
+
+@route('/api/reservations/<int:reservation_id>/<action>', methods=['POST'])
+@login_required
+def close_reservation(reservation_id, action):
+    if action not in ('release', 'consume'):
+        abort(404)
+    close = stock.release if action == 'release' else stock.consume
+    return stock_operation(lambda: {'reservation': serialize_reservation(close(reservation_id, current_user.id))})
+
+
+@route('/api/spare_parts/<int:part_id>/<action>', methods=['POST'])
+@login_required
+def spare_part_movement(part_id, action):
+    if action not in ('receive', 'write_off'):
+        abort(404)
+    operation = stock.receive if action == 'receive' else stock.write_off
+
+    def run():
+        data = stock_payload()
+        movement = operation(part_id, data['quantity'], current_user.id, data.get('comment'))
+        return {'balance': movement.balance}
+    return stock_operation(run)
+
+
+@route('/api/spare_parts/low_stock')
+@login_required
+@use_replica
+def low_stock():
+    limit = request.args.get('limit', type=int)
+    return jsonify({'success': True, 'spare_parts': [{
+        'id': part.id,
+        'name': part.name,
+        'article': part.article,
+        'quantity': part.quantity,
+        'reserved': part.reserved,
+        'min_stock': part.min_stock
+    } for part in stock.low_stock_parts(limit)]})
+
+
+@route('/api/spare_parts/<int:part_id>/movements')
+@login_required
+def spare_part_movements(part_id):
+    limit = min(request.args.get('limit', 100, type=int), 1000)
+    return jsonify({'success': True, 'movements': [{
+        'id': movement.id,
+        'kind': movement.kind,
+        'quantity': movement.quantity,
+        'balance': movement.balance,
+        'order_id': movement.order_id,
+        'reservation_id': movement.reservation_id,
+        'comment': movement.comment,
+        'created_at': movement.created_at.strftime('%d.%m.%Y %H:%M')
+    } for movement in stock.part_movements(part_id, limit)]})
+
+
+
+@route('/api/order_statuses')
+@login_required
+def order_statuses():
+    return jsonify({'success': True, 'statuses': [status._asdict() for status in lookups.statuses()]})
+
+
+@route('/api/order_statuses/<int:status_id>', methods=['POST'])
+@login_required
+def edit_order_status(status_id):
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'error': 'Недостаточно прав'}), 403
+    try:
+        status = db.session.get(OrderStatus, status_id)
+        if not status:
+            return jsonify({'success': False, 'error': 'Статус не найден'})
+        data = request.get_json(silent=True) or request.form
+        if data.get('badge_class') and data['badge_class'] not in BADGE_CLASSES:
+            return jsonify({'success': False, 'error': 'Неизвестный цвет статуса'}), 400
+        status.name = data.get('name') or status.name
+        status.description = data.get('description', status.description)
+        status.badge_class = data.get('badge_class') or status.badge_class
+        db.session.commit()
+        # Справочник и снимок панели пересчитаются сами по новой версии order_status,
+        # кэш публичных статусов сбрасывается вручную
+        status_cache.clear()
+        return jsonify({'success': True})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)})
+
+
+@route('/reports')
+@login_required
+@use_replica
 def reports():
-    # Получаем сотрудников для фильтров
-    employees = Employee.query.all()
+    # Сотрудники для фильтров из кэша справочников
+    employees = lookups.employees()
 
     # Устанавливаем даты по умолчанию (текущий месяц)
     today = datetime.now()
@@ -410,68 +904,189 @@ def reports():
                            default_date_to=last_day.strftime('%Y-%m-%d'))
 
 
-@app.route('/api/generate_report', methods=['POST'])
+@route('/api/generate_report', methods=['POST'])
 @login_required
+@use_replica
 def generate_report():
     try:
         data = request.get_json()
         report_type = data.get('type')
-        date_from = datetime.strptime(data.get('date_from'), '%Y-%m-%d')
-        date_to = datetime.strptime(data.get('date_to'), '%Y-%m-%d')
-
-        # Здесь будет логика генерации реальных отчетов из базы данных
-        # Пока возвращаем тестовые данные
-
-        if report_type == 'financial':
-            report_data = {
-                'total_revenue': 288900,
-                'total_profit': 86670,
-                'total_orders': 144,
-                'categories': [
-                    {'name': 'Продажи техники', 'count': 15, 'amount': 187500, 'percentage': 65},
-                    {'name': 'Ремонтные услуги', 'count': 42, 'amount': 84000, 'percentage': 29},
-                    {'name': 'Запчасти', 'count': 87, 'amount': 17400, 'percentage': 6}
-                ]
-            }
-        else:
-            report_data = {'message': 'Отчет в разработке'}
+        date_from = datetime.strptime(data.get('date_from'), '%Y-%m-%d').date()
+        date_to = datetime.strptime(data.get('date_to'), '%Y-%m-%d').date()
 
+        report_data = build_report(report_type, date_from, date_to, data)
         return jsonify({'success': True, 'data': report_data})
 
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
 
-@app.route('/buy_request', methods=['GET', 'POST'])
+@route('/api/jobs', methods=['POST'])
+@login_required
+def create_job():
+    # Тяжелые отчеты и выгрузки выполняются в фоне, клиент опрашивает статус задачи
+    data = request.get_json(silent=True) or {}
+    try:
+        job = submit_job(data.get('kind'), data.get('params') or {}, current_user.id)
+    except JobLimitError as e:
+        return jsonify({'success': False, 'error': str(e)}), 429
+    except JobError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    return jsonify({'success': True, 'job': serialize_job(job)}), 202
+
+
+def get_job_or_404(job_id):
+    """Задача текущего пользователя (администратору — любая); чужая выглядит как несуществующая"""
+    job = db.session.get(Job, job_id)
+    if job is None or (job.user_id != current_user.id and current_user.role != 'admin'):
+        abort(404)
+    # Задача пула, остановленного перезапуском, сразу показывается прерванной
+    fail_dead_jobs([job])
+    return job
+
+
+@route('/api/jobs/<job_id>')
+@login_required
+def job_status(job_id):
+    return jsonify({'success': True, 'job': serialize_job(get_job_or_404(job_id))})
+
+
+@route('/api/jobs/<job_id>/result')
+@login_required
+def job_result(job_id):
+    job = get_job_or_404(job_id)
+    if job.status != 'done':
+        return jsonify({'success': False, 'error': 'Задача еще не выполнена', 'job': serialize_job(job)}), 409
+    result = json.loads(job.result) if job.result else {}
+    if job.result_path:
+        if not os.path.exists(job.result_path):
+            return jsonify({'success': False, 'error': 'Файл выгрузки уже удален'}), 410
+        return send_file(job.result_path, as_attachment=True, download_name=result.get('filename'))
+    return jsonify({'success': True, 'data': result})
+
+
+@route('/api/jobs/<job_id>/cancel', methods=['POST'])
+@login_required
+def job_cancel(job_id):
+    job = get_job_or_404(job_id)
+    try:
+        cancel_job(job)
+    except JobError as e:
+        return jsonify({'success': False, 'error': str(e)}), 409
+    return jsonify({'success': True, 'job': serialize_job(job)})
+
+
+@route('/api/search')
+@login_required
+@query_budget(6)
+def api_search():
+    search = (request.args.get('q') or '').strip()
+    limit = max(1, min(request.args.get('limit', 20, type=int), 100))
+    if not search:
+        return jsonify({'success': True, 'clients': [], 'orders': []})
+
+    return jsonify({
+        'success': True,
+        'clients': [{
+            'id': client.id,
+            'name': client.name,
+            'phone': client.phone,
+            'address': client.address
+        } for client in search_clients(search, limit)],
+        'orders': [{
+            'id': order.id,
+            'client_name': client_name,
+            'client_phone': client_phone,
+            'model': order.washing_machine_model,
+            'description': order.description,
+            'status': status_name,
+            'created_date': order.created_at.strftime('%d.%m.%Y')
+        } for order, client_name, client_phone, status_name in search_orders(search, limit)]
+    })
+
+
+@route('/api/profit_ledger')
+@login_required
+@query_budget(3)
+def profit_ledger():
+    period = request.args.get('period', 'month')
+    if period not in ('day', 'month'):
+        return jsonify({'success': False, 'error': 'Неизвестный период'})
+
+    rows = ledger.breakdown(period, request.args.get('date_from'), request.args.get('date_to'))
+    return jsonify({
+        'success': True,
+        'period': period,
+        'rows': [{
+            'period': row.period_key,
+            'orders_count': row.orders_count,
+            'revenue': row.revenue,
+            'expenses': row.expenses,
+            'profit': row.profit
+        } for row in rows]
+    })
+
+
+@route('/export/<kind>')
+@login_required
+def export_data(kind):
+    if kind not in EXPORT_KINDS:
+        abort(404)
+
+    export_format = request.args.get('format', 'csv')
+    filters = export_filters(kind, request.args)
+    filename = '{}_{}.{}'.format(kind, datetime.now().strftime('%Y%m%d_%H%M'), export_format)
+
+    if export_format == 'xlsx':
+        # XLSX собирается во временном файле, строки в память целиком не загружаются
+        try:
+            output = tempfile.TemporaryFile()
+            write_xlsx(kind, output, **filters)
+        except RuntimeError as e:
+            return jsonify({'success': False, 'error': str(e)})
+        output.seek(0)
+        return send_file(output, as_attachment=True, download_name=filename,
+                         mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+
+    # CSV отдается потоком по мере чтения строк из базы
+    return Response(stream_with_context(iter_csv(kind, **filters)),
+                    mimetype='text/csv; charset=utf-8',
+                    headers={'Content-Disposition': 'attachment; filename={}'.format(filename)})
+
+
+@route('/import/<kind>', methods=['POST'])
+@login_required
+def import_data(kind):
+    if kind not in IMPORT_KINDS:
+        abort(404)
+
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        return jsonify({'success': False, 'error': 'Файл не выбран'})
+
+    file_format = request.form.get('format') or ('json' if upload.filename.lower().endswith(('.json', '.jsonl')) else 'csv')
+    result = run_import(kind, open_upload(upload), file_format)
+    return jsonify({'success': True, **result.to_dict()})
+
+
+@route('/buy_request', methods=['GET', 'POST'])
+@public_endpoint('buy_request', template='buy_request.html')
 def buy_request():
     if request.method == 'POST':
         # Обработка заявки на скупку
-        name = request.form['name']
-        phone = request.form['phone']
-        model = request.form['model']
-        condition = request.form['condition']
-        description = request.form['description']
-
-        # Сохранение заявки в базу
-        new_client = Client(
-            name=name,
-            phone=phone,
-            email='',
-            address=''
-        )
-        db.session.add(new_client)
-        db.session.flush()
-
-        new_order = Order(
-            client_id=new_client.id,
-            washing_machine_model=model,
-            condition=condition,
-            description=description,
-            status_id=1,  # Новая заявка
-            created_at=datetime.now()
-        )
-        db.session.add(new_order)
-        db.session.commit()
+        item = buy_request_item(request.form)
+        if not item['phone_normalized']:
+            flash('Укажите номер телефона')
+            return render_template('buy_request.html'), 400
+
+        limited = check_phone_limit('buy_request', item['phone_normalized'], template='buy_request.html')
+        if limited:
+            return limited
+
+        # Заявка сохраняется в базе до ответа, заказ по ней создает фоновый поток пачкой вместе с другими
+        if not submit_buy_request(current_app, item):
+            flash('Сервис перегружен, попробуйте отправить заявку через минуту')
+            return render_template('buy_request.html'), 503
 
         flash('Заявка успешно отправлена! Мы свяжемся с вами в ближайшее время.')
         return redirect(url_for('index'))
@@ -479,49 +1094,91 @@ def buy_request():
     return render_template('buy_request.html')
 
 
-@app.route('/repair_status')
+@route('/repair_status')
 def repair_status():
     return render_template('repair_status.html')
 
 
-@app.route('/api/check_status', methods=['POST'])
+@route('/api/check_status', methods=['POST'])
+@public_endpoint('check_status')
+@query_budget(1)
 def check_status():
-    order_id = request.form.get('order_id')
-    phone = request.form.get('phone')
+    order_id = request.form.get('order_id', type=int)
+    phone = normalize_phone(request.form.get('phone'))
 
-    order = Order.query.filter_by(id=order_id).first()
-    if order and order.client.phone == phone:
-        return jsonify({
-            'status': order.status.name,
-            'model': order.washing_machine_model,
-            'description': order.description
-        })
+    limited = check_phone_limit('check_status', phone)
+    if limited:
+        return limited
+
+    # Ответ берется из кэша статусов: повторные и ошибочные запросы не доходят до базы
+    order_phone, status = lookup_order_status(order_id) if order_id and phone else (None, None)
+    if status and order_phone == phone:
+        return jsonify(status)
     else:
         return jsonify({'error': 'Заказ не найден'})
 
 
-if __name__ == '__main__':
-    with app.app_context():
-        db.create_all()
-
-        # Создание тестовых данных
-        if not User.query.first():
-            admin = User(
-                username='admin',
-                password_hash=generate_password_hash('admin123'),
-                role='admin'
-            )
-            db.session.add(admin)
-
-            # Статусы заказов
-            statuses = [
-                OrderStatus(name='Новая', description='Новая заявка'),
-                OrderStatus(name='В обработке', description='Заявка в обработке'),
-                OrderStatus(name='В ремонте', description='Стиральная машина в ремонте'),
-                OrderStatus(name='Выполнена', description='Заказ завершен'),
-                OrderStatus(name='Отменена', description='Заказ отменен')
-            ]
-            db.session.add_all(statuses)
-            db.session.commit()
+@click.command('init-db')
+@with_appcontext
+def init_db_command():
+    """Создать или обновить схему и начальные данные (однократно при установке и обновлении)."""
+    for step in upgrade_schema():
+        click.echo('Применена миграция {:04d} {}'.format(step.version, step.name))
+
+    # Администратор и статусы заказов для пустой базы
+    if not User.query.first():
+        db.session.add(User(username='admin', password_hash=generate_password_hash('admin123'), role='admin'))
+        db.session.commit()
+        click.echo('Создан пользователь admin')
+    ensure_statuses()
+
+    # Журнал прибыли и дневные итоги для базы, созданной до их появления
+    if not (ProfitLedger.query.first() and OrderRollup.query.first()) and Order.query.first():
+        ledger.rebuild()
+        click.echo('Журнал прибыли пересчитан')
+
+
+def create_app(config=None):
+    """Фабрика приложения: настройки, расширения, команды и представления.
+
+    Запуск ничего не пишет в базу: схема и начальные данные готовятся
+    командой flask init-db. Настройки берутся из config и переменных
+    окружения с префиксом KBS_ (KBS_SECRET_KEY, KBS_JOBS_MAX_WORKERS=4, ...).
+    """
+    app = Flask(__name__)
+    app.json = MoneyJSONProvider(app)
+    app.config['SECRET_KEY'] = 'your-secret-key-here'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config.from_prefixed_env('KBS')
+    app.config.update(config or {})
+    # За nginx адрес посетителя приходит в X-Forwarded-For; без этого лимиты считались бы по адресу прокси
+    if app.config.get('PROXY_COUNT'):
+        proxies = int(app.config['PROXY_COUNT'])
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=proxies, x_proto=proxies, x_host=proxies)
+
+    # Адрес базы и пулы задаются через DATABASE_URL, DATABASE_REPLICA_URL и DB_POOL_*
+    init_database(app, db)
+    login_manager.init_app(app)
+    init_query_counter(app)
+    init_metrics(app)
+    init_rate_limits(app)
+    init_intake(app)
+    init_jobs(app)
+    init_http_cache(app)
+    init_assets(app)
+    for command in (ledger.ledger_cli, export_cli, import_cli, search_cli, database_cli, seed_cli, bench_cli,
+                    jobs_cli, schema_cli, finance_cli, employees_cli, assets_cli,
+                    init_db_command):
+        app.cli.add_command(command)
+
+    for rule, view, options in ROUTES:
+        app.add_url_rule(rule, view_func=view, **options)
+    app.add_template_filter(strftime_filter, 'strftime')
+    app.context_processor(template_helpers)
+    app.context_processor(employee_template_helpers)
+    return app
 
-    app.run(debug=True)
\ No newline at end of file
+
+if __name__ == '__main__':
+    # Сервер разработки; в продакшене — gunicorn -c gunicorn.conf.py wsgi:app
+    create_app().run(debug=True)
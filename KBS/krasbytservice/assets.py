@@ -0,0 +1,360 @@
+"""Статика страниц: сборка, сжатие и долгое кэширование.
+
+Скрипты и стили страниц лежат в static/js и static/css. flask assets build
+склеивает их в пакеты (BUNDLES), сжимает, дописывает к имени хеш содержимого
+и кладет в static/dist вместе с копиями .gz и .br. Шаблоны получают адрес
+пакета через asset_url: имя меняется вместе с содержимым, поэтому браузер
+хранит файл год и не перепроверяет его. В режиме отладки и до первой сборки
+пакет склеивается из исходников при запросе.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+
+import click
+from flask import abort, current_app, request, send_file, url_for
+from flask.cli import AppGroup
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:  # без brotli собираются только копии .gz
+    brotli = None
+
+
+# Пакет -> исходники в static. script.js — общий код: он входит в пакет каждой страницы
+PAGES = ('clients', 'dashboard', 'employees', 'orders', 'repair_status', 'reports', 'warehouse')
+BUNDLES = {
+    'app.css': ('css/style.css',),
+    'app.js': ('js/script.js',),
+}
+BUNDLES.update(('{}.js'.format(page), ('js/script.js', 'js/{}.js'.format(page))) for page in PAGES)
+
+DIST_DIR = 'dist'
+MANIFEST = 'manifest.json'
+HASH_LENGTH = 12
+# Имя файла меняется вместе с содержимым, поэтому кэш на год без проверки
+CACHE_MAX_AGE = 365 * 24 * 3600
+# Сжатые копии в порядке предпочтения
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+# Сжатие исходников
+
+_CSS_STRING = r'"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\''
+_CSS_COMMENTS = re.compile(r'({})|/\*.*?\*/'.format(_CSS_STRING), re.S)
+_CSS_STRINGS = re.compile(r'({})'.format(_CSS_STRING))
+_CSS_PUNCTUATION = re.compile(r'\s*([{};,>])\s*')
+
+
+def _compact_css(part):
+    part = re.sub(r'\s+', ' ', part)
+    part = _CSS_PUNCTUATION.sub(r'\1', part)
+    return re.sub(r':\s+', ':', part)
+
+
+def minify_css(source):
+    """Убирает комментарии, переводы строк и пробелы у скобок и разделителей; строки не меняются"""
+    source = _CSS_COMMENTS.sub(lambda match: match.group(1) or '', source)
+    parts = _CSS_STRINGS.split(source)
+    parts[::2] = [_compact_css(part) for part in parts[::2]]
+    return ''.join(parts).replace(';}', '}').strip()
+
+
+# После этих символов / начинает регулярное выражение, а не деление
+_JS_REGEX_AFTER = set('(,=:[!&|?{};+-*%<>~^')
+_JS_REGEX_KEYWORDS = {'return', 'typeof', 'instanceof', 'in', 'of', 'new', 'delete', 'void', 'throw', 'case',
+                      'do', 'else', 'yield', 'await'}
+# Пробел рядом с этими символами не нужен
+_JS_TIGHT = set('{}()[];,:=<>*&|!?')
+# После этих символов перевод строки не может закончить инструкцию
+_JS_CONTINUES = set('{([,;:=&|?')
+_JS_WORD = re.compile(r'[\w$]+')
+
+
+def _quoted_end(source, start, quote):
+    # Индекс после закрывающей кавычки с учетом экранирования
+    index = start + 1
+    while index < len(source) and source[index] != quote:
+        index += 2 if source[index] == '\\' else 1
+    return index + 1
+
+
+def _template_end(source, start):
+    """Кусок шаблона `...` от start до закрывающей ` (True) или до ${ (False)"""
+    index = start
+    while index < len(source):
+        if source[index] == '\\':
+            index += 2
+        elif source[index] == '`':
+            return index + 1, True
+        elif source.startswith('${', index):
+            return index + 2, False
+        else:
+            index += 1
+    return index, True
+
+
+def _regex_end(source, start):
+    index = start + 1
+    in_class = False
+    while index < len(source) and (in_class or source[index] != '/'):
+        if source[index] == '\\':
+            index += 1
+        elif source[index] == '[':
+            in_class = True
+        elif source[index] == ']':
+            in_class = False
+        index += 1
+    index += 1
+    while index < len(source) and source[index].isalpha():
+        index += 1
+    return index
+
+
+def _regex_allowed(out):
+    # / после оператора или ключевого слова начинает регулярное выражение, но i++ / 2 — деление
+    if not out:
+        return True
+    previous = out[-1]
+    if previous in ('+', '-') and len(out) > 1 and out[-2] == previous:
+        return False
+    return previous[-1] in _JS_REGEX_AFTER or previous in _JS_REGEX_KEYWORDS
+
+
+def minify_js(source):
+    """Убирает комментарии, отступы и лишние переводы строк.
+
+    Строки, шаблоны `...` и регулярные выражения копируются как есть. Перевод
+    строки удаляется только там, где он не может закончить инструкцию, поэтому
+    автоматическая расстановка точек с запятой работает как в исходнике.
+    """
+    out = []
+    templates = []  # глубина фигурных скобок у каждого открытого ${
+    depth = 0
+    space = newline = False
+    index = 0
+
+    def emit(text):
+        nonlocal space, newline
+        if out:
+            last = out[-1][-1]
+            if newline and last not in _JS_CONTINUES and text[0] not in ')]}.,;':
+                out.append('\n')
+            elif (space or newline) and last not in _JS_TIGHT and text[0] not in _JS_TIGHT:
+                out.append(' ')
+        space = newline = False
+        out.append(text)
+
+    while index < len(source):
+        char = source[index]
+        if char == '\n':
+            newline = True
+            index += 1
+        elif char.isspace():
+            space = True
+            index += 1
+        elif source.startswith('//', index):
+            end = source.find('\n', index)
+            index = len(source) if end < 0 else end
+        elif source.startswith('/*', index):
+            end = source.find('*/', index + 2)
+            end = len(source) if end < 0 else end + 2
+            newline = newline or '\n' in source[index:end]
+            space = True
+            index = end
+        elif char in '\'"':
+            end = _quoted_end(source, index, char)
+            emit(source[index:end])
+            index = end
+        elif char == '`' or (char == '}' and templates and templates[-1] == depth):
+            # Начало шаблона или конец вставки ${...}: дальше снова текст шаблона
+            if char == '}':
+                templates.pop()
+            end, closed = _template_end(source, index + 1)
+            if not closed:
+                templates.append(depth)
+            emit(source[index:end])
+            index = end
+        elif char == '/':
+            if _regex_allowed(out):
+                end = _regex_end(source, index)
+                emit(source[index:end])
+                index = end
+            else:
+                emit(char)
+                index += 1
+        else:
+            word = _JS_WORD.match(source, index)
+            if word:
+                emit(word.group())
+                index = word.end()
+                continue
+            if char == '{':
+                depth += 1
+            elif char == '}':
+                depth -= 1
+            emit(char)
+            index += 1
+    return ''.join(out).strip() + '\n'
+
+
+MINIFIERS = {'.css': minify_css, '.js': minify_js}
+
+
+# Сборка
+
+def dist_dir(app):
+    return os.path.join(app.static_folder, DIST_DIR)
+
+
+def manifest_path(app):
+    return os.path.join(dist_dir(app), MANIFEST)
+
+
+def bundle_source(app, name):
+    """Исходники пакета одной строкой; скрипты разделяются ;, чтобы файлы не слились в одно выражение"""
+    separator = '\n;\n' if name.endswith('.js') else '\n'
+    parts = []
+    for source in BUNDLES[name]:
+        with open(os.path.join(app.static_folder, source), encoding='utf-8') as file:
+            parts.append(file.read())
+    return separator.join(part for part in parts if part.strip())
+
+
+def _write(path, data):
+    # Через временный файл: работающий сервер не отдаст файл наполовину записанным
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as file:
+        file.write(data)
+    os.replace(temporary, path)
+
+
+def _compressed(data):
+    """{суффикс: сжатые данные}; копия сохраняется, только если она меньше исходника"""
+    variants = {'.gz': gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants['.br'] = brotli.compress(data, quality=11)
+    return {suffix: compressed for suffix, compressed in variants.items() if len(compressed) < len(data)}
+
+
+def build(app, clean=False):
+    """Собирает пакеты в static/dist.
+
+    Возвращает [(пакет, файл, байт исходников, байт после сжатия, {суффикс: байт})].
+    Файлы прежних сборок остаются (их могут запросить уже открытые страницы),
+    clean удаляет их.
+    """
+    directory = dist_dir(app)
+    os.makedirs(directory, exist_ok=True)
+    manifest = {}
+    report = []
+    for name in sorted(BUNDLES):
+        source = bundle_source(app, name)
+        stem, extension = os.path.splitext(name)
+        data = MINIFIERS[extension](source).encode('utf-8')
+        filename = '{}.{}{}'.format(stem, hashlib.sha256(data).hexdigest()[:HASH_LENGTH], extension)
+        path = os.path.join(directory, filename)
+        _write(path, data)
+        variants = _compressed(data)
+        for suffix, compressed in variants.items():
+            _write(path + suffix, compressed)
+        manifest[name] = filename
+        report.append((name, filename, len(source.encode('utf-8')), len(data),
+                       {suffix: len(compressed) for suffix, compressed in variants.items()}))
+    # Манифест пишется последним: до этого шаблоны ссылаются на прежнюю сборку
+    _write(manifest_path(app), json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+
+    if clean:
+        keep = {MANIFEST} | {filename + suffix for filename in manifest.values() for suffix in ('', '.gz', '.br')}
+        for filename in os.listdir(directory):
+            if filename not in keep:
+                os.remove(os.path.join(directory, filename))
+    return report
+
+
+def read_manifest(app):
+    """{пакет: файл сборки}; пустой словарь, если сборки нет"""
+    try:
+        with open(manifest_path(app), encoding='utf-8') as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+
+
+# Выдача
+
+def _use_sources():
+    return current_app.config.get('ASSETS_DEBUG', current_app.debug)
+
+
+def asset_url(name):
+    """Адрес пакета для шаблона: собранный файл с хешем в имени, без сборки — склейка исходников"""
+    if name not in BUNDLES:
+        raise KeyError('Неизвестный пакет статики: {}'.format(name))
+    filename = None if _use_sources() else current_app.extensions['assets'].get(name)
+    if filename:
+        return url_for('asset_file', filename=filename)
+    return url_for('asset_source', name=name)
+
+
+def _mimetype(name):
+    return mimetypes.guess_type(name)[0] or 'application/octet-stream'
+
+
+def asset_file(filename):
+    """Собранный пакет: сжатая копия по Accept-Encoding, кэш на год без перепроверки"""
+    path = safe_join(dist_dir(current_app), filename)
+    if path is None or filename == MANIFEST or not os.path.isfile(path):
+        abort(404)
+    encoding = None
+    for name, suffix in ENCODINGS:
+        if request.accept_encodings[name] and os.path.isfile(path + suffix):
+            path, encoding = path + suffix, name
+            break
+    response = send_file(path, mimetype=_mimetype(filename), max_age=CACHE_MAX_AGE)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.cache_control.immutable = True
+    return response
+
+
+def asset_source(name):
+    """Пакет, склеенный из исходников при запросе: режим отладки или сервер без сборки"""
+    if name not in BUNDLES:
+        abort(404)
+    response = current_app.response_class(bundle_source(current_app, name), mimetype=_mimetype(name))
+    # Исходники меняются без смены адреса: браузер перепроверяет файл по ETag
+    response.cache_control.no_cache = True
+    response.add_etag()
+    return response.make_conditional(request)
+
+
+def init_assets(app):
+    """Пакеты статики: asset_url в шаблонах и выдача /assets; ASSETS_DEBUG — всегда из исходников"""
+    # Манифест читается при запуске: новая сборка подхватывается перезапуском, как новый код
+    app.extensions['assets'] = read_manifest(app)
+    app.add_url_rule('/assets/<filename>', 'asset_file', asset_file)
+    app.add_url_rule('/assets/src/<name>', 'asset_source', asset_source)
+    app.add_template_global(asset_url)
+
+
+assets_cli = AppGroup('assets', help='Сборка статики: пакеты с хешем в имени и сжатые копии.')
+
+
+@assets_cli.command('build')
+@click.option('--clean', is_flag=True, help='Удалить файлы прежних сборок.')
+def build_command(clean):
+    """Собрать и сжать скрипты и стили страниц в static/dist."""
+    for name, filename, source_size, size, variants in build(current_app, clean):
+        click.echo('{:<18} {:<32} {:>7} -> {:>7} байт  {}'.format(
+            name, filename, source_size, size,
+            '  '.join('{} {}'.format(suffix, variant_size) for suffix, variant_size in sorted(variants.items()))))
+    if brotli is None:
+        click.echo('Пакет brotli не установлен: собраны только копии .gz')
+    click.echo('Манифест: {}. Перезапустите сервер, чтобы страницы ссылались на новую сборку'.format(
+        manifest_path(current_app)))
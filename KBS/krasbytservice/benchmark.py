@@ -0,0 +1,317 @@
+import http.cookiejar
+import json
+import os
+import random
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import event, func
+
+from models import db, Client, Order
+
+try:
+    import resource
+except ImportError:  # Windows: память берется только из /proc, если он есть
+    resource = None
+
+
+DEFAULT_SCENARIOS = ('orders', 'orders_search', 'clients', 'dashboard', 'warehouse', 'order_details',
+                     'client_details', 'check_status', 'buy_request', 'export_orders')
+# Сценарии, которые пишут в базу, запускаются только с --writes
+WRITE_SCENARIOS = ('buy_request',)
+
+SAMPLE_SIZE = 1000
+# Рост p99 меньше этого порога считается шумом и не проверяется
+NOISE_FLOOR_MS = 2.0
+# Среднее число SQL-запросов плавает из-за истечения кэшей
+QUERY_TOLERANCE = 0.5
+
+
+class Scenario:
+    def __init__(self, name, method, make_request, login=True, stream=False):
+        self.name = name
+        self.method = method
+        self.make_request = make_request
+        self.login = login
+        self.stream = stream
+
+
+def _check_status_request(sample, rng):
+    order_id, phone = rng.choice(sample['status_pairs'])
+    return '/api/check_status', {'order_id': order_id, 'phone': phone}
+
+
+def _buy_request(sample, rng):
+    number = rng.randrange(10 ** 7)
+    return '/buy_request', {'name': 'Нагрузочный тест', 'phone': '+7 999 {:07d}'.format(number),
+                            'model': 'LG F2J3NS0W', 'condition': 'Не отжимает', 'description': 'bench'}
+
+
+SCENARIOS = {scenario.name: scenario for scenario in [
+    Scenario('orders', 'GET', lambda sample, rng: ('/orders', None)),
+    Scenario('orders_search', 'GET', lambda sample, rng: ('/orders?q=' + rng.choice(sample['models']), None)),
+    Scenario('clients', 'GET', lambda sample, rng: ('/clients', None)),
+    Scenario('dashboard', 'GET', lambda sample, rng: ('/dashboard', None)),
+    Scenario('warehouse', 'GET', lambda sample, rng: ('/warehouse', None)),
+    Scenario('order_details', 'GET',
+             lambda sample, rng: ('/api/order_details/{}'.format(rng.choice(sample['order_ids'])), None)),
+    Scenario('client_details', 'GET',
+             lambda sample, rng: ('/api/client_details/{}'.format(rng.choice(sample['client_ids'])), None)),
+    Scenario('check_status', 'POST', _check_status_request, login=False),
+    Scenario('buy_request', 'POST', _buy_request, login=False),
+    Scenario('export_orders', 'GET', lambda sample, rng: ('/export/orders', None), stream=True)
+]}
+
+
+def rss_kb():
+    """Текущий размер процесса в памяти, КБ"""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') // 1024
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource else 0
+
+
+def percentile(values, share):
+    if not values:
+        return 0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(share * (len(ordered) - 1))))]
+
+
+def collect_sample():
+    """Случайные id заказов и клиентов и пары (заказ, телефон) для запросов"""
+    order_ids = [order_id for (order_id,) in
+                 db.session.query(Order.id).order_by(func.random()).limit(SAMPLE_SIZE)]
+    client_ids = [client_id for (client_id,) in
+                  db.session.query(Client.id).order_by(func.random()).limit(SAMPLE_SIZE)]
+    status_pairs = (db.session.query(Order.id, Client.phone)
+                    .join(Client, Order.client_id == Client.id)
+                    .filter(Order.id.in_(order_ids)).all()) if order_ids else []
+    models = sorted({model.split()[0] for (model,) in
+                     db.session.query(Order.washing_machine_model).filter(Order.id.in_(order_ids))}) or ['LG']
+    db.session.remove()
+    if not order_ids or not client_ids:
+        raise click.ClickException('В базе нет заказов или клиентов: сначала выполните flask seed generate')
+    return {'order_ids': order_ids, 'client_ids': client_ids, 'status_pairs': status_pairs, 'models': models}
+
+
+class QueryCounter:
+    """Считает SQL-запросы в текущем потоке: тестовый клиент выполняет запрос в том же потоке"""
+
+    def __init__(self, engines):
+        self.engines = engines
+        self.local = threading.local()
+
+    def _count(self, *args):
+        self.local.count = getattr(self.local, 'count', 0) + 1
+
+    def take(self):
+        count = getattr(self.local, 'count', 0)
+        self.local.count = 0
+        return count
+
+    def __enter__(self):
+        for engine in self.engines:
+            event.listen(engine, 'before_cursor_execute', self._count)
+        return self
+
+    def __exit__(self, *exc):
+        for engine in self.engines:
+            event.remove(engine, 'before_cursor_execute', self._count)
+
+
+class HttpResponse:
+    """Ответ запущенного сервера с тем же интерфейсом, что у ответа тестового клиента"""
+
+    def __init__(self, response):
+        self.response = response
+        self.status_code = response.status
+        self.is_json = response.headers.get_content_type() == 'application/json'
+        self._body = None
+
+    def iter_encoded(self):
+        while True:
+            chunk = self.response.read(64 * 1024)
+            if not chunk:
+                return
+            yield chunk
+
+    def get_json(self):
+        return json.loads(self._body)
+
+    def close(self):
+        # Тело дочитывается до закрытия: время ответа включает передачу страницы
+        self._body = self.response.read()
+        self.response.close()
+
+
+class HttpClient:
+    """Клиент для замера запущенного сервера (--url): запросы проходят через сеть и воркеры.
+
+    Адрес посетителя передается в X-Forwarded-For; сервер учитывает его при PROXY_COUNT.
+    """
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+
+    def open(self, path, method='GET', data=None, environ_base=None):
+        body = urllib.parse.urlencode(data).encode() if data else None
+        request = urllib.request.Request(self.base_url + path, data=body, method=method)
+        if environ_base:
+            request.add_header('X-Forwarded-For', environ_base['REMOTE_ADDR'])
+        try:
+            return HttpResponse(self.opener.open(request, timeout=120))
+        except urllib.error.HTTPError as error:
+            return HttpResponse(error)
+
+    def post(self, path, data=None):
+        return self.open(path, method='POST', data=data)
+
+
+def _worker(app, scenario, sample, requests_count, credentials, counter, seed, url=None):
+    rng = random.Random(seed)
+    client = HttpClient(url) if url else app.test_client()
+    if scenario.login:
+        client.post('/login', data={'username': credentials[0], 'password': credentials[1]}).close()
+    counter.take()
+
+    timings, queries, errors = [], [], 0
+    for _ in range(requests_count):
+        path, data = scenario.make_request(sample, rng)
+        started = time.perf_counter()
+        # Публичные формы ограничены по IP: нагрузка имитирует много разных посетителей
+        remote_addr = '10.{}.{}.{}'.format(rng.randrange(256), rng.randrange(256), rng.randrange(1, 255))
+        response = client.open(path, method=scenario.method, data=data, environ_base={'REMOTE_ADDR': remote_addr})
+        if scenario.stream:
+            for _ in response.iter_encoded():
+                pass
+        response.close()
+        timings.append((time.perf_counter() - started) * 1000)
+        queries.append(None if url else counter.take())
+        if response.status_code >= 400 or (response.is_json and response.get_json().get('success') is False):
+            errors += 1
+    return timings, queries, errors
+
+
+def run_scenario(app, scenario, sample, requests_count, concurrency, credentials, counter, url=None):
+    per_worker = max(requests_count // concurrency, 1)
+    rss_before = rss_kb()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(
+            lambda seed: _worker(app, scenario, sample, per_worker, credentials, counter, seed, url),
+            range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    timings = [value for result in results for value in result[0]]
+    queries = [value for result in results for value in result[1]]
+    return {
+        'requests': len(timings),
+        'errors': sum(result[2] for result in results),
+        'p50_ms': round(percentile(timings, 0.5), 2),
+        'p95_ms': round(percentile(timings, 0.95), 2),
+        'p99_ms': round(percentile(timings, 0.99), 2),
+        'mean_ms': round(sum(timings) / len(timings), 2),
+        'rps': round(len(timings) / elapsed, 1),
+        # SQL-запросы и память сервера видны только при замере в этом же процессе
+        'queries_per_request': None if url else round(sum(queries) / len(queries), 2),
+        'rss_growth_kb': None if url else max(rss_kb() - rss_before, 0)
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Регрессии относительно сохраненной базовой линии: [(сценарий, описание)]"""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        p99_limit = base['p99_ms'] * (1 + tolerance)
+        if result['p99_ms'] > p99_limit and result['p99_ms'] - base['p99_ms'] > NOISE_FLOOR_MS:
+            regressions.append((name, 'p99 {} мс, было {} мс'.format(result['p99_ms'], base['p99_ms'])))
+        if (result['queries_per_request'] is not None and base['queries_per_request'] is not None
+                and result['queries_per_request'] > base['queries_per_request'] + QUERY_TOLERANCE):
+            regressions.append((name, 'SQL-запросов {} на запрос, было {}'.format(
+                result['queries_per_request'], base['queries_per_request'])))
+        if result['errors'] > base['errors']:
+            regressions.append((name, 'ошибок {}, было {}'.format(result['errors'], base['errors'])))
+    return regressions
+
+
+def _or_dash(value):
+    return '-' if value is None else value
+
+
+bench_cli = AppGroup('bench', help='Нагрузочные замеры основных страниц и API.')
+
+
+@bench_cli.command('run')
+@click.option('--scenario', '-s', 'scenarios', multiple=True, type=click.Choice(DEFAULT_SCENARIOS),
+              help='Сценарии для замера, по умолчанию все, кроме пишущих.')
+@click.option('--requests', 'requests_count', type=int, default=200, show_default=True,
+              help='Запросов на сценарий.')
+@click.option('--concurrency', '-c', type=int, default=4, show_default=True, help='Параллельных клиентов.')
+@click.option('--writes', is_flag=True, help='Включить сценарии, которые создают заказы (buy_request).')
+@click.option('--username', default='admin', show_default=True)
+@click.option('--password', default='admin123', show_default=True)
+@click.option('--baseline', type=click.Path(dir_okay=False), help='Файл базовой линии, по умолчанию в instance.')
+@click.option('--save', is_flag=True, help='Сохранить результаты как новую базовую линию.')
+@click.option('--tolerance', type=float, default=0.25, show_default=True, help='Допустимый рост p99.')
+@click.option('--output', '-o', type=click.Path(dir_okay=False), help='Сохранить результаты в JSON.')
+@click.option('--url', help='Адрес запущенного сервера (например, gunicorn с несколькими воркерами); '
+                            'по умолчанию запросы выполняются в этом процессе тестовым клиентом.')
+def run_command(scenarios, requests_count, concurrency, writes, username, password, baseline, save, tolerance,
+                output, url):
+    """Замерить p50/p99, SQL-запросы и память под параллельной нагрузкой."""
+    app = current_app._get_current_object()
+    os.makedirs(app.instance_path, exist_ok=True)
+    baseline = baseline or os.path.join(app.instance_path, 'benchmark_baseline.json')
+    names = scenarios or [name for name in DEFAULT_SCENARIOS if writes or name not in WRITE_SCENARIOS]
+    sample = collect_sample()
+
+    results = {}
+    with QueryCounter(list(db.engines.values())) as counter:
+        for name in names:
+            results[name] = run_scenario(app, SCENARIOS[name], sample, requests_count, concurrency,
+                                         (username, password), counter, url)
+            result = results[name]
+            click.echo('{:<16} p50 {:>8} мс  p99 {:>8} мс  {:>7} rps  SQL {:>6}  ошибок {:>4}  RSS +{} КБ'.format(
+                name, result['p50_ms'], result['p99_ms'], result['rps'], _or_dash(result['queries_per_request']),
+                result['errors'], _or_dash(result['rss_growth_kb'])))
+
+    report = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'orders': Order.query.count(),
+        'concurrency': concurrency,
+        'url': url,
+        'results': results
+    }
+    if output:
+        with open(output, 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+    if save:
+        with open(baseline, 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+        click.echo('Базовая линия сохранена: {}'.format(baseline))
+        return
+
+    if not os.path.exists(baseline):
+        click.echo('Базовой линии нет, сохраните ее флагом --save')
+        return
+    with open(baseline, encoding='utf-8') as file:
+        regressions = compare(results, json.load(file)['results'], tolerance)
+    for name, message in regressions:
+        click.echo('Регрессия {}: {}'.format(name, message))
+    if regressions:
+        raise click.ClickException('Найдено регрессий: {}'.format(len(regressions)))
+    click.echo('Регрессий относительно базовой линии нет')
@@ -0,0 +1,53 @@
+from datetime import datetime
+
+from sqlalchemy import func, select
+
+from models import db, Client, Order, SparePart
+from cache import TTLCache
+from httpcache import table_versions
+from queries import recent_orders, serialize_order_row
+from stock import low_stock_condition
+from lifecycle import COMPLETED_STATUS_ID
+
+
+# Сколько секунд снимок панели хранится, если данные не менялись
+DASHBOARD_TTL = 60
+RECENT_ORDERS_LIMIT = 5
+# Таблицы, из которых строится снимок: счетчики, последние заказы и их статусы
+DASHBOARD_TABLES = ('order', 'client', 'spare_part', 'order_status')
+
+snapshot_cache = TTLCache(maxsize=4, ttl=DASHBOARD_TTL)
+
+
+def compute_counters():
+    """Все счетчики панели за один запрос к базе"""
+    row = db.session.execute(select(
+        select(func.count(Order.id)).scalar_subquery(),
+        select(func.count(Order.id)).where(Order.status_id != COMPLETED_STATUS_ID).scalar_subquery(),
+        select(func.count(Client.id)).scalar_subquery(),
+        select(func.count(SparePart.id)).where(low_stock_condition()).scalar_subquery()
+    )).one()
+    total_orders, active_orders, total_clients, low_stock_parts = row
+    return {
+        'total_orders': total_orders,
+        'active_orders': active_orders,
+        'total_clients': total_clients,
+        'low_stock_parts': low_stock_parts
+    }
+
+
+def compute_snapshot():
+    return {
+        'counters': compute_counters(),
+        'recent_orders': [serialize_order_row(order) for order in recent_orders(RECENT_ORDERS_LIMIT)],
+        'generated_at': datetime.now().isoformat(timespec='seconds')
+    }
+
+
+def dashboard_snapshot():
+    """Снимок панели управления из кэша процесса.
+
+    Ключ — версии таблиц (data_version), как у фрагментов httpcache: изменение
+    заказов, клиентов или склада в любом воркере дает новый ключ и новый снимок
+    """
+    return snapshot_cache.get_or_set(table_versions(DASHBOARD_TABLES), compute_snapshot)
@@ -0,0 +1,142 @@
+import os
+from functools import partial, wraps
+
+import click
+from flask import current_app, g, has_app_context
+from flask.cli import AppGroup
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, text
+from sqlalchemy.engine import make_url
+
+
+DEFAULT_DATABASE_URI = 'sqlite:///krasbytservice.db'
+REPLICA_BIND = 'replica'
+
+# Значения по умолчанию; каждое можно переопределить в app.config или переменной окружения (app.config важнее)
+DATABASE_DEFAULTS = {
+    'DB_POOL_SIZE': 10,
+    'DB_MAX_OVERFLOW': 20,
+    'DB_POOL_TIMEOUT': 30,
+    'DB_POOL_RECYCLE': 1800,
+    'SQLITE_BUSY_TIMEOUT': 15000,
+    'SQLITE_JOURNAL_MODE': 'WAL',
+    'SQLITE_SYNCHRONOUS': 'NORMAL',
+    'SQLITE_CACHE_SIZE': -20000
+}
+
+
+class RoutingSession(Session):
+    """Сессия, которая отправляет чтение отмеченных представлений на реплику.
+
+    Запись (flush, UPDATE, DELETE, INSERT) всегда идет в основную базу.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and not self._flushing and getattr(clause, 'is_select', False)
+                and has_app_context() and g.get('use_replica')):
+            replica = self._db.engines.get(REPLICA_BIND)
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def use_replica(view):
+    """Читать данные представления с реплики, если она настроена (DATABASE_REPLICA_URL)"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.use_replica = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def _setting(app, name, cast=int):
+    # Настройка, явно переданная в create_app(config), важнее окружения: окружение — запасной источник
+    value = app.config.get(name)
+    if value is None:
+        value = os.environ.get(name, DATABASE_DEFAULTS.get(name))
+    return cast(value) if value is not None else None
+
+
+def database_url(value):
+    # Heroku и docker-образы часто отдают устаревшую схему postgres://
+    if value and value.startswith('postgres://'):
+        value = 'postgresql://' + value[len('postgres://'):]
+    return value
+
+
+def engine_options(app, url):
+    """Параметры пула и подключения для адреса базы"""
+    url = make_url(url)
+    if url.get_backend_name() == 'sqlite':
+        options = {'connect_args': {'timeout': _setting(app, 'SQLITE_BUSY_TIMEOUT') / 1000}}
+        if url.database in (None, '', ':memory:'):
+            return options
+    else:
+        options = {'connect_args': {}, 'pool_pre_ping': True}
+    options.update({
+        'pool_size': _setting(app, 'DB_POOL_SIZE'),
+        'max_overflow': _setting(app, 'DB_MAX_OVERFLOW'),
+        'pool_timeout': _setting(app, 'DB_POOL_TIMEOUT'),
+        'pool_recycle': _setting(app, 'DB_POOL_RECYCLE')
+    })
+    return options
+
+
+def configure_database(app):
+    """Адрес основной базы, реплики и параметры пулов из app.config, а если их там нет — из окружения"""
+    uri = database_url(app.config.get('SQLALCHEMY_DATABASE_URI') or app.config.get('DATABASE_URL')
+                       or os.environ.get('DATABASE_URL') or DEFAULT_DATABASE_URI)
+    app.config['SQLALCHEMY_DATABASE_URI'] = uri
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app, uri))
+
+    replica = database_url(app.config.get('DATABASE_REPLICA_URL') or os.environ.get('DATABASE_REPLICA_URL'))
+    if replica:
+        binds = app.config.setdefault('SQLALCHEMY_BINDS', {})
+        binds[REPLICA_BIND] = dict(engine_options(app, replica), url=replica)
+
+
+def _sqlite_pragmas(pragmas, dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in pragmas:
+        cursor.execute('PRAGMA {} = {}'.format(name, value))
+    cursor.close()
+
+
+def init_database(app, db):
+    """Настраивает подключение и регистрирует расширение SQLAlchemy.
+
+    Для SQLite каждое новое соединение получает журнал WAL (читатели не блокируют
+    запись), ожидание блокировки вместо мгновенной ошибки "database is locked"
+    и увеличенный кэш страниц.
+    """
+    configure_database(app)
+    db.init_app(app)
+
+    pragmas = [
+        ('journal_mode', _setting(app, 'SQLITE_JOURNAL_MODE', str)),
+        ('synchronous', _setting(app, 'SQLITE_SYNCHRONOUS', str)),
+        ('busy_timeout', _setting(app, 'SQLITE_BUSY_TIMEOUT')),
+        ('cache_size', _setting(app, 'SQLITE_CACHE_SIZE')),
+        ('temp_store', 'MEMORY')
+    ]
+    with app.app_context():
+        for engine in db.engines.values():
+            if engine.dialect.name == 'sqlite':
+                event.listen(engine, 'connect', partial(_sqlite_pragmas, pragmas))
+
+
+database_cli = AppGroup('database', help='Подключение к базе данных.')
+
+
+@database_cli.command('info')
+def info_command():
+    """Показать настройки подключений и пулов."""
+    db = current_app.extensions['sqlalchemy']
+    for key, engine in db.engines.items():
+        click.echo('{}: {}'.format(key or 'primary', engine.url.render_as_string(hide_password=True)))
+        click.echo('  пул: {}'.format(engine.pool.status()))
+        if engine.dialect.name == 'sqlite':
+            with engine.connect() as connection:
+                for pragma in ('journal_mode', 'synchronous', 'busy_timeout'):
+                    value = connection.execute(text('PRAGMA {}'.format(pragma))).scalar()
+                    click.echo('  {}: {}'.format(pragma, value))
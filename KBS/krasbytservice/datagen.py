@@ -0,0 +1,234 @@
+import random
+from datetime import datetime, timedelta
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import func, insert
+
+from models import db, normalize_phone, Client, Employee, Order, OrderStatus, SparePart
+import ledger
+import lifecycle
+import employees as workload
+from lifecycle import NEW_STATUS_ID, COMPLETED_STATUS_ID, CANCELLED_STATUS_ID
+
+
+# Готовые объемы данных: число заказов
+SCALES = {
+    '10k': 10000,
+    '100k': 100000,
+    '1m': 1000000
+}
+
+CHUNK_SIZE = 10000
+
+DEFAULT_STATUSES = [
+    ('Новая', 'Новая заявка', 'primary'),
+    ('В обработке', 'Заявка в обработке', 'info'),
+    ('В ремонте', 'Стиральная машина в ремонте', 'warning'),
+    ('Выполнена', 'Заказ завершен', 'success'),
+    ('Отменена', 'Заказ отменен', 'danger')
+]
+
+# Распределение статусов: старые заказы почти все закрыты, свежие еще в работе
+RECENT_DAYS = 30
+RECENT_STATUS_WEIGHTS = {1: 30, 2: 25, 3: 30, 4: 12, 5: 3}
+OLD_STATUS_WEIGHTS = {1: 1, 2: 1, 3: 3, 4: 85, 5: 10}
+
+# Доля выкупленной техники среди заказов, остальное — ремонт
+RESALE_SHARE = 0.35
+
+FIRST_NAMES = ['Александр', 'Сергей', 'Дмитрий', 'Андрей', 'Алексей', 'Иван', 'Михаил', 'Николай',
+               'Елена', 'Ольга', 'Татьяна', 'Наталья', 'Ирина', 'Светлана', 'Анна', 'Мария']
+LAST_NAMES = ['Иванов', 'Смирнов', 'Кузнецов', 'Попов', 'Васильев', 'Петров', 'Соколов', 'Михайлов',
+              'Новиков', 'Федоров', 'Морозов', 'Волков', 'Алексеев', 'Лебедев', 'Семенов', 'Егоров']
+STREETS = ['ул. Ленина', 'пр. Мира', 'ул. Карла Маркса', 'ул. Взлетная', 'ул. Партизана Железняка',
+           'пр. Свободный', 'ул. Алексеева', 'ул. 9 Мая', 'ул. Молокова', 'пр. Красноярский рабочий']
+BRANDS = {
+    'LG': ['F2J3NS0W', 'F1296ND3', 'F4V5VS0W', 'F2M5HS4W'],
+    'Samsung': ['WW60J30G03W', 'WW80R42LHFW', 'WF60F1R2E2S', 'WW65K42E08W'],
+    'Bosch': ['WAN24140OE', 'WLG24260OE', 'WAT28461OE', 'WLP20260OE'],
+    'Indesit': ['IWSB 5085', 'IWUB 4105', 'BWSA 61051', 'EWSB 5085'],
+    'Atlant': ['60Y810', '50Y82', '70C1010', '60C102'],
+    'Electrolux': ['EW6S4R06W', 'EW7F3R48S', 'EWT1064ILW'],
+    'Haier': ['HW60-10636A', 'HW70-BP12959B']
+}
+CONDITIONS = ['Рабочая', 'Требует ремонта', 'Не включается', 'Не сливает воду', 'Не отжимает',
+              'Шумит при отжиме', 'Течет', 'Б/у, хорошее состояние']
+DESCRIPTIONS = ['Замена подшипников', 'Замена ТЭНа', 'Замена насоса', 'Ремонт модуля управления',
+                'Замена щеток двигателя', 'Замена манжеты люка', 'Чистка и диагностика', 'Замена ремня',
+                'Выкуп на запчасти', 'Выкуп с последующей продажей']
+PARTS = ['Подшипник', 'ТЭН', 'Насос сливной', 'Ремень', 'Щетки двигателя', 'Манжета люка',
+         'Модуль управления', 'Амортизатор', 'Клапан заливной', 'Ручка люка', 'Датчик уровня воды']
+POSITIONS = [('Мастер', 45000, 80000), ('Менеджер', 35000, 55000), ('Приемщик', 30000, 40000)]
+
+
+def _weighted(rng, weights):
+    return rng.choices(list(weights), weights=list(weights.values()))[0]
+
+
+def _price(rng, low, high):
+    # Логнормальное распределение с хвостом дорогих заказов, округление до 10 рублей
+    value = rng.lognormvariate(0, 0.5) * (low + high) / 2
+    return int(round(min(max(value, low), high * 3), -1))
+
+
+def _phone(number):
+    return '+7 9{:02d} {:03d}-{:02d}-{:02d}'.format(number // 10000000 % 100, number // 10000 % 1000,
+                                                     number // 100 % 100, number % 100)
+
+
+def ensure_statuses():
+    """Создает стандартные статусы заказов, если их нет; возвращает их id"""
+    if not OrderStatus.query.first():
+        db.session.add_all(OrderStatus(name=name, description=description, badge_class=badge_class)
+                           for name, description, badge_class in DEFAULT_STATUSES)
+        db.session.commit()
+    return [status_id for (status_id,) in db.session.query(OrderStatus.id).order_by(OrderStatus.id)]
+
+
+def client_rows(rng, count, start, now, days):
+    phone_numbers = rng.sample(range(10 ** 9), count)
+    for number in range(count):
+        phone = _phone(phone_numbers[number])
+        yield {
+            'name': '{} {}'.format(rng.choice(LAST_NAMES), rng.choice(FIRST_NAMES)),
+            'phone': phone,
+            'phone_normalized': normalize_phone(phone),
+            'email': 'client{}@example.com'.format(start + number) if rng.random() < 0.4 else '',
+            'address': '{}, {}'.format(rng.choice(STREETS), rng.randint(1, 150)),
+            'created_at': now - timedelta(days=days * rng.random())
+        }
+
+
+def order_row(rng, client_ids, employee_ids, status_ids, now, days):
+    created_at = now - timedelta(days=days * rng.random() ** 1.5, seconds=rng.randint(0, 86399))
+    weights = RECENT_STATUS_WEIGHTS if (now - created_at).days < RECENT_DAYS else OLD_STATUS_WEIGHTS
+    status_id = _weighted(rng, {status_id: weights.get(status_id, 1) for status_id in status_ids})
+
+    brand = rng.choice(list(BRANDS))
+    row = {
+        # Часть клиентов обращается многократно
+        'client_id': client_ids[int(len(client_ids) * rng.random() ** 2)],
+        'washing_machine_model': '{} {}'.format(brand, rng.choice(BRANDS[brand])),
+        'condition': rng.choice(CONDITIONS),
+        'description': rng.choice(DESCRIPTIONS),
+        'purchase_price': None,
+        'repair_costs': None,
+        'sale_price': None,
+        'status_id': status_id,
+        # Новым заявкам мастер еще не назначен
+        'employee_id': rng.choice(employee_ids) if employee_ids and status_id != NEW_STATUS_ID else None,
+        'created_at': created_at,
+        'completed_at': None
+    }
+    if rng.random() < RESALE_SHARE:
+        row['purchase_price'] = _price(rng, 1000, 6000)
+        row['repair_costs'] = _price(rng, 300, 3000) if rng.random() < 0.7 else None
+    else:
+        row['repair_costs'] = _price(rng, 300, 4000)
+    if status_id == COMPLETED_STATUS_ID:
+        costs = (row['purchase_price'] or 0) + (row['repair_costs'] or 0)
+        row['sale_price'] = int(round(costs * rng.uniform(1.3, 2.2), -1))
+        row['completed_at'] = created_at + timedelta(days=rng.randint(1, 14))
+    elif status_id == CANCELLED_STATUS_ID:
+        row['repair_costs'] = None
+    return row
+
+
+def spare_part_rows(rng, count, start):
+    for number in range(count):
+        cost_price = _price(rng, 100, 3000)
+        min_stock = rng.choice([2, 3, 5, 10])
+        # Около 15% позиций на исходе или закончились
+        quantity = rng.randint(0, min_stock) if rng.random() < 0.15 else rng.randint(min_stock + 1, 60)
+        yield {
+            'name': '{} {}'.format(rng.choice(PARTS), rng.choice(list(BRANDS))),
+            'article': 'GEN-{:06d}'.format(start + number),
+            'quantity': quantity,
+            'cost_price': cost_price,
+            'retail_price': int(round(cost_price * rng.uniform(1.4, 2.0), -1)),
+            'min_stock': min_stock
+        }
+
+
+def employee_rows(rng, count, now):
+    for number in range(count):
+        position, salary_from, salary_to = POSITIONS[0] if number % 3 else rng.choice(POSITIONS)
+        yield {
+            'name': '{} {}'.format(rng.choice(LAST_NAMES), rng.choice(FIRST_NAMES)),
+            'position': position,
+            'phone': _phone(rng.randrange(10 ** 9)),
+            'email': 'staff{}@krasbytservice.ru'.format(number + 1),
+            'salary': int(round(rng.uniform(salary_from, salary_to), -3)),
+            'hire_date': now - timedelta(days=rng.randint(30, 3000))
+        }
+
+
+def _insert_chunks(model, rows, on_chunk=None):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == CHUNK_SIZE:
+            db.session.execute(insert(model), chunk)
+            if on_chunk:
+                on_chunk(chunk)
+            db.session.commit()
+            chunk = []
+    if chunk:
+        db.session.execute(insert(model), chunk)
+        if on_chunk:
+            on_chunk(chunk)
+        db.session.commit()
+
+
+def record_order_rows(rows):
+    ledger.record_order_rows(rows)
+    workload.record_order_rows(rows)
+
+
+def generate(orders, clients=None, spare_parts=None, employees=None, days=730, seed=None):
+    """Добавляет синтетические данные к существующим; возвращает число строк по таблицам"""
+    rng = random.Random(seed)
+    now = datetime.now()
+    clients = clients if clients is not None else max(orders // 3, 1)
+    spare_parts = spare_parts if spare_parts is not None else min(max(orders // 50, 50), 5000)
+    employees = employees if employees is not None else min(max(orders // 5000, 5), 50)
+
+    status_ids = ensure_statuses()
+    first_client = (db.session.query(func.max(Client.id)).scalar() or 0) + 1
+    _insert_chunks(Client, client_rows(rng, clients, first_client, now, days))
+    client_ids = [client_id for (client_id,) in
+                  db.session.query(Client.id).filter(Client.id >= first_client).order_by(Client.id)]
+
+    first_part = (db.session.query(func.max(SparePart.id)).scalar() or 0) + 1
+    _insert_chunks(SparePart, spare_part_rows(rng, spare_parts, first_part))
+    first_employee = (db.session.query(func.max(Employee.id)).scalar() or 0) + 1
+    _insert_chunks(Employee, employee_rows(rng, employees, now))
+    employee_ids = [employee_id for (employee_id,) in
+                    db.session.query(Employee.id).filter(Employee.id >= first_employee).order_by(Employee.id)]
+    # Журнал прибыли, дневные итоги и счетчики мастеров обновляются вместе с каждой пачкой заказов
+    _insert_chunks(Order, (order_row(rng, client_ids, employee_ids, status_ids, now, days) for _ in range(orders)),
+                   on_chunk=record_order_rows)
+    # История статусов: одна запись о текущем статусе каждого нового заказа
+    lifecycle.backfill_history()
+    db.session.commit()
+    return {'clients': clients, 'orders': orders, 'spare_parts': spare_parts, 'employees': employees}
+
+
+seed_cli = AppGroup('seed', help='Синтетические данные для нагрузочного тестирования.')
+
+
+@seed_cli.command('generate')
+@click.option('--scale', type=click.Choice(sorted(SCALES)), help='Готовый объем: 10k, 100k или 1m заказов.')
+@click.option('--orders', type=int, help='Число заказов (вместо --scale).')
+@click.option('--clients', type=int, help='Число клиентов, по умолчанию треть от заказов.')
+@click.option('--spare-parts', type=int, help='Число позиций склада.')
+@click.option('--employees', type=int, help='Число сотрудников.')
+@click.option('--days', type=int, default=730, show_default=True, help='За сколько дней распределить заказы.')
+@click.option('--seed', type=int, help='Зерно генератора для воспроизводимых данных.')
+def generate_command(scale, orders, clients, spare_parts, employees, days, seed):
+    """Добавить в базу синтетических клиентов, заказы, склад и сотрудников."""
+    if orders is None:
+        orders = SCALES[scale or '10k']
+    counts = generate(orders, clients, spare_parts, employees, days, seed)
+    click.echo(', '.join('{}: {}'.format(name, count) for name, count in counts.items()))
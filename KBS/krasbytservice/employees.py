@@ -0,0 +1,250 @@
+"""Загрузка и выработка мастеров.
+
+Счетчики ведутся так же, как журнал прибыли: создание, смена статуса,
+назначение мастера и удаление заказа вносят приращение в той же транзакции.
+Поэтому статистика сотрудников и выбор наименее загруженного мастера читают
+две небольшие таблицы, а не таблицу заказов.
+"""
+from collections import defaultdict, namedtuple
+from datetime import date
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import BigInteger, Integer, cast, func, type_coerce
+
+from models import db, EmployeeCompletion, EmployeeWorkload, Order
+from money import ZERO, to_money
+from finance import money_sum
+import ledger
+from lifecycle import NEW_STATUS_ID, PROCESSING_STATUS_ID, REPAIR_STATUS_ID, COMPLETED_STATUS_ID, CANCELLED_STATUS_ID
+
+
+# Статусы, в которых заказ занимает мастера
+OPEN_STATUS_IDS = (NEW_STATUS_ID, PROCESSING_STATUS_ID, REPAIR_STATUS_ID)
+
+WorkloadStats = namedtuple('WorkloadStats', 'total_orders open_orders completed_orders cancelled_orders revenue')
+EMPTY_WORKLOAD = WorkloadStats(0, 0, 0, 0, ZERO)
+PeriodStats = namedtuple('PeriodStats', 'completed_orders revenue avg_turnaround_days')
+EMPTY_PERIOD = PeriodStats(0, ZERO, None)
+
+POSITION_BADGE_CLASSES = {'мастер': 'primary', 'менеджер': 'info', 'администратор': 'warning', 'директор': 'danger'}
+
+
+def position_badge_class(position):
+    return POSITION_BADGE_CLASSES.get((position or '').lower(), 'secondary')
+
+
+def orders_count_class(count):
+    """Цвет бейджа по числу заказов в работе"""
+    if count >= 10:
+        return 'danger'
+    if count >= 5:
+        return 'warning'
+    return 'success' if count else 'secondary'
+
+
+def turnaround_seconds(created_at, completed_at):
+    """Срок выполнения в целых секундах; доли секунды отбрасываются так же, как в SQL"""
+    return int((completed_at.replace(microsecond=0) - created_at.replace(microsecond=0)).total_seconds())
+
+
+def _turnaround_seconds_expr():
+    if db.engine.dialect.name == 'sqlite':
+        return (cast(func.strftime('%s', Order.completed_at), BigInteger)
+                - cast(func.strftime('%s', Order.created_at), BigInteger))
+    return cast(func.extract('epoch', func.date_trunc('second', Order.completed_at)
+                             - func.date_trunc('second', Order.created_at)), BigInteger)
+
+
+# Приращения
+
+def _increment(model, keys, **deltas):
+    # Атомарное приращение одним INSERT ... ON CONFLICT: строка создается при первом заказе мастера
+    # в статусе или за день, и одновременные первые заказы не вставят ее дважды
+    if db.session.get_bind().dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    statement = dialect_insert(model).values(**keys, **deltas)
+    statement = statement.on_conflict_do_update(
+        index_elements=list(keys),
+        set_={name: getattr(model, name) + getattr(statement.excluded, name) for name in deltas}
+    )
+    db.session.execute(statement)
+
+
+def _order_deltas(employee_id, status_id, revenue, created_at, completed_at):
+    """[(модель, ключ, приращения)] для одного заказа с мастером"""
+    deltas = [(EmployeeWorkload, (('employee_id', employee_id), ('status_id', status_id)),
+               {'orders_count': 1, 'revenue': revenue})]
+    if status_id == COMPLETED_STATUS_ID and completed_at:
+        deltas.append((EmployeeCompletion, (('employee_id', employee_id), ('day', completed_at.date())),
+                       {'orders_count': 1, 'revenue': revenue,
+                        'turnaround_seconds': turnaround_seconds(created_at, completed_at)}))
+    return deltas
+
+
+def record_order(order, sign=1):
+    """Учитывает заказ в счетчиках его мастера (sign=-1 — до изменения заказа и при удалении).
+
+    Вызывается до commit, поэтому счетчики меняются в той же транзакции, что и заказ.
+    """
+    if order.employee_id is None:
+        return
+    for model, keys, deltas in _order_deltas(int(order.employee_id), int(order.status_id),
+                                             order.sale_price or ZERO, order.created_at, order.completed_at):
+        _increment(model, dict(keys), **{name: sign * value for name, value in deltas.items()})
+
+
+def record_order_rows(rows):
+    """Учитывает пачку новых заказов, переданных словарями колонок: одно обновление на строку счетчиков"""
+    totals = defaultdict(lambda: defaultdict(int))
+    for row in rows:
+        if row.get('employee_id') is None:
+            continue
+        for model, keys, deltas in _order_deltas(int(row['employee_id']), int(row['status_id']),
+                                                 to_money(row.get('sale_price')) or ZERO,
+                                                 row['created_at'], row.get('completed_at')):
+            bucket = totals[(model, keys)]
+            for name, value in deltas.items():
+                bucket[name] += value
+    for (model, keys), deltas in totals.items():
+        _increment(model, dict(keys), **deltas)
+
+
+def assign(order, employee_id):
+    """Назначает заказу мастера (None — снять назначение) и переносит заказ между счетчиками и дневными итогами"""
+    record_order(order, sign=-1)
+    ledger.record_rollup(order, sign=-1)
+    order.employee_id = employee_id
+    record_order(order)
+    ledger.record_rollup(order)
+
+
+# Пересчет и сверка
+
+def compute_workload():
+    """{(мастер, статус): (count, revenue)} по заказам"""
+    rows = (db.session.query(Order.employee_id, Order.status_id, func.count(Order.id),
+                             money_sum(Order.sale_price))
+            .filter(Order.employee_id.isnot(None))
+            .group_by(Order.employee_id, Order.status_id)
+            .all())
+    return {(employee_id, status_id): (count, revenue) for employee_id, status_id, count, revenue in rows}
+
+
+def compute_completions():
+    """{(мастер, день выполнения): (count, revenue, turnaround_seconds)} по заказам"""
+    day = func.date(Order.completed_at)
+    rows = (db.session.query(Order.employee_id, day, func.count(Order.id), money_sum(Order.sale_price),
+                             type_coerce(func.coalesce(func.sum(_turnaround_seconds_expr()), 0), Integer()))
+            .filter(Order.employee_id.isnot(None), Order.status_id == COMPLETED_STATUS_ID,
+                    Order.completed_at.isnot(None))
+            .group_by(Order.employee_id, day)
+            .all())
+    return {(employee_id, date.fromisoformat(str(day_key))): (count, revenue, seconds)
+            for employee_id, day_key, count, revenue, seconds in rows}
+
+
+def rebuild():
+    """Полный пересчет счетчиков мастеров; возвращает число строк"""
+    workload = compute_workload()
+    completions = compute_completions()
+    EmployeeWorkload.query.delete()
+    EmployeeCompletion.query.delete()
+    db.session.add_all(EmployeeWorkload(employee_id=employee_id, status_id=status_id, orders_count=count,
+                                        revenue=revenue)
+                       for (employee_id, status_id), (count, revenue) in workload.items())
+    db.session.add_all(EmployeeCompletion(employee_id=employee_id, day=day, orders_count=count, revenue=revenue,
+                                          turnaround_seconds=seconds)
+                       for (employee_id, day), (count, revenue, seconds) in completions.items())
+    db.session.commit()
+    return len(workload) + len(completions)
+
+
+def verify():
+    """Сверка счетчиков с заказами; возвращает список расхождений"""
+    expected = {'мастер {} / статус {}'.format(*key): values for key, values in compute_workload().items()}
+    expected.update(('мастер {} / выполнено {}'.format(*key), values) for key, values in compute_completions().items())
+    stored = {'мастер {} / статус {}'.format(row.employee_id, row.status_id): (row.orders_count, row.revenue)
+              for row in EmployeeWorkload.query.all()}
+    stored.update(('мастер {} / выполнено {}'.format(row.employee_id, row.day),
+                   (row.orders_count, row.revenue, row.turnaround_seconds))
+                  for row in EmployeeCompletion.query.all())
+
+    drift = []
+    for key in sorted(set(expected) | set(stored)):
+        empty = (0, 0) if '/ статус' in key else (0, 0, 0)
+        actual = stored.get(key, empty)
+        wanted = expected.get(key, empty)
+        if actual != wanted:
+            drift.append((key, actual, wanted))
+    return drift
+
+
+# Статистика
+
+def workload_stats():
+    """{мастер: WorkloadStats} по текущим статусам заказов"""
+    stats = defaultdict(lambda: [0, 0, 0, 0, ZERO])
+    for row in EmployeeWorkload.query.filter(EmployeeWorkload.orders_count != 0):
+        values = stats[row.employee_id]
+        values[0] += row.orders_count
+        if row.status_id in OPEN_STATUS_IDS:
+            values[1] += row.orders_count
+        elif row.status_id == COMPLETED_STATUS_ID:
+            values[2] += row.orders_count
+            values[4] += row.revenue
+        elif row.status_id == CANCELLED_STATUS_ID:
+            values[3] += row.orders_count
+    return {employee_id: WorkloadStats(*values) for employee_id, values in stats.items()}
+
+
+def period_stats(date_from, date_to, employee_id=None):
+    """{мастер: PeriodStats}: выполнено заказов, выручка и средний срок за дни [date_from, date_to]"""
+    query = (db.session.query(EmployeeCompletion.employee_id,
+                              func.sum(EmployeeCompletion.orders_count),
+                              money_sum(EmployeeCompletion.revenue),
+                              func.sum(EmployeeCompletion.turnaround_seconds))
+             .filter(EmployeeCompletion.day >= date_from, EmployeeCompletion.day <= date_to))
+    if employee_id is not None:
+        query = query.filter(EmployeeCompletion.employee_id == employee_id)
+    stats = {}
+    for row_employee_id, count, revenue, seconds in query.group_by(EmployeeCompletion.employee_id):
+        if count:
+            stats[row_employee_id] = PeriodStats(count, revenue, round(seconds / count / 86400, 1))
+    return stats
+
+
+def masters_by_load(employees, stats=None):
+    """Активные сотрудники от наименее загруженного: [(сотрудник, заказов в работе)]"""
+    stats = workload_stats() if stats is None else stats
+    loads = [(employee, stats.get(employee.id, EMPTY_WORKLOAD).open_orders)
+             for employee in employees if employee.is_active]
+    return sorted(loads, key=lambda item: (item[1], item[0].name))
+
+
+def average_salary(employees):
+    """Средний оклад по уже загруженному списку сотрудников, без отдельного запроса"""
+    salaries = [employee.salary for employee in employees if employee.salary is not None]
+    return to_money(sum(salaries) / len(salaries)) if salaries else None
+
+
+employees_cli = AppGroup('employees', help='Счетчики загрузки и выработки мастеров.')
+
+
+@employees_cli.command('rebuild')
+def rebuild_command():
+    """Пересчитать счетчики мастеров по заказам."""
+    click.echo('Счетчики пересчитаны, строк: {}'.format(rebuild()))
+
+
+@employees_cli.command('verify')
+def verify_command():
+    """Сверить счетчики мастеров с заказами."""
+    drift = verify()
+    for key, actual, expected in drift:
+        click.echo('{}: в счетчиках {}, по заказам {}'.format(key, actual, expected))
+    if drift:
+        raise click.ClickException('Найдено расхождений: {}'.format(len(drift)))
+    click.echo('Расхождений нет')
@@ -0,0 +1,156 @@
+import csv
+import io
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import case
+
+from models import db, Client, Order, OrderStatus, SparePart
+from money import ZERO
+from queries import apply_order_filters, client_stats_subquery, parse_order_filters
+
+
+EXPORT_KINDS = ('orders', 'clients', 'spare_parts')
+EXPORT_FORMATS = ('csv', 'xlsx')
+
+# Сколько строк забирать из курсора и писать в ответ за один раз
+BATCH_SIZE = 1000
+
+ORDER_HEADERS = ['№', 'Дата создания', 'Клиент', 'Телефон', 'Модель', 'Статус', 'Состояние', 'Описание',
+                 'Цена выкупа', 'Затраты на ремонт', 'Цена продажи', 'Прибыль']
+CLIENT_HEADERS = ['№', 'ФИО', 'Телефон', 'Email', 'Адрес', 'Дата регистрации', 'Заказов', 'Общая сумма',
+                  'Последний заказ']
+# Количество — все запчасти на складе вместе с резервом: так его считает инвентаризация и так его читает загрузка
+SPARE_PART_HEADERS = ['№', 'Артикул', 'Наименование', 'Количество', 'В резерве', 'Мин. запас', 'Себестоимость',
+                      'Розничная цена']
+
+
+def _stream(query):
+    # Строки читаются порциями через серверный курсор, ORM-объекты не создаются
+    return query.yield_per(BATCH_SIZE)
+
+
+def order_rows(**filters):
+    query = (db.session.query(Order.id, Order.created_at, Client.name, Client.phone, Order.washing_machine_model,
+                              OrderStatus.name, Order.condition, Order.description, Order.purchase_price,
+                              Order.repair_costs, Order.sale_price)
+             .join(Client, Order.client_id == Client.id)
+             .join(OrderStatus, Order.status_id == OrderStatus.id))
+    query = apply_order_filters(query, **filters).order_by(Order.created_at.desc(), Order.id.desc())
+
+    for row in _stream(query):
+        purchase_price, repair_costs, sale_price = row[8:11]
+        yield list(row) + [(sale_price or ZERO) - (repair_costs or ZERO) - (purchase_price or ZERO)]
+
+
+def client_rows():
+    stats = client_stats_subquery()
+    query = (db.session.query(Client.id, Client.name, Client.phone, Client.email, Client.address, Client.created_at,
+                              stats.c.orders_count, stats.c.total_amount, stats.c.last_order)
+             .outerjoin(stats, stats.c.client_id == Client.id)
+             .order_by(Client.id))
+    for row in _stream(query):
+        yield list(row[:6]) + [row[6] or 0, row[7] or 0, row[8]]
+
+
+def spare_part_rows(stock_level='all'):
+    query = db.session.query(SparePart.id, SparePart.article, SparePart.name,
+                             SparePart.quantity + SparePart.reserved, SparePart.reserved,
+                             SparePart.min_stock, SparePart.cost_price, SparePart.retail_price)
+    # Те же уровни запаса, что и в отчете по складу
+    level = case((SparePart.quantity <= 0, 'out'),
+                 (SparePart.quantity <= SparePart.min_stock, 'low'),
+                 else_='normal')
+    if stock_level and stock_level != 'all':
+        query = query.filter(level == stock_level)
+    for row in _stream(query.order_by(SparePart.id)):
+        yield list(row)
+
+
+EXPORTS = {
+    'orders': (ORDER_HEADERS, order_rows),
+    'clients': (CLIENT_HEADERS, client_rows),
+    'spare_parts': (SPARE_PART_HEADERS, spare_part_rows)
+}
+
+
+def export_filters(kind, args):
+    """Фильтры выгрузки из параметров запроса: те же, что у /orders и /reports"""
+    if kind == 'orders':
+        return parse_order_filters(args)
+    if kind == 'spare_parts':
+        return {'stock_level': args.get('stock_level') or 'all'}
+    return {}
+
+
+def _cell(value):
+    if hasattr(value, 'strftime'):
+        return value.strftime('%d.%m.%Y %H:%M')
+    return '' if value is None else value
+
+
+def iter_csv(kind, **filters):
+    """CSV по частям: в памяти держится не больше одной порции строк.
+
+    Разделитель ';' и BOM нужны, чтобы Excel с русской локалью открыл файл без настройки.
+    """
+    headers, rows = EXPORTS[kind]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=';')
+
+    buffer.write('\ufeff')
+    writer.writerow(headers)
+    for number, row in enumerate(rows(**filters), 1):
+        writer.writerow([_cell(value) for value in row])
+        if number % BATCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def write_xlsx(kind, target, **filters):
+    """XLSX в потоковом режиме openpyxl (write_only); target — путь или файловый объект"""
+    # openpyxl импортируется при первом экспорте: он заметно замедляет запуск приложения
+    try:
+        from openpyxl import Workbook
+    except ImportError:  # XLSX недоступен без openpyxl, CSV работает всегда
+        raise RuntimeError('Для экспорта в XLSX установите пакет openpyxl')
+
+    headers, rows = EXPORTS[kind]
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(kind)
+    sheet.append(headers)
+    for row in rows(**filters):
+        sheet.append([_cell(value) for value in row])
+    workbook.save(target)
+
+
+export_cli = AppGroup('export', help='Выгрузка заказов, клиентов и склада.')
+
+
+@export_cli.command('run')
+@click.argument('kind', type=click.Choice(EXPORT_KINDS))
+@click.option('--format', 'export_format', type=click.Choice(EXPORT_FORMATS), default='csv')
+@click.option('--output', '-o', type=click.Path(dir_okay=False), required=True)
+@click.option('--status-id', type=int, help='Фильтр заказов по статусу.')
+@click.option('--search', default='', help='Поиск заказов по клиенту, модели и описанию.')
+@click.option('--date-from', type=click.DateTime(['%Y-%m-%d']), help='Заказы с даты.')
+@click.option('--date-to', type=click.DateTime(['%Y-%m-%d']), help='Заказы по дату включительно.')
+@click.option('--stock-level', type=click.Choice(['all', 'low', 'out', 'normal']), default='all')
+def export_command(kind, export_format, output, status_id, search, date_from, date_to, stock_level):
+    """Выгрузить KIND в файл."""
+    if kind == 'orders':
+        filters = {'status_id': status_id, 'search': search, 'date_from': date_from, 'date_to': date_to}
+    elif kind == 'spare_parts':
+        filters = {'stock_level': stock_level}
+    else:
+        filters = {}
+
+    if export_format == 'xlsx':
+        write_xlsx(kind, output, **filters)
+    else:
+        with open(output, 'w', encoding='utf-8', newline='') as file:
+            for chunk in iter_csv(kind, **filters):
+                file.write(chunk)
+    click.echo('Выгрузка сохранена: {}'.format(output))
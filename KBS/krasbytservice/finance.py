@@ -0,0 +1,251 @@
+"""Финансовые итоги заказов: выручка, расходы, прибыль и маржа.
+
+Суммы складываются в базе по целым копейкам (money.Money), поэтому итоги
+точные и заказы не загружаются в Python. Для разовой аналитики заказы
+выбираются колонками в массивы NumPy, если он установлен.
+"""
+import itertools
+from collections import namedtuple
+from datetime import datetime
+from decimal import Decimal, ROUND_HALF_UP
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import BigInteger, Integer, case, cast, func, type_coerce
+
+from models import db, Order
+from money import Money, ZERO, from_kopecks
+from queries import apply_order_filters
+
+try:
+    import numpy
+except ImportError:  # колоночная аналитика недоступна без numpy, итоги в SQL работают всегда
+    numpy = None
+
+
+# Сколько строк читать из курсора за раз при выборке колонками
+BATCH_SIZE = 50000
+
+Totals = namedtuple('Totals', 'orders_count revenue expenses profit margin')
+
+
+# Суммы одного загруженного заказа
+
+def order_amounts(order):
+    """Выручка и расходы по одному заказу"""
+    revenue = order.sale_price or ZERO
+    expenses = (order.repair_costs or ZERO) + (order.purchase_price or ZERO)
+    return revenue, expenses
+
+
+def order_profit(order):
+    revenue, expenses = order_amounts(order)
+    return revenue - expenses
+
+
+def order_category(order):
+    """Категория заказа: выкупленная техника или ремонт"""
+    return 'resale' if order.purchase_price else 'repair'
+
+
+# Те же правила в виде SQL-выражений. Результат арифметики над Money SQLAlchemy
+# считает простым целым, поэтому тип суммы задается явно
+
+def money(expression):
+    return type_coerce(expression, Money())
+
+
+def revenue_expr():
+    return money(func.coalesce(Order.sale_price, 0))
+
+
+def expenses_expr():
+    return money(func.coalesce(Order.repair_costs, 0) + func.coalesce(Order.purchase_price, 0))
+
+
+def money_sum(expression):
+    """SUM по копейкам; 0 вместо NULL для пустой выборки"""
+    return money(func.coalesce(func.sum(expression), 0))
+
+
+def order_category_expr():
+    return case((func.coalesce(Order.purchase_price, 0) != 0, 'resale'), else_='repair')
+
+
+def _month_expr():
+    if db.engine.dialect.name == 'sqlite':
+        return func.strftime('%Y-%m', Order.created_at)
+    return func.to_char(Order.created_at, 'YYYY-MM')
+
+
+GROUPS = {
+    'status': lambda: Order.status_id,
+    'category': order_category_expr,
+    'month': _month_expr,
+    'employee': lambda: Order.employee_id,
+    'client': lambda: Order.client_id,
+}
+
+
+def margin(revenue, profit):
+    """Маржа в процентах от выручки с точностью до десятой"""
+    if not revenue:
+        return Decimal('0.0')
+    return (profit * 100 / revenue).quantize(Decimal('0.1'), rounding=ROUND_HALF_UP)
+
+
+def make_totals(orders_count, revenue, expenses):
+    profit = revenue - expenses
+    return Totals(orders_count, revenue, expenses, profit, margin(revenue, profit))
+
+
+def _orders_query(columns, filters):
+    query = db.session.query(*columns).select_from(Order)
+    if filters.get('search'):
+        query = query.join(Order.client)
+    return apply_order_filters(query, **filters)
+
+
+def totals(**filters):
+    """Итоги по заказам с фильтрами списка заказов (status_id, search, date_from, date_to)"""
+    row = _orders_query([func.count(Order.id), money_sum(revenue_expr()), money_sum(expenses_expr())],
+                        filters).one()
+    return make_totals(*row)
+
+
+def totals_by(group, **filters):
+    """Итоги в разрезе group (status, category, month, employee, client): [(ключ, Totals)]"""
+    key = GROUPS[group]()
+    rows = (_orders_query([key, func.count(Order.id), money_sum(revenue_expr()), money_sum(expenses_expr())],
+                          filters)
+            .group_by(key)
+            .order_by(key)
+            .all())
+    return [(row[0], make_totals(*row[1:])) for row in rows]
+
+
+# Выборка колонками для NumPy
+
+def _raw_kopecks(column):
+    # Копейки как есть, без перевода в Decimal на каждой строке
+    return func.coalesce(type_coerce(column, BigInteger()), 0)
+
+
+def _month_number_expr():
+    # 202401 вместо '2024-01': колонка остается целочисленной
+    return cast(func.replace(_month_expr(), '-', ''), Integer)
+
+
+ORDER_COLUMNS = ('id', 'status_id', 'employee_id', 'month', 'revenue', 'expenses')
+
+
+def order_columns(batch_size=BATCH_SIZE, **filters):
+    """Заказы колонками: {имя: numpy.ndarray int64}.
+
+    Суммы — копейки, поэтому сложение в NumPy точное; employee_id 0 — мастер не назначен.
+    Строки читаются из курсора пачками и сразу укладываются в массив.
+    """
+    if numpy is None:
+        raise RuntimeError('Для колоночной аналитики установите пакет numpy')
+    query = _orders_query([Order.id, Order.status_id, func.coalesce(Order.employee_id, 0), _month_number_expr(),
+                           _raw_kopecks(Order.sale_price),
+                           type_coerce(_raw_kopecks(Order.repair_costs) + _raw_kopecks(Order.purchase_price),
+                                       BigInteger())],
+                          filters)
+    result = db.session.execute(query.statement.execution_options(yield_per=batch_size))
+    width = len(ORDER_COLUMNS)
+    chunks = [numpy.fromiter(itertools.chain.from_iterable(rows), dtype=numpy.int64,
+                             count=len(rows) * width).reshape(-1, width)
+              for rows in result.partitions()]
+    table = numpy.concatenate(chunks) if chunks else numpy.empty((0, width), dtype=numpy.int64)
+    return {name: table[:, index] for index, name in enumerate(ORDER_COLUMNS)}
+
+
+def _grouped(keys, values):
+    # Точные суммы int64 по группам (bincount с весами считал бы во float)
+    unique, inverse = numpy.unique(keys, return_inverse=True)
+    sums = numpy.zeros(len(unique), dtype=numpy.int64)
+    counts = numpy.bincount(inverse, minlength=len(unique))
+    numpy.add.at(sums, inverse, values)
+    return unique, counts, sums
+
+
+def profit_analysis(**filters):
+    """Разовая аналитика прибыли: итоги, распределение по заказам, убыточные заказы, разрезы по мастерам и месяцам"""
+    columns = order_columns(**filters)
+    revenue, expenses = columns['revenue'], columns['expenses']
+    profit = revenue - expenses
+    orders_count = len(profit)
+    summary = make_totals(orders_count, from_kopecks(int(revenue.sum())), from_kopecks(int(expenses.sum())))
+    percentiles = numpy.percentile(profit, (10, 50, 90)) if orders_count else (0, 0, 0)
+
+    def breakdown(keys):
+        unique, counts, sums = _grouped(keys, profit)
+        return [(int(key), int(count), from_kopecks(int(total))) for key, count, total in zip(unique, counts, sums)]
+
+    return {
+        'totals': summary,
+        'profit_p10': from_kopecks(float(percentiles[0])),
+        'profit_median': from_kopecks(float(percentiles[1])),
+        'profit_p90': from_kopecks(float(percentiles[2])),
+        'loss_orders': int((profit < 0).sum()),
+        'by_employee': breakdown(columns['employee_id']),
+        'by_month': breakdown(columns['month'])
+    }
+
+
+finance_cli = AppGroup('finance', help='Финансовые итоги заказов: выручка, расходы, прибыль, маржа.')
+
+
+def _period_filters(date_from, date_to, status_id):
+    return {'date_from': date_from, 'date_to': date_to, 'status_id': status_id}
+
+
+def _format_totals(totals_row):
+    return 'заказов {:>8}  выручка {:>14}  расходы {:>14}  прибыль {:>14}  маржа {:>6}%'.format(*totals_row)
+
+
+_period_options = [
+    click.option('--from', 'date_from', type=click.DateTime(['%Y-%m-%d']), help='Заказы, созданные с этой даты.'),
+    click.option('--to', 'date_to', type=click.DateTime(['%Y-%m-%d']), help='Заказы, созданные по эту дату.'),
+    click.option('--status-id', type=int, help='Только заказы в этом статусе.')
+]
+
+
+def period_options(command):
+    for option in reversed(_period_options):
+        command = option(command)
+    return command
+
+
+@finance_cli.command('summary')
+@period_options
+@click.option('--by', 'group', type=click.Choice(sorted(GROUPS)), help='Разбивка итогов.')
+def summary_command(date_from, date_to, status_id, group):
+    """Итоги за период, посчитанные в базе."""
+    filters = _period_filters(date_from, date_to, status_id)
+    if group:
+        for key, row in totals_by(group, **filters):
+            click.echo('{:<12} {}'.format(str(key), _format_totals(row)))
+    click.echo('{:<12} {}'.format('итого', _format_totals(totals(**filters))))
+
+
+@finance_cli.command('analyze')
+@period_options
+def analyze_command(date_from, date_to, status_id):
+    """Распределение прибыли по заказам и разрезы по мастерам и месяцам (NumPy)."""
+    started = datetime.now()
+    try:
+        analysis = profit_analysis(**_period_filters(date_from, date_to, status_id))
+    except RuntimeError as error:
+        raise click.ClickException(str(error))
+    click.echo(_format_totals(analysis['totals']))
+    click.echo('Прибыль заказа: p10 {}, медиана {}, p90 {}; убыточных заказов {}'.format(
+        analysis['profit_p10'], analysis['profit_median'], analysis['profit_p90'], analysis['loss_orders']))
+    click.echo('По мастерам (0 — не назначен):')
+    for employee_id, orders_count, profit in analysis['by_employee']:
+        click.echo('  {:>6}  заказов {:>8}  прибыль {:>14}'.format(employee_id, orders_count, profit))
+    click.echo('По месяцам:')
+    for month, orders_count, profit in analysis['by_month']:
+        click.echo('  {}  заказов {:>8}  прибыль {:>14}'.format(month, orders_count, profit))
+    click.echo('Готово за {:.2f} с'.format((datetime.now() - started).total_seconds()))
@@ -0,0 +1,51 @@
+"""Настройки gunicorn: gunicorn -c gunicorn.conf.py wsgi:app
+
+Приложение загружается один раз в мастер-процессе (preload) и копируется
+в воркеры через fork, поэтому воркеры стартуют без повторного импорта.
+Число воркеров и потоков задается KBS_WORKERS и KBS_THREADS, по умолчанию
+по числу ядер.
+
+Перезапуск без потери запросов:
+  kill -HUP <мастер>   — новые воркеры с новыми настройками; старые дорабатывают запросы;
+  kill -USR2 <мастер>, затем kill -QUIT <старый мастер> — новый код приложения
+  (при preload код загружен в мастере, и HUP его не перечитывает).
+"""
+import multiprocessing
+import os
+
+
+bind = os.environ.get('KBS_BIND', '0.0.0.0:8000')
+# Воркер на ядро: запросы в основном ждут базу, поэтому к каждому добавляются потоки
+workers = int(os.environ.get('KBS_WORKERS', multiprocessing.cpu_count()))
+threads = int(os.environ.get('KBS_THREADS', 4))
+worker_class = 'gthread'
+preload_app = True
+
+timeout = int(os.environ.get('KBS_TIMEOUT', 60))
+graceful_timeout = 30
+keepalive = 5
+# Воркер перезапускается после стольких запросов, чтобы рост памяти не копился
+max_requests = 5000
+max_requests_jitter = 500
+
+accesslog = os.environ.get('KBS_ACCESS_LOG', '-')
+errorlog = '-'
+
+# Воркеры складывают метрики в общий каталог, и /metrics отдает их сумму, а не числа одного воркера
+os.environ.setdefault('KBS_METRICS_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance',
+                                                      'metrics'))
+
+
+def on_starting(server):
+    from metrics import clear_metrics_dir
+    clear_metrics_dir(os.environ['KBS_METRICS_DIR'])
+
+
+def post_fork(server, worker):
+    # Соединения из пула мастера нельзя делить между процессами: воркер открывает свои
+    from models import db
+    from metrics import reset_metrics
+    reset_metrics()
+    with worker.app.wsgi().app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
@@ -0,0 +1,220 @@
+import hashlib
+import itertools
+import os
+import threading
+import time
+from datetime import datetime
+from functools import wraps
+
+from flask import current_app, g, has_app_context, has_request_context, make_response, request, session as flask_session
+from flask_login import current_user
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from models import db, DataVersion
+from database import REPLICA_BIND
+from cache import TTLCache
+from assets import manifest_path
+
+
+# Таблицы, от которых зависят списки и карточки. Их версии растут автоматически:
+# коммит, который менял такую таблицу (через ORM-объекты или insert/update/delete
+# в сессии), в той же транзакции увеличивает счетчик в data_version
+TRACKED_TABLES = frozenset(('order', 'client', 'spare_part', 'order_status', 'employee', 'user'))
+
+# Версии читаются из базы не чаще раза в VERSION_TTL секунд на процесс;
+# свой коммит процесс видит сразу, чужие — с задержкой до VERSION_TTL
+VERSION_TTL = 2
+FRAGMENT_TTL = 600
+
+version_cache = TTLCache(maxsize=4, ttl=VERSION_TTL)
+fragment_cache = TTLCache(maxsize=500, ttl=FRAGMENT_TTL)
+_generation = 0
+_generation_lock = threading.Lock()
+_template_salt = ''
+
+
+def data_versions():
+    """{таблица: (версия, время изменения)}.
+
+    Читается тем же подключением, что и данные представления (реплика для use_replica),
+    поэтому версия не опережает данные, по которым строится страница.
+    В пределах запроса версии читаются один раз на подключение: пользователь сессии
+    загружается до use_replica, и его версии из основной базы не годятся для данных реплики.
+    """
+    replica = bool(g.get('use_replica')) and REPLICA_BIND in db.engines
+    per_bind = g.setdefault('data_versions', {})
+    if replica in per_bind:
+        return per_bind[replica]
+
+    def load():
+        rows = db.session.execute(select(DataVersion.name, DataVersion.version, DataVersion.updated_at))
+        return {name: (version, updated_at) for name, version, updated_at in rows}
+
+    # После своего коммита пользователь сразу получает свежие версии, а не кэш соседнего запроса
+    if has_request_context() and flask_session.get('data_changed_at', 0) > time.time() - VERSION_TTL:
+        per_bind[replica] = load()
+    else:
+        per_bind[replica] = version_cache.get_or_set((replica, _generation), load)
+    return per_bind[replica]
+
+
+def _forget_versions():
+    # Новое поколение в ключе: версии, прочитанные до коммита, больше не используются
+    global _generation
+    with _generation_lock:
+        _generation += 1
+
+
+def table_versions(tables, versions=None):
+    """Кортеж версий указанных таблиц"""
+    versions = data_versions() if versions is None else versions
+    return tuple(versions.get(table, (0, None))[0] for table in tables)
+
+
+def touch(*tables, session=None):
+    """Увеличивает версии таблиц в текущей транзакции.
+
+    Обычно вызывается сам перед коммитом; вручную нужен только для изменений
+    в обход сессии (сырой SQL, отдельное соединение).
+    """
+    session = session or db.session
+    dialect = session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    now = datetime.now()
+    # Одинаковый порядок строк у всех транзакций, чтобы блокировки не сцеплялись
+    statement = dialect_insert(DataVersion).values([{'name': table, 'version': 1, 'updated_at': now}
+                                                     for table in sorted(tables)])
+    statement = statement.on_conflict_do_update(
+        index_elements=[DataVersion.name],
+        set_={'version': DataVersion.version + 1, 'updated_at': statement.excluded.updated_at}
+    )
+    session.execute(statement)
+    session.info['versions_touched'] = True
+
+
+def _changed_tables(session):
+    return session.info.setdefault('changed_tables', set())
+
+
+def _track_flush(session, flush_context, instances):
+    changed = _changed_tables(session)
+    for instance in itertools.chain(session.new, session.dirty, session.deleted):
+        table = getattr(instance, '__table__', None)
+        if table is not None and table.name in TRACKED_TABLES:
+            changed.add(table.name)
+
+
+def _track_execute(state):
+    if state.is_insert or state.is_update or state.is_delete:
+        name = getattr(getattr(state.statement, 'table', None), 'name', None)
+        if name in TRACKED_TABLES:
+            _changed_tables(state.session).add(name)
+
+
+def _bump_versions(session):
+    session.flush()
+    changed = session.info.pop('changed_tables', None)
+    if changed:
+        touch(*changed, session=session)
+
+
+def _after_commit(session):
+    if session.info.pop('versions_touched', False):
+        _forget_versions()
+        if has_app_context():
+            g.pop('data_versions', None)
+        if has_request_context():
+            flask_session['data_changed_at'] = time.time()
+
+
+def _after_rollback(session):
+    session.info.pop('changed_tables', None)
+    session.info.pop('versions_touched', None)
+
+
+def _templates_salt(app):
+    # Смена шаблонов или сборки статики при обновлении меняет ETag, даже если данные те же
+    stamps = []
+    for directory in getattr(app.jinja_loader, 'searchpath', []):
+        for root, _, files in os.walk(directory):
+            for name in sorted(files):
+                path = os.path.join(root, name)
+                stamps.append('{}:{}'.format(path, os.path.getmtime(path)))
+    if os.path.exists(manifest_path(app)):
+        stamps.append('{}:{}'.format(manifest_path(app), os.path.getmtime(manifest_path(app))))
+    return hashlib.sha1('|'.join(stamps).encode()).hexdigest()[:12]
+
+
+def init_http_cache(app):
+    """Счетчики версий таблиц в транзакциях сессии и соль ETag по шаблонам и сборке статики"""
+    global _template_salt
+    _template_salt = _templates_salt(app)
+    if not event.contains(Session, 'before_commit', _bump_versions):
+        event.listen(Session, 'before_flush', _track_flush)
+        event.listen(Session, 'do_orm_execute', _track_execute)
+        event.listen(Session, 'before_commit', _bump_versions)
+        event.listen(Session, 'after_commit', _after_commit)
+        event.listen(Session, 'after_rollback', _after_rollback)
+
+
+def cached_fragment(name, tables, params, render):
+    """Результат render() из кэша; ключ — имя фрагмента, версии таблиц и параметры (фильтры, страница)"""
+    key = (name, table_versions(tables), params)
+    return fragment_cache.get_or_set(key, render)
+
+
+def _etag(tables, versions):
+    user_id = current_user.get_id() if current_user.is_authenticated else ''
+    raw = '|'.join(str(part) for part in (request.endpoint, request.full_path, user_id, _template_salt,
+                                          table_versions(tables, versions)))
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def _last_modified(tables, versions):
+    stamps = [versions[table][1] for table in tables if table in versions]
+    if not stamps:
+        return None
+    # Время в базе локальное; HTTP-заголовок требует UTC с точностью до секунды
+    return max(stamps).replace(microsecond=0).astimezone()
+
+
+def conditional(*tables):
+    """Декоратор GET-представления: ETag и Last-Modified по версиям таблиц.
+
+    Повторный запрос неизменившейся страницы получает 304 без обращения к базе и рендеринга.
+    Ответы с flash-сообщениями не кэшируются: сообщение показывается один раз.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method != 'GET' or '_flashes' in flask_session:
+                return view(*args, **kwargs)
+
+            versions = data_versions()
+            etag = _etag(tables, versions)
+            last_modified = _last_modified(tables, versions)
+            if request.if_none_match:
+                not_modified = request.if_none_match.contains(etag)
+            else:
+                not_modified = bool(last_modified and request.if_modified_since
+                                    and last_modified <= request.if_modified_since)
+
+            if not_modified:
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200 or '_flashes' in flask_session:
+                    return response
+            response.set_etag(etag)
+            if last_modified:
+                response.last_modified = last_modified
+            # Браузер хранит страницу, но каждый раз сверяет ее с сервером
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,415 @@
+import csv
+import io
+import itertools
+import json
+from datetime import datetime
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import insert
+
+from models import db, normalize_phone, Client, Order, OrderStatus, SparePart
+from money import parse_money
+import ledger
+import lifecycle
+import stock
+from lifecycle import COMPLETED_STATUS_ID
+
+
+IMPORT_KINDS = ('clients', 'orders', 'spare_parts')
+IMPORT_FORMATS = ('csv', 'json')
+
+# Комментарий движений склада, созданных загрузкой
+STOCK_COMMENT = 'Загрузка из файла'
+
+# Строки проверяются и вставляются пачками: одна транзакция и один executemany на пачку
+CHUNK_SIZE = 5000
+# Сколько ошибок возвращать в ответе endpoint'а
+MAX_REPORTED_ERRORS = 100
+
+# Заголовки выгрузки (export.py) тоже принимаются, чтобы выгруженный файл можно было загрузить обратно
+HEADER_ALIASES = {
+    'clients': {'ФИО': 'name', 'Телефон': 'phone', 'Email': 'email', 'Адрес': 'address'},
+    'orders': {'Дата создания': 'created_at', 'Клиент': 'client_name', 'Телефон': 'client_phone',
+               'Модель': 'model', 'Статус': 'status', 'Состояние': 'condition', 'Описание': 'description',
+               'Цена выкупа': 'purchase_price', 'Затраты на ремонт': 'repair_costs', 'Цена продажи': 'sale_price'},
+    'spare_parts': {'Артикул': 'article', 'Наименование': 'name', 'Количество': 'quantity',
+                    'Мин. запас': 'min_stock', 'Себестоимость': 'cost_price', 'Розничная цена': 'retail_price'}
+}
+
+DATE_FORMATS = ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d', '%d.%m.%Y %H:%M', '%d.%m.%Y')
+
+
+class ImportResult:
+    """Итог загрузки: сколько строк добавлено, обновлено, пропущено как дубликаты, и ошибки по строкам"""
+
+    def __init__(self):
+        self.inserted = 0
+        self.updated = 0
+        self.duplicates = 0
+        self.errors = []
+
+    def add_error(self, row_number, message):
+        self.errors.append((row_number, message))
+
+    def sorted_errors(self):
+        return sorted(self.errors, key=lambda error: error[0] or 0)[:MAX_REPORTED_ERRORS]
+
+    def to_dict(self):
+        return {
+            'inserted': self.inserted,
+            'updated': self.updated,
+            'duplicates': self.duplicates,
+            'errors_count': len(self.errors),
+            'errors': [{'row': row_number, 'error': message}
+                       for row_number, message in self.sorted_errors()]
+        }
+
+
+# Разбор полей
+
+def _text(row, field, required=False, max_length=None):
+    value = row.get(field)
+    value = '' if value is None else str(value).strip()
+    if required and not value:
+        raise ValueError('не заполнено поле {}'.format(field))
+    if max_length and len(value) > max_length:
+        raise ValueError('поле {} длиннее {} символов'.format(field, max_length))
+    return value
+
+
+def _number(row, field, cast=parse_money):
+    # По умолчанию поле — сумма в рублях: Decimal с точностью до копейки
+    value = row.get(field)
+    if value is None or isinstance(value, (int, float)):
+        return value
+    value = str(value).replace('\xa0', '').replace(' ', '').replace(',', '.')
+    if not value:
+        return None
+    try:
+        return cast(float(value)) if cast is int else cast(value)
+    except ValueError:
+        raise ValueError('поле {}: не число "{}"'.format(field, row.get(field)))
+
+
+def _datetime(row, field):
+    value = _text(row, field)
+    if not value:
+        return datetime.now()
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, date_format)
+        except ValueError:
+            pass
+    raise ValueError('поле {}: неизвестный формат даты "{}"'.format(field, value))
+
+
+def prepare_client(row):
+    phone = _text(row, 'phone', required=True, max_length=20)
+    if not normalize_phone(phone):
+        raise ValueError('телефон без цифр')
+    return {
+        'name': _text(row, 'name', required=True, max_length=100),
+        'phone': phone,
+        'phone_normalized': normalize_phone(phone),
+        'email': _text(row, 'email', max_length=100),
+        'address': _text(row, 'address'),
+        'created_at': datetime.now()
+    }
+
+
+def prepare_order(row, status_ids):
+    status = _text(row, 'status_id') or _text(row, 'status') or '1'
+    status_id = int(status) if status.isdigit() else status_ids.get(status.lower())
+    if status_id not in status_ids.values():
+        raise ValueError('неизвестный статус "{}"'.format(status))
+
+    client_id = _number(row, 'client_id', int)
+    client_phone = _text(row, 'client_phone', max_length=20)
+    if not client_id and not normalize_phone(client_phone):
+        raise ValueError('нужен client_id или телефон клиента')
+
+    created_at = _datetime(row, 'created_at')
+    # Дата выполнения есть только у выполненных заказов; без нее берется дата создания
+    completed_at = None
+    if status_id == COMPLETED_STATUS_ID:
+        completed_at = _datetime(row, 'completed_at') if _text(row, 'completed_at') else created_at
+
+    return {
+        'client_id': client_id,
+        'client_phone': client_phone,
+        'client_name': _text(row, 'client_name', max_length=100) or client_phone,
+        'washing_machine_model': _text(row, 'model', required=True, max_length=100),
+        'condition': _text(row, 'condition'),
+        'description': _text(row, 'description'),
+        'status_id': status_id,
+        'purchase_price': _number(row, 'purchase_price') or None,
+        'repair_costs': _number(row, 'repair_costs') or None,
+        'sale_price': _number(row, 'sale_price') or None,
+        'created_at': created_at,
+        'completed_at': completed_at
+    }
+
+
+def prepare_spare_part(row):
+    quantity = _number(row, 'quantity', int) or 0
+    if quantity < 0:
+        raise ValueError('количество не может быть отрицательным')
+    return {
+        'name': _text(row, 'name', required=True, max_length=100),
+        'article': _text(row, 'article', max_length=50) or None,
+        'quantity': quantity,
+        'min_stock': _number(row, 'min_stock', int) or 5,
+        'cost_price': _number(row, 'cost_price'),
+        'retail_price': _number(row, 'retail_price')
+    }
+
+
+# Чтение файлов
+
+def read_rows(stream, kind, file_format='csv'):
+    """Пары (номер строки, словарь полей) из текстового потока"""
+    aliases = HEADER_ALIASES[kind]
+    if file_format == 'json':
+        rows = enumerate(_read_json(stream), 1)
+    else:
+        first_line = stream.readline()
+        delimiter = ';' if first_line.count(';') >= first_line.count(',') else ','
+        # Строка 1 — заголовок
+        rows = enumerate(csv.DictReader(itertools.chain([first_line], stream), delimiter=delimiter), 2)
+
+    for row_number, row in rows:
+        if not isinstance(row, dict):
+            yield row_number, {}
+            continue
+        yield row_number, {aliases.get(key.strip(), key.strip().lower()): value
+                           for key, value in row.items() if key is not None}
+
+
+def _read_json(stream):
+    # Массив объектов или JSON Lines (по объекту на строку)
+    first_char = stream.read(1)
+    while first_char.isspace():
+        first_char = stream.read(1)
+    if first_char == '[':
+        yield from json.loads(first_char + stream.read())
+        return
+    for line in itertools.chain([first_char + stream.readline()], stream):
+        if line.strip():
+            yield json.loads(line)
+
+
+# Загрузка
+
+def _chunks(rows):
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, CHUNK_SIZE))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _validate(chunk, prepare, result):
+    valid = []
+    for row_number, row in chunk:
+        try:
+            valid.append((row_number, prepare(row)))
+        except (ValueError, TypeError, AttributeError) as e:
+            result.add_error(row_number, str(e))
+    return valid
+
+
+def _client_phone_index(phones):
+    # Только телефоны текущей порции, поиск по индексу phone_normalized
+    if not phones:
+        return {}
+    return dict(db.session.query(Client.phone_normalized, Client.id).filter(Client.phone_normalized.in_(phones)))
+
+
+def _insert_clients(new_clients, phone_index):
+    """Вставляет новых клиентов одним executemany и добавляет их id в индекс телефонов"""
+    if not new_clients:
+        return
+    # id берутся из RETURNING вставки: поиск по id > max(id) захватил бы клиентов,
+    # одновременно добавленных другим запросом
+    rows = db.session.execute(insert(Client).returning(Client.phone_normalized, Client.id,
+                                                       sort_by_parameter_order=True), new_clients)
+    phone_index.update(rows.all())
+
+
+def import_clients(rows, result):
+    for chunk in _chunks(rows):
+        valid = _validate(chunk, prepare_client, result)
+        phone_index = _client_phone_index({client['phone_normalized'] for _, client in valid})
+        new_clients = {}
+        for row_number, client in valid:
+            phone = client['phone_normalized']
+            if phone in phone_index or phone in new_clients:
+                result.duplicates += 1
+            else:
+                new_clients[phone] = client
+        _insert_clients(list(new_clients.values()), phone_index)
+        db.session.commit()
+        result.inserted += len(new_clients)
+
+
+def import_orders(rows, result):
+    status_ids = {name.lower(): status_id for status_id, name in db.session.query(OrderStatus.id, OrderStatus.name)}
+
+    for chunk in _chunks(rows):
+        valid = _validate(chunk, lambda row: prepare_order(row, status_ids), result)
+        phone_index = _client_phone_index({normalize_phone(order['client_phone'])
+                                           for _, order in valid if not order['client_id']})
+
+        # Клиенты по телефону: существующие находятся по нормализованному номеру, новые создаются
+        new_clients = {}
+        for _, order in valid:
+            phone = normalize_phone(order['client_phone'])
+            if not order['client_id'] and phone not in phone_index and phone not in new_clients:
+                new_clients[phone] = {'name': order['client_name'], 'phone': order['client_phone'],
+                                      'phone_normalized': phone, 'email': '', 'address': '',
+                                      'created_at': datetime.now()}
+        _insert_clients(list(new_clients.values()), phone_index)
+
+        requested_ids = {order['client_id'] for _, order in valid if order['client_id']}
+        known_ids = {client_id for (client_id,) in
+                     db.session.query(Client.id).filter(Client.id.in_(requested_ids))} if requested_ids else set()
+
+        orders = []
+        for row_number, order in valid:
+            client_id = order.pop('client_id')
+            client_phone = order.pop('client_phone')
+            order.pop('client_name')
+            if not client_id:
+                client_id = phone_index[normalize_phone(client_phone)]
+            elif client_id not in known_ids:
+                result.add_error(row_number, 'клиент {} не найден'.format(client_id))
+                continue
+            order['client_id'] = client_id
+            orders.append(order)
+
+        if orders:
+            order_ids = db.session.scalars(insert(Order).returning(Order.id, sort_by_parameter_order=True),
+                                           orders).all()
+            ledger.record_order_rows(orders)
+            lifecycle.open_history_rows(order_ids, orders)
+        db.session.commit()
+        result.inserted += len(orders)
+
+
+def _upsert_spare_parts(parts):
+    """Карточки запчастей по артикулу; остаток не трогается, новые получают 0. Возвращает {артикул: id}"""
+    if not parts:
+        return {}
+    # INSERT ... ON CONFLICT (article) DO UPDATE: поддерживают и SQLite, и PostgreSQL
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    statement = dialect_insert(SparePart)
+    statement = statement.on_conflict_do_update(
+        index_elements=[SparePart.article],
+        set_={column: statement.excluded[column]
+              for column in ('name', 'min_stock', 'cost_price', 'retail_price')}
+    ).returning(SparePart.article, SparePart.id)
+    return dict(db.session.execute(statement, [dict(part, quantity=0) for part in parts]).all())
+
+
+def _receive(part_id, quantity):
+    # Остаток меняется только движением склада, чтобы журнал сходился с остатком
+    if quantity:
+        stock.receive(part_id, quantity, comment=STOCK_COMMENT)
+
+
+def import_spare_parts(rows, result):
+    """Количество в файле — все запчасти на складе вместе с резервом (как в выгрузке).
+
+    Новые позиции приходуются, у существующих разница записывается корректировкой;
+    количество меньше текущего резерва отклоняется.
+    """
+    for chunk in _chunks(rows):
+        by_article = {}
+        without_article = []
+        for row_number, part in _validate(chunk, prepare_spare_part, result):
+            if part['article']:
+                by_article[part['article']] = (row_number, part)  # последняя строка с артикулом побеждает
+            else:
+                without_article.append((row_number, part))
+
+        if by_article:
+            existing = {article: (quantity, reserved) for article, quantity, reserved in
+                        db.session.query(SparePart.article, SparePart.quantity, SparePart.reserved)
+                        .filter(SparePart.article.in_(by_article))}
+            for article, (quantity, reserved) in existing.items():
+                row_number, part = by_article[article]
+                if part['quantity'] < reserved:
+                    result.add_error(row_number, 'количество {} меньше резерва {}'.format(part['quantity'], reserved))
+                    del by_article[article]
+            part_ids = _upsert_spare_parts([part for _, part in by_article.values()])
+            for article, (row_number, part) in by_article.items():
+                if article not in existing:
+                    _receive(part_ids[article], part['quantity'])
+                    continue
+                quantity, reserved = existing[article]
+                try:
+                    stock.adjust(part_ids[article], part['quantity'] - reserved - (quantity or 0),
+                                 comment=STOCK_COMMENT)
+                except stock.StockError as e:
+                    result.add_error(row_number, str(e))
+            updated = len(set(by_article) & set(existing))
+            result.updated += updated
+            result.inserted += len(by_article) - updated
+        if without_article:
+            part_ids = db.session.scalars(insert(SparePart).returning(SparePart.id, sort_by_parameter_order=True),
+                                          [dict(part, quantity=0) for _, part in without_article]).all()
+            for part_id, (_, part) in zip(part_ids, without_article):
+                _receive(part_id, part['quantity'])
+            result.inserted += len(without_article)
+        db.session.commit()
+
+
+IMPORTERS = {
+    'clients': import_clients,
+    'orders': import_orders,
+    'spare_parts': import_spare_parts
+}
+
+
+def run_import(kind, stream, file_format='csv'):
+    """Загружает файл; неверные строки пропускаются и попадают в отчет об ошибках"""
+    result = ImportResult()
+    try:
+        IMPORTERS[kind](read_rows(stream, kind, file_format), result)
+    except (csv.Error, json.JSONDecodeError, UnicodeDecodeError) as e:
+        db.session.rollback()
+        result.add_error(None, 'файл не читается: {}'.format(e))
+    return result
+
+
+def open_upload(file_storage):
+    """Текстовый поток загруженного файла; BOM из выгрузки в Excel отбрасывается"""
+    return io.TextIOWrapper(file_storage.stream, encoding='utf-8-sig', newline='')
+
+
+import_cli = AppGroup('import', help='Массовая загрузка клиентов, заказов и запчастей.')
+
+
+@import_cli.command('run')
+@click.argument('kind', type=click.Choice(IMPORT_KINDS))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'file_format', type=click.Choice(IMPORT_FORMATS),
+              help='Формат файла; по умолчанию определяется по расширению.')
+def import_command(kind, path, file_format):
+    """Загрузить KIND из файла PATH (CSV или JSON)."""
+    file_format = file_format or ('json' if path.lower().endswith(('.json', '.jsonl')) else 'csv')
+    started = datetime.now()
+    with open(path, encoding='utf-8-sig', newline='') as stream:
+        result = run_import(kind, stream, file_format)
+
+    for row_number, message in result.sorted_errors():
+        click.echo('Строка {}: {}'.format(row_number, message))
+    click.echo('Добавлено: {}, обновлено: {}, дубликатов: {}, ошибок: {}, время: {:.1f} с'.format(
+        result.inserted, result.updated, result.duplicates, len(result.errors),
+        (datetime.now() - started).total_seconds()))
@@ -0,0 +1,251 @@
+import atexit
+import logging
+import threading
+from datetime import datetime
+
+from sqlalchemy import func, insert, select, update
+
+from models import db, normalize_phone, BuyRequest, Client, Order, OrderStatus
+from cache import TTLCache
+import ledger
+import lifecycle
+from lifecycle import NEW_STATUS_ID
+
+
+logger = logging.getLogger(__name__)
+
+# Сколько необработанных заявок допускается, прежде чем прием отвечает 503
+INTAKE_QUEUE_SIZE = 1000
+INTAKE_BATCH_SIZE = 100
+# Сколько ждать новых заявок, прежде чем сохранить неполную пачку
+INTAKE_FLUSH_SECONDS = 0.5
+# Как часто поток проверяет заявки, оставшиеся от остановленных воркеров
+INTAKE_SWEEP_SECONDS = 10
+
+# Статусы для публичной проверки: {id заказа: (нормализованный телефон, ответ)}
+STATUS_CACHE_TTL = 30
+# Отсутствующий заказ кэшируется ненадолго: он может вот-вот появиться
+MISSING_STATUS_TTL = 5
+status_cache = TTLCache(maxsize=10000, ttl=STATUS_CACHE_TTL)
+
+REQUEST_FIELDS = ('name', 'phone', 'phone_normalized', 'model', 'condition', 'description', 'created_at')
+
+
+def buy_request_item(form):
+    """Заявка на скупку из формы; телефон сразу нормализуется"""
+    return {
+        'name': form['name'].strip(),
+        'phone': form['phone'].strip(),
+        'phone_normalized': normalize_phone(form['phone']),
+        'model': form['model'].strip(),
+        'condition': form['condition'],
+        'description': form.get('description', ''),
+        'created_at': datetime.now()
+    }
+
+
+def _create_orders(items):
+    """Клиенты и заказы по заявкам в текущей транзакции; возвращает id заказов в порядке заявок.
+
+    Клиенты ищутся по нормализованному телефону: повторное обращение
+    не создает нового клиента.
+    """
+    phones = {item['phone_normalized'] for item in items}
+    clients = dict(db.session.query(Client.phone_normalized, Client.id).filter(Client.phone_normalized.in_(phones)))
+
+    new_clients = {}
+    for item in items:
+        phone = item['phone_normalized']
+        if phone not in clients and phone not in new_clients:
+            new_clients[phone] = Client(name=item['name'], phone=item['phone'], email='', address='',
+                                        created_at=item['created_at'])
+    if new_clients:
+        db.session.add_all(new_clients.values())
+        db.session.flush()
+        clients.update((phone, client.id) for phone, client in new_clients.items())
+
+    orders = [{
+        'client_id': clients[item['phone_normalized']],
+        'washing_machine_model': item['model'],
+        'condition': item['condition'],
+        'description': item['description'],
+        'status_id': NEW_STATUS_ID,
+        'created_at': item['created_at']
+    } for item in items]
+    order_ids = db.session.scalars(insert(Order).returning(Order.id, sort_by_parameter_order=True), orders).all()
+    ledger.record_order_rows(orders)
+    lifecycle.open_history_rows(order_ids, orders)
+    return order_ids
+
+
+def save_buy_requests(items):
+    """Сохраняет пачку заявок одной транзакцией. Возвращает число созданных заказов"""
+    order_ids = _create_orders(items)
+    db.session.commit()
+    return len(order_ids)
+
+
+def pending_buy_requests():
+    return db.session.scalar(select(func.count(BuyRequest.id)).where(BuyRequest.processed_at.is_(None)))
+
+
+def process_buy_requests(batch_size=INTAKE_BATCH_SIZE):
+    """Создает заказы по ожидающим заявкам, не больше batch_size за раз. Возвращает число обработанных заявок.
+
+    Заявки забираются тем же UPDATE, что отмечает их обработанными, и в той же
+    транзакции, что создает заказы: воркер, остановленный посреди пачки, ничего
+    не фиксирует, и заявки заберет следующий. В журнал пишутся только число и id
+    заявок — имена и телефоны посетителей в нем не нужны.
+    """
+    now = datetime.now()
+    pending = (select(BuyRequest.id).where(BuyRequest.processed_at.is_(None))
+               .order_by(BuyRequest.id).limit(batch_size))
+    # processed_at проверяется и снаружи: параллельный воркер мог забрать строку после подзапроса
+    rows = db.session.execute(update(BuyRequest)
+                              .where(BuyRequest.id.in_(pending), BuyRequest.processed_at.is_(None))
+                              .values(processed_at=now)
+                              .returning(BuyRequest.id, *(getattr(BuyRequest, name) for name in REQUEST_FIELDS))
+                              .execution_options(synchronize_session=False)).all()
+    if not rows:
+        db.session.rollback()
+        return 0
+    rows.sort(key=lambda row: row.id)
+    ids = [row.id for row in rows]
+
+    try:
+        order_ids = _create_orders([{name: getattr(row, name) for name in REQUEST_FIELDS} for row in rows])
+        db.session.execute(update(BuyRequest), [{'id': request_id, 'order_id': order_id}
+                                                for request_id, order_id in zip(ids, order_ids)])
+        db.session.commit()
+        return len(rows)
+    except Exception as error:
+        db.session.rollback()
+        # Текст ошибки базы содержит параметры запроса, то есть данные посетителей: пишется только ее тип
+        logger.error('Не удалось сохранить %s заявок (id %s): %s', len(ids), ids, type(error).__name__)
+        if len(rows) > 1:
+            # Пачка разбирается по одной заявке, чтобы одна ошибочная не задерживала остальные
+            return sum(process_buy_requests(1) for _ in rows)
+        db.session.execute(update(BuyRequest).where(BuyRequest.id == ids[0])
+                           .values(processed_at=now, error=type(error).__name__[:200]))
+        db.session.commit()
+        return 1
+
+
+class IntakeQueue:
+    """Прием публичных заявок: заявка сохраняется в базе до ответа, заказы создает фоновый поток пачками"""
+
+    def __init__(self, app, maxsize, batch_size, flush_seconds, sweep_seconds):
+        self.app = app
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.sweep_seconds = sweep_seconds
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, item):
+        """Сохраняет заявку и будит поток; False, если необработанных заявок слишком много"""
+        if pending_buy_requests() >= self.maxsize:
+            return False
+        db.session.add(BuyRequest(**item))
+        db.session.commit()
+        self._ensure_worker()
+        self._wakeup.set()
+        return True
+
+    def _ensure_worker(self):
+        if self._stopping.is_set() or (self._thread is not None and self._thread.is_alive()):
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='intake-worker', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            # Без новых заявок поток просыпается раз в sweep_seconds и забирает брошенные другими воркерами
+            if self._wakeup.wait(self.sweep_seconds):
+                # Короткая пауза собирает заявки, пришедшие следом, в одну пачку
+                self._stopping.wait(self.flush_seconds)
+            self._wakeup.clear()
+            self._drain()
+        self._drain()
+
+    def _drain(self):
+        with self.app.app_context():
+            try:
+                while process_buy_requests(self.batch_size) == self.batch_size:
+                    pass
+            except Exception as error:
+                db.session.rollback()
+                # Заявки остались в базе и будут обработаны при следующей проверке
+                logger.error('Обработка заявок прервана: %s', type(error).__name__)
+            finally:
+                db.session.remove()
+
+    def stop(self, timeout=10):
+        """Обрабатывает ожидающие заявки и останавливает поток; необработанные остаются в базе"""
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None and self._thread.is_alive():
+            self._thread.join(timeout)
+
+
+def init_intake(app):
+    """Прием заявок: INTAKE_ASYNC=False создает заказ сразу, в том же запросе"""
+    intake = IntakeQueue(app,
+                         app.config.get('INTAKE_QUEUE_SIZE', INTAKE_QUEUE_SIZE),
+                         app.config.get('INTAKE_BATCH_SIZE', INTAKE_BATCH_SIZE),
+                         app.config.get('INTAKE_FLUSH_SECONDS', INTAKE_FLUSH_SECONDS),
+                         app.config.get('INTAKE_SWEEP_SECONDS', INTAKE_SWEEP_SECONDS))
+    app.extensions['intake'] = intake
+    if app.config.get('INTAKE_ASYNC', True):
+        # Поток запускается с первым запросом воркера, а не при импорте: gunicorn с preload форкает процесс
+        app.before_request(intake._ensure_worker)
+    atexit.register(intake.stop)
+
+
+def submit_buy_request(app, item):
+    if not app.config.get('INTAKE_ASYNC', True):
+        save_buy_requests([item])
+        return True
+    return app.extensions['intake'].submit(item)
+
+
+def lookup_order_status(order_id):
+    """Телефон клиента и публичные данные заказа: (телефон, ответ) или (None, None).
+
+    Результат, в том числе отсутствие заказа, кэшируется, чтобы перебор
+    номеров заказов и телефонов не нагружал базу.
+    """
+    cached = status_cache.get(order_id)
+    if cached is not None:
+        return cached
+
+    row = (db.session.query(Client.phone_normalized, OrderStatus.name, Order.washing_machine_model,
+                            Order.description)
+           .select_from(Order)
+           .join(Client, Order.client_id == Client.id)
+           .join(OrderStatus, Order.status_id == OrderStatus.id)
+           .filter(Order.id == order_id)
+           .first())
+    if row is None:
+        status_cache.set(order_id, (None, None), MISSING_STATUS_TTL)
+        return None, None
+    phone, status, model, description = row
+    result = (phone, {'status': status, 'model': model, 'description': description})
+    status_cache.set(order_id, result)
+    return result
+
+
+def forget_order_status(order_id):
+    """Сбрасывает кэш публичного статуса после изменения или удаления заказа"""
+    status_cache.pop(order_id)
+
+
+def forget_client_statuses(client_id):
+    """Сбрасывает кэш статусов заказов клиента: после смены телефона прежний номер не должен подходить"""
+    for order_id in db.session.scalars(select(Order.id).where(Order.client_id == client_id)):
+        status_cache.pop(order_id)
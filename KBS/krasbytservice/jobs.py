@@ -0,0 +1,453 @@
+import atexit
+import hashlib
+import importlib
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import date, datetime, timedelta
+
+import click
+from flask import current_app, g
+from flask.cli import AppGroup
+from sqlalchemy import func, select, update
+from werkzeug.datastructures import MultiDict
+
+from models import db, Job
+from money import json_default
+from report_engine import REPORT_TYPES, build_report
+from export import EXPORT_FORMATS, EXPORT_KINDS, export_filters, iter_csv, write_xlsx
+
+
+logger = logging.getLogger(__name__)
+
+JOB_KINDS = ('report', 'export')
+ACTIVE_STATUSES = ('queued', 'running')
+
+# Пул: сколько задач выполняется одновременно
+JOBS_MAX_WORKERS = 2
+# Сколько задач может ждать в очереди и сколько активных задач у одного пользователя
+JOBS_MAX_QUEUED = 20
+JOBS_PER_USER = 3
+# Сколько секунд готовый результат отдается на такой же запрос без пересчета
+JOBS_RESULT_TTL = 300
+# Задача, которая так долго в работе, считается прерванной (процесс перезапущен)
+JOBS_TIMEOUT = 3600
+# Как часто пул отмечает свои задачи живыми и через сколько секунд без отметки задача прервана
+JOBS_HEARTBEAT = 15
+JOBS_HEARTBEAT_TIMEOUT = 60
+JOBS_RETENTION_DAYS = 7
+
+# Приложение, в контексте которого выполняются задачи; в процессах пула его задает _init_worker
+_worker_app = None
+
+
+class JobError(ValueError):
+    """Задачу нельзя поставить, отменить или получить ее результат"""
+
+
+class JobLimitError(JobError):
+    """Превышен лимит одновременных задач"""
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def _report_params(params):
+    if params.get('type') not in REPORT_TYPES:
+        raise JobError('Неизвестный тип отчета: {}'.format(params.get('type')))
+    try:
+        date_from = date.fromisoformat(params.get('date_from') or '')
+        date_to = date.fromisoformat(params.get('date_to') or '')
+    except ValueError:
+        raise JobError('Даты отчета должны быть в формате ГГГГ-ММ-ДД')
+    if date_from > date_to:
+        raise JobError('Дата начала периода позже даты окончания')
+    return {
+        'type': params['type'],
+        'date_from': date_from.isoformat(),
+        'date_to': date_to.isoformat(),
+        'status_id': params.get('status_id') or 'all',
+        'employee_id': params.get('employee_id') or 'all',
+        'stock_level': params.get('stock_level') or 'all'
+    }
+
+
+def _export_params(params):
+    if params.get('kind') not in EXPORT_KINDS:
+        raise JobError('Неизвестный вид выгрузки: {}'.format(params.get('kind')))
+    export_format = params.get('format') or 'csv'
+    if export_format not in EXPORT_FORMATS:
+        raise JobError('Неизвестный формат выгрузки: {}'.format(export_format))
+    args = {key: str(value) for key, value in (params.get('args') or {}).items() if value not in (None, '')}
+    return {'kind': params['kind'], 'format': export_format, 'args': args}
+
+
+def normalize_params(kind, params):
+    """Проверенные параметры задачи: только известные поля, даты строками"""
+    if kind == 'report':
+        return _report_params(params)
+    if kind == 'export':
+        return _export_params(params)
+    raise JobError('Неизвестный вид задачи: {}'.format(kind))
+
+
+def params_key(kind, params):
+    raw = json.dumps([kind, params], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class Progress:
+    """Записывает ход задачи и прерывает ее, если пользователь запросил отмену.
+
+    Запросы идут в основную базу, даже если отчет читает данные с реплики.
+    """
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+
+    def __call__(self, percent, message=None):
+        db.session.execute(update(Job).where(Job.id == self.job_id).values(progress=percent, message=message),
+                           bind_arguments={'bind': db.engine})
+        db.session.commit()
+        self.check()
+
+    def check(self):
+        cancelled = db.session.execute(select(Job.cancel_requested).where(Job.id == self.job_id),
+                                       bind_arguments={'bind': db.engine}).scalar()
+        if cancelled:
+            raise JobCancelled()
+
+
+def run_report(job, params, progress):
+    g.use_replica = True
+    report = build_report(params['type'], date.fromisoformat(params['date_from']),
+                          date.fromisoformat(params['date_to']), params, progress=progress)
+    return {'result': json.dumps(report, ensure_ascii=False, default=json_default)}
+
+
+def run_export(job, params, progress):
+    kind, export_format = params['kind'], params['format']
+    filters = export_filters(kind, MultiDict(params['args']))
+    directory = current_app.config.get('JOBS_DIR') or os.path.join(current_app.instance_path, 'jobs')
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, '{}.{}'.format(job.id, export_format))
+
+    progress(10, 'Выгрузка строк')
+    if export_format == 'xlsx':
+        write_xlsx(kind, path, **filters)
+    else:
+        with open(path, 'w', encoding='utf-8', newline='') as output:
+            for chunk in iter_csv(kind, **filters):
+                output.write(chunk)
+                progress.check()
+    filename = '{}_{}.{}'.format(kind, datetime.now().strftime('%Y%m%d_%H%M'), export_format)
+    return {'result_path': path, 'result': json.dumps({'filename': filename}, ensure_ascii=False)}
+
+
+JOB_HANDLERS = {
+    'report': run_report,
+    'export': run_export
+}
+
+
+def _finish(job_id, status, **fields):
+    values = dict(status=status, finished_at=datetime.now(), **fields)
+    if status == 'done':
+        values.update(progress=100, message=None)
+    db.session.execute(update(Job).where(Job.id == job_id, Job.status.in_(ACTIVE_STATUSES)).values(**values))
+    db.session.commit()
+
+
+def run_job(job_id):
+    """Выполняет задачу в процессе (или потоке) пула"""
+    with _worker_app.app_context():
+        try:
+            # Отмененная в очереди задача не запускается
+            started = db.session.execute(
+                update(Job)
+                .where(Job.id == job_id, Job.status == 'queued', Job.cancel_requested.is_(False))
+                .values(status='running', started_at=datetime.now())).rowcount
+            db.session.commit()
+            if not started:
+                return
+            job = db.session.get(Job, job_id)
+            try:
+                result = JOB_HANDLERS[job.kind](job, json.loads(job.params), Progress(job_id))
+            except JobCancelled:
+                db.session.rollback()
+                _finish(job_id, 'cancelled', message='Отменено')
+            except Exception as e:
+                db.session.rollback()
+                logger.exception('Задача %s (%s) завершилась ошибкой', job_id, job.kind)
+                _finish(job_id, 'failed', error=str(e))
+            else:
+                _finish(job_id, 'done', **result)
+        finally:
+            db.session.remove()
+
+
+def _init_worker(app_module, config):
+    # Процесс пула запускается через spawn и сам создает приложение фабрикой модуля
+    global _worker_app
+    _worker_app = importlib.import_module(app_module).create_app(config)
+
+
+class JobRunner:
+    """Пул исполнителей задач процесса.
+
+    По умолчанию это пул процессов (JOBS_EXECUTOR='process'): тяжелый отчет
+    не конкурирует с веб-обработчиками за GIL. JOBS_EXECUTOR='thread'
+    выполняет задачи потоками этого же процесса.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.max_workers = app.config.get('JOBS_MAX_WORKERS', JOBS_MAX_WORKERS)
+        self.use_processes = app.config.get('JOBS_EXECUTOR', 'process') == 'process'
+        self.heartbeat = app.config.get('JOBS_HEARTBEAT', JOBS_HEARTBEAT)
+        self._executor = None
+        self._executor_id = None
+        self._futures = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    @property
+    def executor_id(self):
+        """Метка пула этого процесса: хост, pid и случайная часть на случай повторного pid.
+
+        Вычисляется в самом процессе: при preload gunicorn объект создается в мастере
+        и копируется в воркеры через fork
+        """
+        with self._lock:
+            if self._executor_id is None or self._executor_id.split(':')[-2] != str(os.getpid()):
+                self._executor_id = '{}:{}:{}'.format(socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8])
+            return self._executor_id
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._stopped.clear()
+                threading.Thread(target=self._heartbeat_loop, name='job-heartbeat', daemon=True).start()
+                if self.use_processes:
+                    # spawn, а не fork: процесс пула не наследует соединения с базой и блокировки потоков
+                    self._executor = ProcessPoolExecutor(
+                        self.max_workers, mp_context=multiprocessing.get_context('spawn'),
+                        initializer=_init_worker,
+                        initargs=(self.app.config.get('JOBS_APP_MODULE', 'app'),
+                                  {'SQLALCHEMY_DATABASE_URI': self.app.config['SQLALCHEMY_DATABASE_URI']}))
+                else:
+                    self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix='job')
+            return self._executor
+
+    def start(self, job_id):
+        future = self._get_executor().submit(run_job, job_id)
+        with self._lock:
+            self._futures[job_id] = future
+        future.add_done_callback(lambda done: self._done(job_id, done))
+
+    def _done(self, job_id, future):
+        self._futures.pop(job_id, None)
+        if future.cancelled() or future.exception() is None:
+            return
+        # Процесс пула упал, не дойдя до обработки ошибок в run_job
+        error = future.exception()
+        logger.error('Задача %s не выполнена: %r', job_id, error)
+        with self.app.app_context():
+            try:
+                _finish(job_id, 'failed', error=str(error) or error.__class__.__name__)
+            finally:
+                db.session.remove()
+        if isinstance(error, BrokenProcessPool):
+            with self._lock:
+                self._executor = None
+
+    def cancel(self, job_id):
+        """Убирает задачу из очереди пула, если она еще не начала выполняться"""
+        future = self._futures.get(job_id)
+        return future.cancel() if future else False
+
+    def _heartbeat_loop(self):
+        # Пока у пула есть задачи, он раз в heartbeat секунд отмечает их живыми
+        while not self._stopped.wait(self.heartbeat):
+            if not self._futures:
+                continue
+            with self.app.app_context():
+                try:
+                    db.session.execute(update(Job)
+                                       .where(Job.executor == self.executor_id, Job.status.in_(ACTIVE_STATUSES))
+                                       .values(heartbeat_at=datetime.now()))
+                    db.session.commit()
+                except Exception:
+                    logger.exception('Не удалось отметить задачи живыми')
+                finally:
+                    db.session.remove()
+
+    def shutdown(self):
+        self._stopped.set()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def init_jobs(app):
+    """Фоновые задачи: JOBS_EXECUTOR, JOBS_MAX_WORKERS, JOBS_MAX_QUEUED, JOBS_PER_USER, JOBS_RESULT_TTL"""
+    global _worker_app
+    _worker_app = app
+    runner = JobRunner(app)
+    app.extensions['jobs'] = runner
+    atexit.register(runner.shutdown)
+
+
+def _pid_alive(pid):
+    if os.name != 'posix':
+        # В Windows os.kill(pid, 0) посылает CTRL_C_EVENT, а не проверяет процесс
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def executor_alive(job, now=None):
+    """Жив ли пул, которому отдана задача.
+
+    Пул этого же хоста проверяется по pid, любой — по свежести сигнала жизни.
+    Задача без исполнителя поставлена до миграции 0006 и пережила перезапуск
+    """
+    if not job.executor:
+        return False
+    host, pid, _ = job.executor.rsplit(':', 2)
+    if host == socket.gethostname():
+        if int(pid) == os.getpid():
+            return job.executor == current_app.extensions['jobs'].executor_id
+        if not _pid_alive(int(pid)):
+            return False
+    now = now or datetime.now()
+    timeout = current_app.config.get('JOBS_HEARTBEAT_TIMEOUT', JOBS_HEARTBEAT_TIMEOUT)
+    return job.heartbeat_at is not None and job.heartbeat_at >= now - timedelta(seconds=timeout)
+
+
+def fail_dead_jobs(jobs=None):
+    """Закрывает активные задачи, пул которых остановлен (перезапуск, падение воркера); возвращает их число"""
+    if jobs is None:
+        jobs = Job.query.filter(Job.status.in_(ACTIVE_STATUSES)).all()
+    now = datetime.now()
+    dead = [job.id for job in jobs if job.status in ACTIVE_STATUSES and not executor_alive(job, now)]
+    if dead:
+        logger.warning('Задачи остановленного исполнителя помечены прерванными: %s', ', '.join(dead))
+        db.session.execute(update(Job)
+                           .where(Job.id.in_(dead), Job.status.in_(ACTIVE_STATUSES))
+                           .values(status='failed', finished_at=now, error='Задача прервана: исполнитель остановлен')
+                           .execution_options(synchronize_session='fetch'))
+        db.session.commit()
+    return len(dead)
+
+
+def _reusable_job(key, user_id):
+    # Такая же задача этого пользователя в работе или недавно выполнена — ее результат и отдается
+    fresh_after = datetime.now() - timedelta(seconds=current_app.config.get('JOBS_RESULT_TTL', JOBS_RESULT_TTL))
+    return (Job.query
+            .filter(Job.params_key == key,
+                    Job.user_id == user_id,
+                    (Job.status.in_(ACTIVE_STATUSES) & Job.cancel_requested.is_(False))
+                    | ((Job.status == 'done') & (Job.finished_at >= fresh_after)))
+            .order_by(Job.created_at.desc())
+            .first())
+
+
+def submit_job(kind, params, user_id=None):
+    """Ставит задачу в очередь или возвращает уже существующую с теми же параметрами"""
+    params = normalize_params(kind, params)
+    key = params_key(kind, params)
+    # Задачи остановленного пула не переиспользуются и не занимают лимиты
+    fail_dead_jobs()
+    job = _reusable_job(key, user_id)
+    if job is not None:
+        return job
+
+    config = current_app.config
+    user_active = Job.query.filter(Job.user_id == user_id, Job.status.in_(ACTIVE_STATUSES)).count()
+    if user_active >= config.get('JOBS_PER_USER', JOBS_PER_USER):
+        raise JobLimitError('Слишком много задач в работе, дождитесь их завершения')
+    queued = Job.query.filter(Job.status == 'queued').count()
+    if queued >= config.get('JOBS_MAX_QUEUED', JOBS_MAX_QUEUED):
+        raise JobLimitError('Очередь задач заполнена, попробуйте позже')
+
+    runner = current_app.extensions['jobs']
+    job = Job(id=uuid.uuid4().hex, kind=kind, params=json.dumps(params, ensure_ascii=False), params_key=key,
+              user_id=user_id, message='В очереди', executor=runner.executor_id, heartbeat_at=datetime.now())
+    db.session.add(job)
+    db.session.commit()
+    runner.start(job.id)
+    return job
+
+
+def cancel_job(job):
+    if job.status not in ACTIVE_STATUSES:
+        raise JobError('Задача уже завершена')
+    # Задача в работе остановится на ближайшей отметке хода выполнения
+    job.cancel_requested = True
+    if job.status == 'queued':
+        current_app.extensions['jobs'].cancel(job.id)
+        job.status = 'cancelled'
+        job.finished_at = datetime.now()
+        job.message = 'Отменено'
+    db.session.commit()
+
+
+def serialize_job(job):
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'progress': job.progress,
+        'message': job.message,
+        'error': job.error,
+        'created_at': job.created_at.strftime('%d.%m.%Y %H:%M:%S'),
+        'finished_at': job.finished_at.strftime('%d.%m.%Y %H:%M:%S') if job.finished_at else None
+    }
+
+
+def cleanup_jobs(days=JOBS_RETENTION_DAYS, timeout=JOBS_TIMEOUT):
+    """Удаляет старые задачи с файлами и закрывает зависшие; возвращает (удалено, прервано)"""
+    stale = fail_dead_jobs()
+    now = datetime.now()
+    stale += (Job.query
+             .filter(Job.status.in_(ACTIVE_STATUSES), Job.created_at < now - timedelta(seconds=timeout))
+             .update({Job.status: 'failed', Job.finished_at: now, Job.error: 'Задача прервана'},
+                     synchronize_session=False))
+    old = Job.query.filter(Job.status.notin_(ACTIVE_STATUSES), Job.finished_at < now - timedelta(days=days)).all()
+    for job in old:
+        if job.result_path and os.path.exists(job.result_path):
+            os.remove(job.result_path)
+        db.session.delete(job)
+    db.session.commit()
+    return len(old), stale
+
+
+jobs_cli = AppGroup('jobs', help='Фоновые задачи: отчеты и выгрузки.')
+
+
+@jobs_cli.command('cleanup')
+@click.option('--days', type=int, default=JOBS_RETENTION_DAYS, show_default=True,
+              help='Удалить завершенные задачи старше стольких дней.')
+def cleanup_command(days):
+    """Удалить старые задачи и их файлы, закрыть зависшие."""
+    removed, stale = cleanup_jobs(days)
+    click.echo('Удалено задач: {}, прервано зависших: {}'.format(removed, stale))
+
+
+@jobs_cli.command('status')
+def status_command():
+    """Количество задач по статусам."""
+    for status, count in db.session.query(Job.status, func.count(Job.id)).group_by(Job.status).order_by(Job.status):
+        click.echo('{:<10} {}'.format(status, count))
@@ -0,0 +1,201 @@
+from collections import defaultdict
+from datetime import date, datetime
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import func
+
+from models import db, Order, ProfitLedger, OrderRollup
+from money import ZERO, to_money
+from finance import expenses_expr, money_sum, order_amounts, order_category, order_category_expr, revenue_expr
+
+
+TOTAL_KEY = 'all'
+# Мастер в дневных итогах заказа без мастера: NULL не участвует в уникальности ключа
+NO_EMPLOYEE = 0
+
+
+def ledger_keys(created_at):
+    """Строки журнала, которые затрагивает заказ"""
+    return [
+        ('all', TOTAL_KEY),
+        ('day', created_at.strftime('%Y-%m-%d')),
+        ('month', created_at.strftime('%Y-%m'))
+    ]
+
+
+def _increment(model, keys, orders_count, revenue, expenses, **fields):
+    # Атомарное приращение одним INSERT ... ON CONFLICT: строка создается при первом заказе периода,
+    # и два одновременных первых заказа не вставят ее дважды
+    if db.session.get_bind().dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    statement = dialect_insert(model).values(orders_count=orders_count, revenue=revenue, expenses=expenses,
+                                             **keys, **fields)
+    statement = statement.on_conflict_do_update(
+        index_elements=list(keys),
+        set_={
+            'orders_count': model.orders_count + statement.excluded.orders_count,
+            'revenue': model.revenue + statement.excluded.revenue,
+            'expenses': model.expenses + statement.excluded.expenses
+        }
+    )
+    db.session.execute(statement)
+
+
+def record_order(order, sign=1):
+    """Учитывает заказ в журнале и дневных итогах (sign=-1 при удалении).
+
+    Вызывается до commit, поэтому итоги меняются в той же транзакции, что и заказ.
+    """
+    if order.created_at is None:
+        order.created_at = datetime.now()
+    revenue, expenses = order_amounts(order)
+    for period, period_key in ledger_keys(order.created_at):
+        _increment(ProfitLedger, {'period_key': period_key}, sign, sign * revenue, sign * expenses, period=period)
+    record_rollup(order, sign)
+
+
+def record_rollup(order, sign=1):
+    """Учитывает заказ только в дневных итогах: так заказ переносится к другому мастеру"""
+    revenue, expenses = order_amounts(order)
+    rollup_keys = {
+        'day': order.created_at.date(),
+        'status_id': int(order.status_id),
+        'category': order_category(order),
+        'employee_id': int(order.employee_id or NO_EMPLOYEE)
+    }
+    _increment(OrderRollup, rollup_keys, sign, sign * revenue, sign * expenses)
+
+
+def record_order_rows(rows):
+    """Учитывает пачку новых заказов, переданных словарями колонок.
+
+    Приращения суммируются заранее, поэтому каждая строка итогов обновляется
+    один раз на пачку, а не на каждый заказ.
+    """
+    ledger_deltas = defaultdict(lambda: [0, 0, 0])
+    rollup_deltas = defaultdict(lambda: [0, 0, 0])
+    for row in rows:
+        # Суммы в строках могут прийти float или строкой: складываются уже в копейках
+        revenue = to_money(row.get('sale_price')) or ZERO
+        expenses = (to_money(row.get('repair_costs')) or ZERO) + (to_money(row.get('purchase_price')) or ZERO)
+        category = 'resale' if row.get('purchase_price') else 'repair'
+        buckets = [ledger_deltas[key] for key in ledger_keys(row['created_at'])]
+        employee_id = int(row.get('employee_id') or NO_EMPLOYEE)
+        buckets.append(rollup_deltas[(row['created_at'].date(), int(row['status_id']), category, employee_id)])
+        for bucket in buckets:
+            bucket[0] += 1
+            bucket[1] += revenue
+            bucket[2] += expenses
+
+    for (period, period_key), values in ledger_deltas.items():
+        _increment(ProfitLedger, {'period_key': period_key}, *values, period=period)
+    for (day, status_id, category, employee_id), values in rollup_deltas.items():
+        _increment(OrderRollup, {'day': day, 'status_id': status_id, 'category': category, 'employee_id': employee_id},
+                   *values)
+
+
+def total_profit():
+    """Общая прибыль по всем заказам: чтение одной строки"""
+    row = ProfitLedger.query.filter_by(period_key=TOTAL_KEY).first()
+    return row.profit if row else 0
+
+
+def breakdown(period, date_from=None, date_to=None):
+    """Итоги по дням или месяцам за период (даты в формате ключа периода)"""
+    query = ProfitLedger.query.filter(ProfitLedger.period == period)
+    if date_from:
+        query = query.filter(ProfitLedger.period_key >= date_from)
+    if date_to:
+        query = query.filter(ProfitLedger.period_key <= date_to)
+    return query.order_by(ProfitLedger.period_key).all()
+
+
+def compute_rollups(since=None):
+    """Дневные итоги по заказам: {(день, статус, категория, мастер): (count, revenue, expenses)}"""
+    day = func.date(Order.created_at)
+    category = order_category_expr()
+    employee_id = func.coalesce(Order.employee_id, NO_EMPLOYEE)
+    query = db.session.query(day, Order.status_id, category, employee_id,
+                             func.count(Order.id),
+                             money_sum(revenue_expr()),
+                             money_sum(expenses_expr()))
+    if since:
+        query = query.filter(Order.created_at >= since)
+    rows = query.group_by(day, Order.status_id, category, employee_id).all()
+    return {(date.fromisoformat(str(day_key)), status_id, category_key, employee_key): (orders_count, revenue, expenses)
+            for day_key, status_id, category_key, employee_key, orders_count, revenue, expenses in rows}
+
+
+def compute_ledger(rollups):
+    """Итоги журнала из дневных итогов: {period_key: (period, count, revenue, expenses)}"""
+    totals = {}
+    for (day, *_), (orders_count, revenue, expenses) in rollups.items():
+        day_key = day.strftime('%Y-%m-%d')
+        for period, period_key in (('all', TOTAL_KEY), ('day', day_key), ('month', day_key[:7])):
+            _, count_sum, revenue_sum, expenses_sum = totals.get(period_key, (period, 0, 0, 0))
+            totals[period_key] = (period, count_sum + orders_count, revenue_sum + revenue, expenses_sum + expenses)
+    return totals
+
+
+def rebuild():
+    """Полная перестройка журнала и дневных итогов; возвращает число строк"""
+    rollups = compute_rollups()
+    totals = compute_ledger(rollups)
+
+    ProfitLedger.query.delete()
+    OrderRollup.query.delete()
+    db.session.add_all(ProfitLedger(period=period, period_key=period_key, orders_count=orders_count,
+                                    revenue=revenue, expenses=expenses)
+                       for period_key, (period, orders_count, revenue, expenses) in totals.items())
+    db.session.add_all(OrderRollup(day=day, status_id=status_id, category=category, employee_id=employee_id,
+                                   orders_count=orders_count, revenue=revenue, expenses=expenses)
+                       for (day, status_id, category, employee_id), (orders_count, revenue, expenses)
+                       in rollups.items())
+    db.session.commit()
+    return len(totals) + len(rollups)
+
+
+ROLLUP_LABEL = '{} / статус {} / {} / мастер {}'
+
+
+def verify():
+    """Сверка журнала и дневных итогов с заказами; возвращает список расхождений"""
+    rollups = compute_rollups()
+    expected = {key: values[1:] for key, values in compute_ledger(rollups).items()}
+    stored = {row.period_key: (row.orders_count, row.revenue, row.expenses) for row in ProfitLedger.query.all()}
+    expected.update((ROLLUP_LABEL.format(*key), values) for key, values in rollups.items())
+    stored.update((ROLLUP_LABEL.format(row.day, row.status_id, row.category, row.employee_id),
+                   (row.orders_count, row.revenue, row.expenses))
+                  for row in OrderRollup.query.all())
+
+    drift = []
+    for key in sorted(set(expected) | set(stored)):
+        actual = stored.get(key, (0, 0, 0))
+        wanted = expected.get(key, (0, 0, 0))
+        # Суммы в копейках, поэтому сверка точная, без допуска на погрешность
+        if actual != wanted:
+            drift.append((key, actual, wanted))
+    return drift
+
+
+ledger_cli = AppGroup('ledger', help='Журнал прибыли и дневные итоги по заказам.')
+
+
+@ledger_cli.command('rebuild')
+def rebuild_command():
+    """Пересчитать журнал прибыли и дневные итоги с нуля."""
+    click.echo('Журнал перестроен, строк: {}'.format(rebuild()))
+
+
+@ledger_cli.command('verify')
+def verify_command():
+    """Сверить журнал прибыли и дневные итоги с заказами."""
+    drift = verify()
+    for key, actual, expected in drift:
+        click.echo('{}: в журнале {}, по заказам {}'.format(key, actual, expected))
+    if drift:
+        raise click.ClickException('Найдено расхождений: {}'.format(len(drift)))
+    click.echo('Расхождений нет')
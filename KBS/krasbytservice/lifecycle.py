@@ -0,0 +1,201 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import exists, func, insert, select
+from sqlalchemy.orm.attributes import set_committed_value
+
+from models import db, Client, Order, OrderStatus, OrderStatusHistory
+from lookups import status_names
+import ledger
+
+
+NEW_STATUS_ID = 1  # Новая
+PROCESSING_STATUS_ID = 2  # В обработке
+REPAIR_STATUS_ID = 3  # В ремонте
+COMPLETED_STATUS_ID = 4  # Выполнена
+CANCELLED_STATUS_ID = 5  # Отменена
+
+# Разрешенные переходы: из статуса -> в какие статусы
+TRANSITIONS = {
+    NEW_STATUS_ID: (PROCESSING_STATUS_ID, REPAIR_STATUS_ID, CANCELLED_STATUS_ID),
+    PROCESSING_STATUS_ID: (REPAIR_STATUS_ID, COMPLETED_STATUS_ID, CANCELLED_STATUS_ID),
+    REPAIR_STATUS_ID: (PROCESSING_STATUS_ID, COMPLETED_STATUS_ID, CANCELLED_STATUS_ID),
+    COMPLETED_STATUS_ID: (REPAIR_STATUS_ID,),  # гарантийный возврат
+    CANCELLED_STATUS_ID: (NEW_STATUS_ID,)  # заявка возобновлена
+}
+
+# Сколько дней в ремонте считается зависанием по умолчанию
+STUCK_DAYS = 7
+
+
+class TransitionError(ValueError):
+    """Переход между статусами запрещен или статус уже изменен"""
+
+
+def allowed_statuses(status_id):
+    return TRANSITIONS.get(status_id, ())
+
+
+def backfill_history():
+    """Открывает историю для заказов без нее одним INSERT ... SELECT.
+
+    Промежуточные переходы таких заказов неизвестны, поэтому записывается
+    только текущий статус с датой выполнения или создания заказа.
+    """
+    has_history = exists().where(OrderStatusHistory.order_id == Order.id)
+    rows = (select(Order.id, Order.status_id, func.coalesce(Order.completed_at, Order.created_at))
+            .where(~has_history))
+    statement = insert(OrderStatusHistory).from_select(['order_id', 'to_status_id', 'changed_at'], rows)
+    return db.session.execute(statement).rowcount
+
+
+def open_history(order, user_id=None):
+    """Начальная запись истории для нового заказа (до commit)"""
+    if order.created_at is None:
+        order.created_at = datetime.now()
+    if order.status_id is not None:
+        order.status_id = int(order.status_id)
+    if order.status_id == COMPLETED_STATUS_ID and order.completed_at is None:
+        order.completed_at = order.created_at
+    db.session.flush()
+    db.session.add(OrderStatusHistory(order_id=order.id, to_status_id=order.status_id,
+                                      changed_at=order.created_at, user_id=user_id))
+
+
+def open_history_rows(order_ids, rows, user_id=None):
+    """То же для пачки заказов, вставленных словарями колонок"""
+    history = [{
+        'order_id': order_id,
+        'to_status_id': int(row['status_id']),
+        'changed_at': row.get('completed_at') or row['created_at'],
+        'user_id': user_id
+    } for order_id, row in zip(order_ids, rows)]
+    if history:
+        db.session.execute(insert(OrderStatusHistory), history)
+
+
+def change_status(order, status_id, user_id=None, comment=None):
+    """Переводит заказ в другой статус и записывает переход.
+
+    Статус меняется условным UPDATE по старому значению, поэтому из двух
+    одновременных переходов проходит только один. Дата выполнения ставится
+    при переходе в «Выполнена» и сбрасывается при возврате из него.
+    """
+    status_id = int(status_id)
+    from_status_id = order.status_id
+    if status_id == from_status_id:
+        raise TransitionError('Заказ уже в этом статусе')
+    if status_id not in allowed_statuses(from_status_id):
+        names = status_names()
+        raise TransitionError('Нельзя перевести заказ из статуса «{}» в «{}»'.format(
+            names.get(from_status_id, from_status_id), names.get(status_id, status_id)))
+
+    now = datetime.now()
+    if status_id == COMPLETED_STATUS_ID:
+        completed_at = now
+    elif from_status_id == COMPLETED_STATUS_ID:
+        completed_at = None
+    else:
+        completed_at = order.completed_at
+
+    updated = (Order.query
+               .filter(Order.id == order.id, Order.status_id == from_status_id)
+               .update({Order.status_id: status_id, Order.completed_at: completed_at},
+                       synchronize_session=False))
+    if not updated:
+        raise TransitionError('Статус заказа уже изменен другим пользователем')
+
+    # Дневные итоги ведутся по статусам: заказ переносится из старого статуса в новый
+    ledger.record_order(order, sign=-1)
+    set_committed_value(order, 'status_id', status_id)
+    set_committed_value(order, 'completed_at', completed_at)
+    db.session.expire(order, ['status'])
+    ledger.record_order(order)
+
+    (OrderStatusHistory.query
+     .filter(OrderStatusHistory.order_id == order.id, OrderStatusHistory.left_at.is_(None))
+     .update({OrderStatusHistory.left_at: now}, synchronize_session=False))
+    transition = OrderStatusHistory(order_id=order.id, from_status_id=from_status_id, to_status_id=status_id,
+                                    changed_at=now, user_id=user_id, comment=comment)
+    db.session.add(transition)
+    return transition
+
+
+def delete_history(order_ids):
+    """Удаляет историю заказов перед удалением самих заказов"""
+    if order_ids:
+        (OrderStatusHistory.query
+         .filter(OrderStatusHistory.order_id.in_(order_ids))
+         .delete(synchronize_session=False))
+
+
+def order_history(order_id):
+    """[(переход, название статуса)] в порядке времени"""
+    return (db.session.query(OrderStatusHistory, OrderStatus.name)
+            .join(OrderStatus, OrderStatusHistory.to_status_id == OrderStatus.id)
+            .filter(OrderStatusHistory.order_id == order_id)
+            .order_by(OrderStatusHistory.changed_at, OrderStatusHistory.id)
+            .all())
+
+
+def _days(start, end):
+    # Разница дат в днях: в SQLite даты хранятся строками
+    if db.engine.dialect.name == 'sqlite':
+        return func.julianday(end) - func.julianday(start)
+    return func.extract('epoch', end - start) / 86400
+
+
+def stuck_orders(status_id=REPAIR_STATUS_ID, days=STUCK_DAYS, limit=100):
+    """Заказы, которые дольше days дней находятся в статусе: открытые периоды истории"""
+    since = datetime.now() - timedelta(days=days)
+    return (db.session.query(Order.id, Client.name, Order.washing_machine_model, OrderStatusHistory.changed_at)
+            .select_from(OrderStatusHistory)
+            .join(Order, OrderStatusHistory.order_id == Order.id)
+            .join(Client, Order.client_id == Client.id)
+            .filter(OrderStatusHistory.to_status_id == status_id,
+                    OrderStatusHistory.left_at.is_(None),
+                    OrderStatusHistory.changed_at <= since)
+            .order_by(OrderStatusHistory.changed_at)
+            .limit(limit)
+            .all())
+
+
+def _period(date_from, date_to):
+    return datetime.combine(date_from, datetime.min.time()), datetime.combine(date_to, datetime.max.time())
+
+
+def status_durations(date_from, date_to, employee_id=None):
+    """Сколько дней заказы провели в каждом статусе: периоды, закончившиеся в [date_from, date_to]"""
+    period_start, period_end = _period(date_from, date_to)
+    days = _days(OrderStatusHistory.changed_at, OrderStatusHistory.left_at)
+    query = (db.session.query(OrderStatusHistory.to_status_id, func.count(), func.avg(days), func.max(days))
+             .filter(OrderStatusHistory.left_at >= period_start, OrderStatusHistory.left_at <= period_end))
+    if employee_id:
+        query = (query.join(Order, Order.id == OrderStatusHistory.order_id)
+                 .filter(Order.employee_id == employee_id))
+    rows = query.group_by(OrderStatusHistory.to_status_id).all()
+    names = status_names()
+    return [{
+        'name': names.get(status_id, str(status_id)),
+        'count': count,
+        'avg_days': round(avg_days or 0, 1),
+        'max_days': round(max_days or 0, 1)
+    } for status_id, count, avg_days, max_days in sorted(rows)]
+
+
+def turnaround(date_from, date_to, category=None, employee_id=None):
+    """Срок выполнения заказов, выполненных в [date_from, date_to]: от создания до выполнения"""
+    period_start, period_end = _period(date_from, date_to)
+    days = _days(Order.created_at, Order.completed_at)
+    query = (db.session.query(func.count(Order.id), func.avg(days), func.max(days))
+             .filter(Order.completed_at >= period_start, Order.completed_at <= period_end,
+                     Order.status_id == COMPLETED_STATUS_ID))
+    if category:
+        query = query.filter(ledger.order_category_expr() == category)
+    if employee_id:
+        query = query.filter(Order.employee_id == employee_id)
+    count, avg_days, max_days = query.one()
+    return {
+        'count': count,
+        'avg_days': round(avg_days or 0, 1),
+        'max_days': round(max_days or 0, 1)
+    }
@@ -0,0 +1,92 @@
+from collections import namedtuple
+
+from flask_login import UserMixin
+
+from models import db, Employee, OrderStatus, User
+from cache import TTLCache
+from httpcache import table_versions
+
+
+# Справочники меняются редко, а нужны почти каждому запросу: они кэшируются в процессе.
+# Ключ кэша — версия таблицы (data_version), поэтому правка в любом процессе видна
+# не позже, чем истечет кэш версий (httpcache.VERSION_TTL); TTL только освобождает память
+LOOKUP_TTL = 300
+USER_TTL = 300
+
+BADGE_CLASSES = ('primary', 'secondary', 'success', 'danger', 'warning', 'info', 'light', 'dark')
+DEFAULT_BADGE_CLASS = 'secondary'
+
+StatusRow = namedtuple('StatusRow', 'id name description badge_class')
+EmployeeRow = namedtuple('EmployeeRow', 'id name position is_active')
+
+lookup_cache = TTLCache(maxsize=64, ttl=LOOKUP_TTL)
+user_cache = TTLCache(maxsize=1000, ttl=USER_TTL)
+
+
+def _cached(name, table, load):
+    # Версия входит в ключ: запрос, прочитавший справочник до его изменения,
+    # сохранит устаревшие данные под старой версией, и их никто не прочитает
+    key = (name, table_versions((table,)))
+    return lookup_cache.get_or_set(key, load)
+
+
+def statuses():
+    return _cached('statuses', 'order_status', lambda: tuple(
+        StatusRow(status.id, status.name, status.description, status.badge_class or DEFAULT_BADGE_CLASS)
+        for status in OrderStatus.query.order_by(OrderStatus.id)))
+
+
+def status_map():
+    return _cached('status_map', 'order_status', lambda: {status.id: status for status in statuses()})
+
+
+def status_names():
+    return {status.id: status.name for status in statuses()}
+
+
+def status_name(status_id):
+    status = status_map().get(status_id)
+    return status.name if status else str(status_id)
+
+
+def badge_class(status_id):
+    """Класс CSS для статуса из справочника статусов"""
+    status = status_map().get(status_id)
+    return status.badge_class if status else DEFAULT_BADGE_CLASS
+
+
+def employees():
+    return _cached('employees', 'employee', lambda: tuple(
+        EmployeeRow(employee.id, employee.name, employee.position, employee.is_active)
+        for employee in Employee.query.order_by(Employee.id)))
+
+
+def employee_map():
+    return _cached('employee_map', 'employee', lambda: {employee.id: employee for employee in employees()})
+
+
+def employee_name(employee_id):
+    """Имя мастера из справочника сотрудников, None если мастер не назначен"""
+    employee = employee_map().get(employee_id)
+    return employee.name if employee else None
+
+
+class SessionUser(UserMixin):
+    """Пользователь сессии без привязки к сессии SQLAlchemy: один объект безопасно делят потоки"""
+
+    def __init__(self, user):
+        self.id = user.id
+        self.username = user.username
+        self.role = user.role
+
+
+def session_user(user_id):
+    """Пользователь для flask-login из кэша; отсутствующий тоже кэшируется.
+
+    Ключ включает версию таблицы пользователей: удаленный пользователь или
+    смена роли в любом процессе сбрасывают кэш без ожидания USER_TTL
+    """
+    def load():
+        user = db.session.get(User, user_id)
+        return SessionUser(user) if user else None
+    return user_cache.get_or_set((user_id, table_versions(('user',))), load)
@@ -0,0 +1,371 @@
+import atexit
+import cProfile
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+
+from flask import before_render_template, g, has_app_context, request, template_rendered
+from sqlalchemy import event
+
+from models import db
+
+
+logger = logging.getLogger(__name__)
+
+METRICS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+
+# Длина текста запроса в журнале медленных запросов
+SLOW_QUERY_LOG_LENGTH = 1000
+
+# Как часто воркер сохраняет свои метрики в METRICS_DIR
+METRICS_FLUSH_SECONDS = 5
+# Файл, в который складываются метрики завершившихся воркеров
+ARCHIVE_NAME = 'archive.json'
+
+try:
+    import fcntl
+except ImportError:  # Windows: там один процесс (waitress), общий каталог метрик не нужен
+    fcntl = None
+
+
+def _label_text(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                          for name, value in zip(names, values)) + '}'
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.values = {}
+
+    def inc(self, amount=1, *label_values):
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    @staticmethod
+    def merge(total, value):
+        return (total or 0) + value
+
+    def render(self, values=None):
+        lines = ['# HELP {} {}'.format(self.name, self.help_text), '# TYPE {} counter'.format(self.name)]
+        for label_values, value in sorted((self.values if values is None else values).items()):
+            lines.append('{}{} {}'.format(self.name, _label_text(self.labels, label_values), value))
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.labels = labels
+        # {значения меток: [счетчики по корзинам..., сумма, количество]}
+        self.values = {}
+
+    def observe(self, value, *label_values):
+        series = self.values.get(label_values)
+        if series is None:
+            series = self.values[label_values] = [0] * (len(self.buckets) + 2)
+        index = bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            series[index] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    @staticmethod
+    def merge(total, series):
+        return [a + b for a, b in zip(total, series)] if total else list(series)
+
+    def render(self, values=None):
+        lines = ['# HELP {} {}'.format(self.name, self.help_text), '# TYPE {} histogram'.format(self.name)]
+        for label_values, series in sorted((self.values if values is None else values).items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                labels = _label_text(self.labels + ('le',), label_values + (bound,))
+                lines.append('{}_bucket{} {}'.format(self.name, labels, cumulative))
+            labels = _label_text(self.labels + ('le',), label_values + ('+Inf',))
+            lines.append('{}_bucket{} {}'.format(self.name, labels, series[-1]))
+            labels = _label_text(self.labels, label_values)
+            lines.append('{}_sum{} {}'.format(self.name, labels, round(series[-2], 6)))
+            lines.append('{}_count{} {}'.format(self.name, labels, series[-1]))
+        return lines
+
+
+ROUTE_LABELS = ('endpoint', 'method')
+
+REQUESTS = Counter('kbs_http_requests_total', 'HTTP-запросы по представлениям и кодам ответа',
+                   ROUTE_LABELS + ('status',))
+REQUEST_LATENCY = Histogram('kbs_http_request_duration_seconds', 'Время обработки запроса',
+                            LATENCY_BUCKETS, ROUTE_LABELS)
+REQUEST_QUERIES = Histogram('kbs_http_request_sql_queries', 'SQL-запросов за HTTP-запрос',
+                            QUERY_COUNT_BUCKETS, ROUTE_LABELS)
+REQUEST_SQL_TIME = Histogram('kbs_http_request_sql_seconds', 'Суммарное время SQL за HTTP-запрос',
+                             LATENCY_BUCKETS, ROUTE_LABELS)
+TEMPLATE_RENDER = Histogram('kbs_template_render_seconds', 'Время отрисовки шаблонов',
+                            LATENCY_BUCKETS, ('template',))
+SQL_STATEMENTS = Counter('kbs_sql_statements_total', 'Все SQL-запросы, включая CLI и фоновые задачи')
+SLOW_QUERIES = Counter('kbs_sql_slow_queries_total', 'SQL-запросы дольше SLOW_QUERY_MS', ('endpoint',))
+EXCEPTIONS = Counter('kbs_http_exceptions_total', 'Необработанные исключения в представлениях', ('endpoint',))
+OVERHEAD = Counter('kbs_instrumentation_seconds_total', 'Время, затраченное самим слоем метрик')
+
+METRICS = (REQUESTS, REQUEST_LATENCY, REQUEST_QUERIES, REQUEST_SQL_TIME, TEMPLATE_RENDER,
+           SQL_STATEMENTS, SLOW_QUERIES, EXCEPTIONS, OVERHEAD)
+
+_lock = threading.Lock()
+
+
+def _snapshot():
+    with _lock:
+        return {metric.name: [[list(labels), value] for labels, value in metric.values.items()] for metric in METRICS}
+
+
+def _merge(totals, snapshot):
+    for metric in METRICS:
+        values = totals.setdefault(metric.name, {})
+        for labels, value in snapshot.get(metric.name, ()):
+            labels = tuple(labels)
+            values[labels] = metric.merge(values.get(labels), value)
+    return totals
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class MetricsStore:
+    """Метрики всех воркеров gunicorn через общий каталог.
+
+    Счетчики живут в памяти процесса; воркер сохраняет их в <pid>.json не чаще
+    раза в flush_seconds, а /metrics складывает файлы всех воркеров. Файлы
+    завершившихся воркеров переносятся в archive.json, чтобы счетчики не
+    уменьшались после перезапуска воркера.
+    """
+
+    def __init__(self, directory, flush_seconds=METRICS_FLUSH_SECONDS):
+        self.directory = directory
+        self.flush_seconds = flush_seconds
+        self._flushed = 0.0
+        self._flush_lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _read(self, name):
+        try:
+            with open(self._path(name), encoding='utf-8') as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def _write(self, name, snapshot):
+        # Запись через временный файл: читатель не увидит файл наполовину
+        temporary = self._path('{}.{}.tmp'.format(name, threading.get_ident()))
+        with open(temporary, 'w', encoding='utf-8') as file:
+            json.dump(snapshot, file)
+        os.replace(temporary, self._path(name))
+
+    def flush(self, force=False):
+        """Сохраняет метрики процесса; без force — не чаще раза в flush_seconds"""
+        now = time.monotonic()
+        if not force and now - self._flushed < self.flush_seconds:
+            return
+        if not self._flush_lock.acquire(blocking=force):
+            return
+        try:
+            self._flushed = now
+            self._write('{}.json'.format(os.getpid()), _snapshot())
+        finally:
+            self._flush_lock.release()
+
+    def close(self):
+        # При завершении процесса: последние числа воркера попадают в его файл
+        try:
+            self.flush(force=True)
+        except OSError:
+            logger.warning('Не удалось сохранить метрики в %s', self.directory)
+
+    def _archive_dead(self):
+        with open(self._path('.lock'), 'w') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            archive = None
+            for name in os.listdir(self.directory):
+                pid = name[:-len('.json')]
+                if not (name.endswith('.json') and pid.isdigit()) or _pid_alive(int(pid)):
+                    continue
+                if archive is None:
+                    archive = _merge({}, self._read(ARCHIVE_NAME))
+                _merge(archive, self._read(name))
+                os.remove(self._path(name))
+            if archive is not None:
+                self._write(ARCHIVE_NAME, {metric: [[list(labels), value] for labels, value in values.items()]
+                                           for metric, values in archive.items()})
+
+    def collect(self):
+        """Сумма метрик всех воркеров: {имя метрики: {метки: значение}}"""
+        self.flush(force=True)
+        self._archive_dead()
+        totals = {}
+        for name in os.listdir(self.directory):
+            if name.endswith('.json'):
+                _merge(totals, self._read(name))
+        return totals
+
+
+def reset_metrics():
+    """Обнуляет метрики процесса: воркер после fork не должен повторять числа мастера"""
+    with _lock:
+        for metric in METRICS:
+            metric.values.clear()
+
+
+def clear_metrics_dir(directory):
+    """Удаляет метрики прошлого запуска сервера (вызывается из gunicorn при старте)"""
+    if os.path.isdir(directory):
+        for name in os.listdir(directory):
+            if name.endswith(('.json', '.tmp')):
+                os.remove(os.path.join(directory, name))
+
+
+def render_metrics(store=None):
+    """Все метрики в текстовом формате Prometheus: сумма по воркерам, если задан store"""
+    if store is not None:
+        totals = store.collect()
+        lines = []
+        for metric in METRICS:
+            lines.extend(metric.render(totals.get(metric.name, {})))
+        return '\n'.join(lines) + '\n'
+    with _lock:
+        lines = []
+        for metric in METRICS:
+            lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+def _endpoint():
+    return request.endpoint or 'unknown'
+
+
+def _profile_path(app):
+    directory = app.config.get('PROFILE_DIR') or os.path.join(app.instance_path, 'profiles')
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, '{}-{}.prof'.format(_endpoint(), time.strftime('%Y%m%d-%H%M%S')))
+
+
+def init_metrics(app):
+    """Метрики запросов, SQL и шаблонов для /metrics.
+
+    Включается METRICS_ENABLED (по умолчанию включено). Запросы дольше
+    SLOW_QUERY_MS пишутся в лог с текстом и числом параметров, без их
+    значений. При PROFILING_ENABLED запрос с параметром ?profile=1
+    профилируется cProfile, результат сохраняется в PROFILE_DIR и его путь
+    возвращается в X-Profile.
+
+    Метрики хранятся в памяти процесса. Если воркеров несколько (gunicorn),
+    задайте METRICS_DIR: воркеры сохраняют метрики туда, и /metrics отдает
+    их сумму. Без METRICS_DIR /metrics показывает только ответивший процесс.
+    """
+    if not app.config.get('METRICS_ENABLED', True):
+        return
+    store = None
+    if app.config.get('METRICS_DIR'):
+        store = MetricsStore(app.config['METRICS_DIR'],
+                             app.config.get('METRICS_FLUSH_SECONDS', METRICS_FLUSH_SECONDS))
+        app.extensions['metrics'] = store
+        atexit.register(store.close)
+    slow_query_seconds = app.config.get('SLOW_QUERY_MS', 200) / 1000
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context._metrics_started = time.perf_counter()
+
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        finished = time.perf_counter()
+        elapsed = finished - context._metrics_started
+        in_request = has_app_context() and 'request_started' in g
+        if in_request:
+            g.sql_time += elapsed
+        slow = elapsed >= slow_query_seconds
+        if slow:
+            endpoint = _endpoint() if in_request else 'cli'
+            # Значения параметров в журнал не пишутся: среди них имена и телефоны посетителей
+            details = '{}: {}'.format('строк' if executemany else 'параметров', len(parameters or ()))
+            logger.warning('Медленный SQL (%.0f мс, %s): %s; %s', elapsed * 1000, endpoint,
+                           ' '.join(statement.split())[:SLOW_QUERY_LOG_LENGTH], details)
+        with _lock:
+            SQL_STATEMENTS.inc()
+            if slow:
+                SLOW_QUERIES.inc(1, endpoint)
+            OVERHEAD.inc(time.perf_counter() - finished)
+
+    with app.app_context():
+        for engine in db.engines.values():
+            event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', after_cursor_execute)
+
+    def template_started(sender, template, context, **extra):
+        if 'request_started' in g:
+            g.template_started = time.perf_counter()
+
+    def template_finished(sender, template, context, **extra):
+        if 'template_started' in g:
+            elapsed = time.perf_counter() - g.pop('template_started')
+            with _lock:
+                TEMPLATE_RENDER.observe(elapsed, template.name or 'string')
+
+    # weak=False: обработчики локальные и иначе будут собраны сборщиком мусора
+    before_render_template.connect(template_started, app, weak=False)
+    template_rendered.connect(template_finished, app, weak=False)
+
+    @app.before_request
+    def start_request_metrics():
+        g.sql_time = 0.0
+        if app.config.get('PROFILING_ENABLED') and request.args.get('profile'):
+            g.profiler = cProfile.Profile()
+            g.profiler.enable()
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def profile_response(response):
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            profiler.disable()
+            path = _profile_path(app)
+            profiler.dump_stats(path)
+            response.headers['X-Profile'] = path
+        g.response_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def record_request_metrics(exc):
+        if 'request_started' not in g:
+            return
+        finished = time.perf_counter()
+        elapsed = finished - g.pop('request_started')
+        labels = (_endpoint(), request.method)
+        with _lock:
+            REQUESTS.inc(1, *labels, g.get('response_status', 500))
+            REQUEST_LATENCY.observe(elapsed, *labels)
+            REQUEST_QUERIES.observe(g.get('sql_statements', 0), *labels)
+            REQUEST_SQL_TIME.observe(g.get('sql_time', 0.0), *labels)
+            if exc is not None:
+                EXCEPTIONS.inc(1, labels[0])
+            OVERHEAD.inc(time.perf_counter() - finished)
+        if store is not None:
+            store.flush()
@@ -0,0 +1,619 @@
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import (BigInteger, Boolean, Column, Date, DateTime, Float, ForeignKey, ForeignKeyConstraint, Index,
+                        Integer, MetaData, String, Table, Text, UniqueConstraint, exists, func, inspect, select, text)
+
+from models import (db, BuyRequest, Client, EmployeeCompletion, EmployeeWorkload, Order, OrderRollup,
+                    OrderStatusHistory, SparePart)
+from queries import filtered_orders_query, order_amount
+from search import init_search_index
+from stock import low_stock_condition
+import employees
+import ledger
+
+
+# Примененные миграции; таблица не входит в модели, чтобы create_all ее не трогал
+schema_migration = Table(
+    'schema_migration', MetaData(),
+    Column('version', Integer, primary_key=True),
+    Column('name', String(100), nullable=False),
+    Column('applied_at', DateTime, nullable=False)
+)
+
+Migration = namedtuple('Migration', 'version name upgrade downgrade')
+MIGRATIONS = []
+
+
+def migration(version, name, downgrade):
+    """Регистрирует функцию как upgrade миграции с номером version.
+
+    Миграции повторяемы: каждая проверяет, что уже сделано, поэтому база,
+    созданная до появления миграций, проходит их без ошибок.
+    downgrade=None — миграция необратима, откат до нее запрещен.
+    """
+    def decorator(upgrade):
+        MIGRATIONS.append(Migration(version, name, upgrade, downgrade))
+        MIGRATIONS.sort()
+        return upgrade
+    return decorator
+
+
+# Операции со схемой
+
+def _columns(table):
+    return {column['name'] for column in inspect(db.engine).get_columns(table)}
+
+
+def _column_types(table):
+    return {column['name']: column['type'] for column in inspect(db.engine).get_columns(table)}
+
+
+def _indexes(table):
+    return {index['name'] for index in inspect(db.engine).get_indexes(table)}
+
+
+def _execute(*statements):
+    with db.engine.begin() as connection:
+        for statement in statements:
+            connection.execute(text(statement))
+
+
+def add_column(table, name, ddl):
+    if name not in _columns(table):
+        _execute('ALTER TABLE "{}" ADD COLUMN {} {}'.format(table, name, ddl))
+
+
+def rebuild_table(table, drop=(), types=None, values=None):
+    """Пересоздает таблицу SQLite копированием строк.
+
+    SQLite не удаляет колонку из табличного FOREIGN KEY и не меняет тип колонки,
+    поэтому такие изменения делаются через копию: drop — удаляемые колонки,
+    types — {колонка: новый тип}, values — {колонка: SQL-выражение для копирования}.
+    Триггеры полнотекстового поиска создаются заново.
+    """
+    types = types or {}
+    values = values or {}
+    # Вся схема в одних метаданных, чтобы внешние ключи копии нашли свои таблицы
+    metadata = MetaData()
+    metadata.reflect(db.engine)
+    source = metadata.tables[table]
+    columns = []
+    for column in source.columns:
+        if column.name in drop:
+            continue
+        column = column._copy()
+        column.type = types.get(column.name, column.type)
+        columns.append(column)
+    target = Table(table + '_rebuild', metadata, *columns,
+                   *[ForeignKeyConstraint(constraint.column_keys,
+                                          [element.target_fullname for element in constraint.elements])
+                     for constraint in source.foreign_key_constraints if not set(drop) & set(constraint.column_keys)],
+                   *[UniqueConstraint(*constraint.columns.keys(), name=constraint.name)
+                     for constraint in source.constraints
+                     if isinstance(constraint, UniqueConstraint) and not set(drop) & set(constraint.columns.keys())])
+    names = ', '.join('"{}"'.format(column.name) for column in target.columns)
+    selected = ', '.join(values.get(column.name, '"{}"'.format(column.name)) for column in target.columns)
+    # Индексы модели создаются по ее описанию: отражение теряет условие частичного индекса
+    model = db.metadata.tables.get(table)
+    model_indexes = {index.name: index for index in model.indexes} if model is not None else {}
+    with db.engine.begin() as connection:
+        target.create(connection)
+        connection.execute(text('INSERT INTO "{}_rebuild" ({}) SELECT {} FROM "{}"'.format(
+            table, names, selected, table)))
+        connection.execute(text('DROP TABLE "{}"'.format(table)))
+        connection.execute(text('ALTER TABLE "{0}_rebuild" RENAME TO "{0}"'.format(table)))
+        for index in source.indexes:
+            if index.name in model_indexes:
+                model_indexes[index.name].create(connection)
+                continue
+            connection.execute(text('CREATE {}INDEX "{}" ON "{}" ({})'.format(
+                'UNIQUE ' if index.unique else '', index.name, table,
+                ', '.join('"{}"'.format(column.name) for column in index.columns))))
+    init_search_index()
+
+
+def drop_column(table, name):
+    """Удаляет колонку вместе с ее индексами"""
+    if name not in _columns(table):
+        return
+    for index in inspect(db.engine).get_indexes(table):
+        if name in index['column_names']:
+            drop_index(table, index['name'])
+    if db.engine.dialect.name != 'sqlite':
+        _execute('ALTER TABLE "{}" DROP COLUMN {}'.format(table, name))
+        return
+    rebuild_table(table, drop=(name,))
+
+
+def change_column_types(table, changes):
+    """Меняет тип колонок с пересчетом значений.
+
+    changes — {колонка: (новый тип, SQL-выражение с {0} на месте колонки)}.
+    """
+    if not changes:
+        return
+    if db.engine.dialect.name != 'sqlite':
+        _execute(*['ALTER TABLE "{}" ALTER COLUMN "{}" TYPE {} USING {}'.format(
+            table, name, type_.compile(dialect=db.engine.dialect), expression.format('"{}"'.format(name)))
+            for name, (type_, expression) in changes.items()])
+        return
+    rebuild_table(table, types={name: type_ for name, (type_, _) in changes.items()},
+                  values={name: expression.format('"{}"'.format(name)) for name, (_, expression) in changes.items()})
+
+
+def create_model_indexes(table, *names):
+    """Создает индексы, объявленные в модели (все, если имена не заданы)"""
+    for index in table.indexes:
+        if not names or index.name in names:
+            index.create(db.engine, checkfirst=True)
+
+
+def drop_index(table, name):
+    if name in _indexes(table):
+        _execute('DROP INDEX "{}"'.format(name))
+
+
+# Миграции
+
+# Схема на момент появления миграций. Описана явно, а не моделями: модели меняются
+# вместе со следующими миграциями, а 0001 должна создавать одну и ту же схему всегда
+baseline = MetaData()
+
+Table('user', baseline,
+      Column('id', Integer, primary_key=True),
+      Column('username', String(80), unique=True, nullable=False),
+      Column('password_hash', String(120), nullable=False),
+      Column('role', String(20), nullable=False))
+
+Table('client', baseline,
+      Column('id', Integer, primary_key=True),
+      Column('name', String(100), nullable=False),
+      Column('phone', String(20), nullable=False),
+      Column('phone_normalized', String(20), index=True),
+      Column('email', String(100)),
+      Column('address', Text),
+      Column('created_at', DateTime))
+
+Table('order_status', baseline,
+      Column('id', Integer, primary_key=True),
+      Column('name', String(50), nullable=False),
+      Column('description', Text),
+      Column('badge_class', String(20)))
+
+Table('order', baseline,
+      Column('id', Integer, primary_key=True),
+      Column('client_id', Integer, ForeignKey('client.id'), nullable=False, index=True),
+      Column('washing_machine_model', String(100), nullable=False),
+      Column('condition', Text),
+      Column('description', Text),
+      Column('purchase_price', Float),
+      Column('repair_costs', Float),
+      Column('sale_price', Float),
+      Column('status_id', Integer, ForeignKey('order_status.id'), nullable=False, index=True),
+      Column('created_at', DateTime, index=True),
+      Column('completed_at', DateTime, index=True),
+      Index('ix_order_created_at_id', 'created_at', 'id'))
+
+Table('order_status_history', baseline,
+      Column('id', Integer, primary_key=True),
+      Column('order_id', Integer, ForeignKey('order.id'), nullable=False),
+      Column('from_status_id', Integer, ForeignKey('order_status.id')),
+      Column('to_status_id', Integer, ForeignKey('order_status.id'), nullable=False),
+      Column('changed_at', DateTime, nullable=False),
+      Column('left_at', DateTime),
+      Column('user_id', Integer, ForeignKey('user.id')),
+      Column('comment', Text),
+      Index('ix_status_history_order', 'order_id', 'changed_at'),
+      Index('ix_status_history_left_status', 'left_at', 'to_status_id', 'changed_at'))
+
+Table('spare_part', baseline,
+      Column('id', Integer, primary_key=True),
+      Column('name', String(100), nullable=False),
+      Column('article', String(50), unique=True),
+      Column('quantity', Integer),
+      Column('reserved', Integer, nullable=False, server_default='0'),
+      Column('cost_price', Float),
+      Column('retail_price', Float),
+      Column('min_stock', Integer),
+      Index('ix_spare_part_low_stock', 'quantity',
+            sqlite_where=text('quantity <= min_stock'),
+            postgresql_where=text('quantity <= min_stock')))
+
+Table('stock_reservation', baseline,
+      Column('id', Integer, primary_key=True),
+      Column('order_id', Integer, ForeignKey('order.id'), nullable=False, index=True),
+      Column('spare_part_id', Integer, ForeignKey('spare_part.id'), nullable=False, index=True),
+      Column('quantity', Integer, nullable=False),
+      Column('status', String(20), nullable=False),
+      Column('created_at', DateTime),
+      Column('closed_at', DateTime))
+
+Table('stock_movement', baseline,
+      Column('id', Integer, primary_key=True),
+      Column('spare_part_id', Integer, nullable=False),
+      Column('kind', String(20), nullable=False),
+      Column('quantity', Integer, nullable=False),
+      Column('balance', Integer),
+      Column('order_id', Integer, index=True),
+      Column('reservation_id', Integer),
+      Column('user_id', Integer),
+      Column('comment', Text),
+      Column('created_at', DateTime),
+      Index('ix_stock_movement_part_created', 'spare_part_id', 'created_at'))
+
+Table('employee', baseline,
+      Column('id', Integer, primary_key=True),
+      Column('name', String(100), nullable=False),
+      Column('position', String(50)),
+      Column('phone', String(20)),
+      Column('email', String(100)),
+      Column('salary', Float),
+      Column('hire_date', DateTime))
+
+Table('profit_ledger', baseline,
+      Column('id', Integer, primary_key=True),
+      Column('period', String(10), nullable=False),
+      Column('period_key', String(10), unique=True, nullable=False),
+      Column('orders_count', Integer, nullable=False),
+      Column('revenue', Float, nullable=False),
+      Column('expenses', Float, nullable=False))
+
+Table('order_rollup', baseline,
+      Column('id', Integer, primary_key=True),
+      Column('day', Date, nullable=False),
+      Column('status_id', Integer, nullable=False),
+      Column('category', String(20), nullable=False),
+      Column('orders_count', Integer, nullable=False),
+      Column('revenue', Float, nullable=False),
+      Column('expenses', Float, nullable=False),
+      UniqueConstraint('day', 'status_id', 'category', name='uq_order_rollup_day_status_category'))
+
+Table('job', baseline,
+      Column('id', String(32), primary_key=True),
+      Column('kind', String(20), nullable=False),
+      Column('params', Text, nullable=False),
+      Column('params_key', String(64), nullable=False),
+      Column('status', String(20), nullable=False),
+      Column('progress', Integer, nullable=False),
+      Column('message', String(200)),
+      Column('cancel_requested', Boolean, nullable=False),
+      Column('result', Text),
+      Column('result_path', String(255)),
+      Column('error', Text),
+      Column('user_id', Integer, ForeignKey('user.id')),
+      Column('created_at', DateTime, nullable=False),
+      Column('started_at', DateTime),
+      Column('finished_at', DateTime),
+      Index('ix_job_params_key_status', 'params_key', 'status', 'finished_at'),
+      Index('ix_job_user_status', 'user_id', 'status'))
+
+Table('data_version', baseline,
+      Column('name', String(50), primary_key=True),
+      Column('version', Integer, nullable=False),
+      Column('updated_at', DateTime, nullable=False))
+
+
+# Цвета стандартных статусов для базы, созданной до появления колонки badge_class
+BASELINE_BADGE_CLASSES = {1: 'primary', 2: 'info', 3: 'warning', 4: 'success', 5: 'danger'}
+
+
+def _backfill_baseline():
+    # Начальная запись истории для заказов без нее и цвета статусов; только по таблицам baseline
+    order = baseline.tables['order']
+    history = baseline.tables['order_status_history']
+    status = baseline.tables['order_status']
+    rows = (select(order.c.id, order.c.status_id, func.coalesce(order.c.completed_at, order.c.created_at))
+            .where(~exists().where(history.c.order_id == order.c.id)))
+    with db.engine.begin() as connection:
+        connection.execute(history.insert().from_select(['order_id', 'to_status_id', 'changed_at'], rows))
+        for status_id, badge_class in BASELINE_BADGE_CLASSES.items():
+            connection.execute(status.update()
+                               .where(status.c.id == status_id, status.c.badge_class.is_(None))
+                               .values(badge_class=badge_class))
+
+
+# Необратима: в базе, созданной до миграций, таблицы 0001 содержат рабочие данные
+@migration(1, 'initial', None)
+def _initial():
+    # Недостающие таблицы базовой схемы; таблицы старой базы остаются как есть,
+    # а колонки, которые раньше добавлялись при запуске приложения, дополняются
+    baseline.create_all(db.engine, checkfirst=True)
+    add_column('order', 'completed_at', 'DATETIME')
+    add_column('spare_part', 'reserved', 'INTEGER NOT NULL DEFAULT 0')
+    add_column('order_status', 'badge_class', 'VARCHAR(20)')
+    init_search_index()
+    # create_all не добавляет индексы в уже существующие таблицы
+    for table in baseline.sorted_tables:
+        for index in table.indexes:
+            index.create(db.engine, checkfirst=True)
+    _backfill_baseline()
+
+
+def _drop_order_employee():
+    drop_column('order', 'employee_id')
+
+
+@migration(2, 'order_employee', _drop_order_employee)
+def _order_employee():
+    add_column('order', 'employee_id', 'INTEGER REFERENCES employee (id)')
+    create_model_indexes(Order.__table__, 'ix_order_employee_created')
+
+
+def _drop_order_hot_indexes():
+    _execute('CREATE INDEX IF NOT EXISTS ix_order_status_id ON "order" (status_id)',
+             'CREATE INDEX IF NOT EXISTS ix_order_client_id ON "order" (client_id)',
+             'CREATE INDEX IF NOT EXISTS ix_order_created_at ON "order" (created_at)')
+    drop_index('order', 'ix_order_status_created')
+    drop_index('order', 'ix_order_client_created')
+
+
+@migration(3, 'order_hot_indexes', _drop_order_hot_indexes)
+def _order_hot_indexes():
+    # Составные индексы заменяют одиночные: фильтр по колонке и сразу нужный порядок строк.
+    # ix_order_created_at повторял начало ix_order_created_at_id
+    create_model_indexes(Order.__table__)
+    for name in ('ix_order_status_id', 'ix_order_client_id', 'ix_order_created_at'):
+        drop_index('order', name)
+
+
+# Суммы, которые хранились в Float, а теперь в целых копейках (money.Money)
+MONEY_COLUMNS = {
+    'order': ('purchase_price', 'repair_costs', 'sale_price'),
+    'spare_part': ('cost_price', 'retail_price'),
+    'employee': ('salary',),
+    'profit_ledger': ('revenue', 'expenses'),
+    'order_rollup': ('revenue', 'expenses'),
+}
+
+
+def _convert_money(to_kopecks):
+    for table, columns in MONEY_COLUMNS.items():
+        types = _column_types(table)
+        # Повторный запуск пропускает уже переведенные колонки
+        pending = [name for name in columns if isinstance(types[name], Integer) != to_kopecks]
+        if to_kopecks:
+            change_column_types(table, {name: (BigInteger(), 'CAST(ROUND({0} * 100) AS BIGINT)') for name in pending})
+        else:
+            change_column_types(table, {name: (Float(), '{0} / 100.0') for name in pending})
+
+
+def _money_to_rubles():
+    _convert_money(to_kopecks=False)
+
+
+@migration(4, 'money_kopecks', _money_to_rubles)
+def _money_to_kopecks():
+    # ROUND убирает хвосты двоичной дроби, накопленные во Float (0.1 + 0.2 = 0.30000000000000004)
+    _convert_money(to_kopecks=True)
+
+
+def _drop_employee_workload():
+    EmployeeCompletion.__table__.drop(db.engine, checkfirst=True)
+    EmployeeWorkload.__table__.drop(db.engine, checkfirst=True)
+    drop_column('employee', 'is_active')
+
+
+@migration(5, 'employee_workload', _drop_employee_workload)
+def _employee_workload():
+    add_column('employee', 'is_active', "BOOLEAN NOT NULL DEFAULT '1'")
+    EmployeeWorkload.__table__.create(db.engine, checkfirst=True)
+    EmployeeCompletion.__table__.create(db.engine, checkfirst=True)
+    # Счетчики заполняются по уже существующим заказам
+    employees.rebuild()
+
+
+def _drop_job_executor():
+    drop_column('job', 'heartbeat_at')
+    drop_column('job', 'executor')
+
+
+@migration(6, 'job_executor', _drop_job_executor)
+def _job_executor():
+    # Задачи, оставшиеся активными после перезапуска, распознаются по исполнителю и его сигналу жизни
+    add_column('job', 'executor', 'VARCHAR(100)')
+    add_column('job', 'heartbeat_at', 'DATETIME')
+
+
+def _drop_buy_request():
+    BuyRequest.__table__.drop(db.engine, checkfirst=True)
+
+
+@migration(7, 'buy_request', _drop_buy_request)
+def _buy_request():
+    # Публичные заявки сохраняются в базе до ответа и не теряются при остановке воркера
+    BuyRequest.__table__.create(db.engine, checkfirst=True)
+
+
+# Дневные итоги до разбивки по мастерам (суммы уже в копейках)
+order_rollup_v7 = Table(
+    'order_rollup', MetaData(),
+    Column('id', Integer, primary_key=True),
+    Column('day', Date, nullable=False),
+    Column('status_id', Integer, nullable=False),
+    Column('category', String(20), nullable=False),
+    Column('orders_count', Integer, nullable=False),
+    Column('revenue', BigInteger, nullable=False),
+    Column('expenses', BigInteger, nullable=False),
+    UniqueConstraint('day', 'status_id', 'category', name='uq_order_rollup_day_status_category')
+)
+
+
+def _drop_order_rollup_employee():
+    if 'employee_id' not in _columns('order_rollup'):
+        return
+    # Итоги мастеров складываются обратно в строку дня, статуса и категории
+    with db.engine.begin() as connection:
+        connection.execute(text(
+            'CREATE TABLE order_rollup_merged AS '
+            'SELECT day, status_id, category, SUM(orders_count) AS orders_count, SUM(revenue) AS revenue, '
+            'SUM(expenses) AS expenses FROM order_rollup GROUP BY day, status_id, category'))
+        OrderRollup.__table__.drop(connection)
+        order_rollup_v7.create(connection)
+        connection.execute(text(
+            'INSERT INTO order_rollup (day, status_id, category, orders_count, revenue, expenses) '
+            'SELECT day, status_id, category, orders_count, revenue, expenses FROM order_rollup_merged'))
+        connection.execute(text('DROP TABLE order_rollup_merged'))
+
+
+@migration(8, 'order_rollup_employee', _drop_order_rollup_employee)
+def _order_rollup_employee():
+    if 'employee_id' in _columns('order_rollup'):
+        return
+    # Мастер входит в ключ дневных итогов, чтобы отчет по мастеру читался из них.
+    # Итоги выводятся из заказов: таблица создается заново и пересчитывается
+    OrderRollup.__table__.drop(db.engine)
+    OrderRollup.__table__.create(db.engine)
+    ledger.rebuild()
+
+
+# Применение
+
+def _applied():
+    schema_migration.create(db.engine, checkfirst=True)
+    with db.engine.connect() as connection:
+        return {row.version: row for row in connection.execute(select(schema_migration))}
+
+
+def current_version():
+    return max(_applied(), default=0)
+
+
+def upgrade(target=None):
+    """Применяет недостающие миграции до target (по умолчанию до последней)"""
+    applied = _applied()
+    done = []
+    for step in MIGRATIONS:
+        if target is not None and step.version > target:
+            break
+        if step.version in applied:
+            continue
+        step.upgrade()
+        with db.engine.begin() as connection:
+            connection.execute(schema_migration.insert().values(version=step.version, name=step.name,
+                                                                applied_at=datetime.now()))
+        done.append(step)
+    return done
+
+
+def downgrade(target):
+    """Откатывает миграции новее target в обратном порядке.
+
+    Если среди них есть необратимая, ничего не откатывается.
+    """
+    applied = _applied()
+    steps = [step for step in reversed(MIGRATIONS) if step.version > target and step.version in applied]
+    irreversible = [step for step in steps if step.downgrade is None]
+    if irreversible:
+        raise click.ClickException('Миграция {:04d} {} необратима, откат до версии {} невозможен'.format(
+            irreversible[0].version, irreversible[0].name, target))
+    done = []
+    for step in steps:
+        step.downgrade()
+        with db.engine.begin() as connection:
+            connection.execute(schema_migration.delete().where(schema_migration.c.version == step.version))
+        done.append(step)
+    return done
+
+
+# Проверка планов: каждый частый запрос должен читать таблицу по индексу
+
+def hot_queries():
+    """[(название, запрос, индекс)] для запросов списков, карточек и отчетов"""
+    since = datetime.now() - timedelta(days=30)
+    newest_first = (Order.created_at.desc(), Order.id.desc())
+    return [
+        ('список заказов', filtered_orders_query().order_by(*newest_first).limit(50),
+         'ix_order_created_at_id'),
+        ('заказы по статусу', filtered_orders_query(status_id=1).order_by(*newest_first).limit(50),
+         'ix_order_status_created'),
+        ('количество по статусам', db.session.query(Order.status_id, func.count(Order.id)).group_by(Order.status_id),
+         'ix_order_status_created'),
+        ('заказы клиента', Order.query.filter(Order.client_id.in_([1, 2])),
+         'ix_order_client_created'),
+        ('статистика клиента',
+         db.session.query(func.count(Order.id), func.sum(order_amount()), func.max(Order.created_at))
+         .filter(Order.client_id == 1),
+         'ix_order_client_created'),
+        ('заказы мастера', Order.query.filter(Order.employee_id == 1).order_by(Order.created_at.desc()),
+         'ix_order_employee_created'),
+        ('выполненные за период', Order.query.filter(Order.completed_at >= since),
+         'ix_order_completed_at'),
+        ('история заказа',
+         OrderStatusHistory.query.filter(OrderStatusHistory.order_id == 1).order_by(OrderStatusHistory.changed_at),
+         'ix_status_history_order'),
+        ('зависшие заказы',
+         OrderStatusHistory.query.filter(OrderStatusHistory.to_status_id == 3, OrderStatusHistory.left_at.is_(None),
+                                         OrderStatusHistory.changed_at <= since),
+         'ix_status_history_left_status'),
+        ('низкий запас', SparePart.query.filter(low_stock_condition()).order_by(SparePart.quantity, SparePart.id),
+         'ix_spare_part_low_stock'),
+        ('поиск клиента по телефону', Client.query.filter(Client.phone_normalized == '79001234567'),
+         'ix_client_phone_normalized'),
+    ]
+
+
+def explain(query):
+    """План запроса SQLite (EXPLAIN QUERY PLAN) одной строкой"""
+    statement = getattr(query, 'statement', query)
+    sql = str(statement.compile(dialect=db.engine.dialect, compile_kwargs={'literal_binds': True}))
+    with db.engine.connect() as connection:
+        rows = connection.execute(text('EXPLAIN QUERY PLAN ' + sql)).all()
+    return '; '.join(row[-1] for row in rows)
+
+
+def check_indexes():
+    """[(название, индекс, план, используется ли индекс)]"""
+    if db.engine.dialect.name != 'sqlite':
+        raise click.UsageError('Проверка планов поддерживается только для SQLite')
+    results = []
+    for name, query, index in hot_queries():
+        plan = explain(query)
+        results.append((name, index, plan, 'INDEX {}'.format(index) in plan))
+    return results
+
+
+schema_cli = AppGroup('schema', help='Миграции схемы базы данных.')
+
+
+@schema_cli.command('upgrade')
+@click.option('--to', 'target', type=int, help='Номер миграции; по умолчанию последняя.')
+def upgrade_command(target):
+    """Применить миграции."""
+    for step in upgrade(target):
+        click.echo('Применена {:04d} {}'.format(step.version, step.name))
+    click.echo('Версия схемы: {}'.format(current_version()))
+
+
+@schema_cli.command('downgrade')
+@click.argument('target', type=int)
+def downgrade_command(target):
+    """Откатить миграции новее TARGET (не ниже 1: начальная схема не откатывается)."""
+    for step in downgrade(target):
+        click.echo('Откачена {:04d} {}'.format(step.version, step.name))
+    click.echo('Версия схемы: {}'.format(current_version()))
+
+
+@schema_cli.command('status')
+def status_command():
+    """Показать примененные и ожидающие миграции."""
+    applied = _applied()
+    for step in MIGRATIONS:
+        row = applied.get(step.version)
+        state = row.applied_at.strftime('%d.%m.%Y %H:%M') if row else 'не применена'
+        click.echo('{:04d} {:<20} {}'.format(step.version, step.name, state))
+
+
+@schema_cli.command('check-indexes')
+def check_indexes_command():
+    """Проверить по EXPLAIN, что частые запросы используют индексы."""
+    failed = 0
+    for name, index, plan, ok in check_indexes():
+        click.echo('{} {}: {}'.format('OK  ' if ok else 'FAIL', name, plan))
+        if not ok:
+            failed += 1
+            click.echo('     ожидался индекс {}'.format(index))
+    if failed:
+        raise SystemExit(1)
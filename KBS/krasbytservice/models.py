@@ -1,8 +1,23 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
+from sqlalchemy import text
+from sqlalchemy.orm import validates
 from datetime import datetime
+import re
 
-db = SQLAlchemy()
+from database import RoutingSession
+from money import Money
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+def normalize_phone(phone):
+    """Телефон без форматирования: только цифры, российские номера приводятся к 7XXXXXXXXXX"""
+    digits = re.sub(r'\D', '', phone or '')
+    if len(digits) == 11 and digits[0] == '8':
+        digits = '7' + digits[1:]
+    elif len(digits) == 10:
+        digits = '7' + digits
+    return digits
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -14,15 +29,23 @@ class Client(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     phone = db.Column(db.String(20), nullable=False)
+    # Телефон только из цифр для поиска и сравнения номеров в разном формате
+    phone_normalized = db.Column(db.String(20), index=True)
     email = db.Column(db.String(100))
     address = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.now)
     orders = db.relationship('Order', backref='client', lazy=True)
 
+    @validates('phone')
+    def validate_phone(self, key, phone):
+        self.phone_normalized = normalize_phone(phone)
+        return phone
+
 class OrderStatus(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(50), nullable=False)
     description = db.Column(db.Text)
+    badge_class = db.Column(db.String(20))  # цвет бейджа Bootstrap: primary, success, ...
 
 class Order(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -30,28 +53,211 @@ class Order(db.Model):
     washing_machine_model = db.Column(db.String(100), nullable=False)
     condition = db.Column(db.Text)
     description = db.Column(db.Text)
-    purchase_price = db.Column(db.Float)
-    repair_costs = db.Column(db.Float)
-    sale_price = db.Column(db.Float)
+    # Суммы в рублях; в базе хранятся целыми копейками (money.Money)
+    purchase_price = db.Column(Money)
+    repair_costs = db.Column(Money)
+    sale_price = db.Column(Money)
     status_id = db.Column(db.Integer, db.ForeignKey('order_status.id'), nullable=False)
+    employee_id = db.Column(db.Integer, db.ForeignKey('employee.id'))  # мастер
     created_at = db.Column(db.DateTime, default=datetime.now)
-    completed_at = db.Column(db.DateTime)
+    completed_at = db.Column(db.DateTime, index=True)  # ставится при переходе в «Выполнена»
     status = db.relationship('OrderStatus', backref='orders')
+    employee = db.relationship('Employee', backref='orders')
+
+    # Индексы повторяют порядок вывода списков: фильтр по колонке, затем новые заказы первыми.
+    # Добавляются миграциями (migrations.py)
+    __table_args__ = (
+        # Постраничный вывод по курсору (created_at, id) и выборки по дате создания
+        db.Index('ix_order_created_at_id', 'created_at', 'id'),
+        # Список с фильтром по статусу и подсчет заказов по статусам
+        db.Index('ix_order_status_created', 'status_id', 'created_at', 'id'),
+        # Заказы и статистика клиента
+        db.Index('ix_order_client_created', 'client_id', 'created_at'),
+        # Заказы мастера
+        db.Index('ix_order_employee_created', 'employee_id', 'created_at'),
+    )
+
+class OrderStatusHistory(db.Model):
+    """Переходы заказа между статусами.
+
+    Строка описывает период в одном статусе: с changed_at до left_at;
+    у текущего статуса заказа left_at пустой.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False)
+    from_status_id = db.Column(db.Integer, db.ForeignKey('order_status.id'))
+    to_status_id = db.Column(db.Integer, db.ForeignKey('order_status.id'), nullable=False)
+    changed_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    left_at = db.Column(db.DateTime)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    comment = db.Column(db.Text)
+
+    __table_args__ = (
+        # История одного заказа
+        db.Index('ix_status_history_order', 'order_id', 'changed_at'),
+        # Время в статусах за период (диапазон left_at) и зависшие заказы
+        # (left_at IS NULL, статус, changed_at раньше порога) — оба запроса по одному индексу
+        db.Index('ix_status_history_left_status', 'left_at', 'to_status_id', 'changed_at'),
+    )
 
 class SparePart(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     article = db.Column(db.String(50), unique=True)
-    quantity = db.Column(db.Integer, default=0)
-    cost_price = db.Column(db.Float)
-    retail_price = db.Column(db.Float)
+    quantity = db.Column(db.Integer, default=0)  # свободный остаток, без резервов
+    reserved = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    cost_price = db.Column(Money)
+    retail_price = db.Column(Money)
     min_stock = db.Column(db.Integer, default=5)
 
+    # Частичный индекс — список позиций с низким запасом, который база поддерживает сама
+    __table_args__ = (
+        db.Index('ix_spare_part_low_stock', 'quantity',
+                 sqlite_where=text('quantity <= min_stock'),
+                 postgresql_where=text('quantity <= min_stock')),
+    )
+
+class StockReservation(db.Model):
+    """Запчасти, отложенные под заказ"""
+    id = db.Column(db.Integer, primary_key=True)
+    order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False, index=True)
+    spare_part_id = db.Column(db.Integer, db.ForeignKey('spare_part.id'), nullable=False, index=True)
+    quantity = db.Column(db.Integer, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='active')  # active, consumed, released
+    created_at = db.Column(db.DateTime, default=datetime.now)
+    closed_at = db.Column(db.DateTime)
+
+    spare_part = db.relationship('SparePart')
+
+class StockMovement(db.Model):
+    """Журнал движения запчастей: строки только добавляются"""
+    id = db.Column(db.Integer, primary_key=True)
+    spare_part_id = db.Column(db.Integer, nullable=False)
+    kind = db.Column(db.String(20), nullable=False)  # receipt, adjust, reserve, release, consume, writeoff
+    quantity = db.Column(db.Integer, nullable=False)  # изменение свободного остатка со знаком
+    balance = db.Column(db.Integer)  # свободный остаток после движения
+    # Без внешних ключей: журнал переживает удаление заказа и запчасти
+    order_id = db.Column(db.Integer, index=True)
+    reservation_id = db.Column(db.Integer)
+    user_id = db.Column(db.Integer)
+    comment = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.now)
+
+    __table_args__ = (
+        db.Index('ix_stock_movement_part_created', 'spare_part_id', 'created_at'),
+    )
+
 class Employee(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     position = db.Column(db.String(50))
     phone = db.Column(db.String(20))
     email = db.Column(db.String(100))
-    salary = db.Column(db.Float)
-    hire_date = db.Column(db.DateTime, default=datetime.now)
\ No newline at end of file
+    salary = db.Column(Money)
+    hire_date = db.Column(db.DateTime, default=datetime.now)
+    # Уволенный сотрудник остается в истории заказов, но не предлагается при назначении
+    is_active = db.Column(db.Boolean, nullable=False, default=True, server_default='1')
+
+class EmployeeWorkload(db.Model):
+    """Заказы мастера по текущим статусам: загрузка без подсчета по таблице заказов"""
+    id = db.Column(db.Integer, primary_key=True)
+    employee_id = db.Column(db.Integer, nullable=False)
+    status_id = db.Column(db.Integer, nullable=False)
+    orders_count = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(Money, nullable=False, default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint('employee_id', 'status_id', name='uq_employee_workload_employee_status'),
+    )
+
+class EmployeeCompletion(db.Model):
+    """Выполненные заказы мастера по дням выполнения: выработка, выручка и сроки за период"""
+    id = db.Column(db.Integer, primary_key=True)
+    employee_id = db.Column(db.Integer, nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    orders_count = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(Money, nullable=False, default=0)
+    turnaround_seconds = db.Column(db.BigInteger, nullable=False, default=0)  # сумма сроков от создания до выполнения
+
+    __table_args__ = (
+        db.UniqueConstraint('employee_id', 'day', name='uq_employee_completion_employee_day'),
+    )
+
+class ProfitLedger(db.Model):
+    """Накопленные итоги по заказам: за все время, по дням и по месяцам"""
+    id = db.Column(db.Integer, primary_key=True)
+    period = db.Column(db.String(10), nullable=False)  # all, day, month
+    period_key = db.Column(db.String(10), unique=True, nullable=False)  # all, 2024-01-31, 2024-01
+    orders_count = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(Money, nullable=False, default=0)
+    expenses = db.Column(Money, nullable=False, default=0)
+
+    @property
+    def profit(self):
+        return self.revenue - self.expenses
+
+class OrderRollup(db.Model):
+    """Дневные итоги заказов в разрезе статуса, категории и мастера для отчетов"""
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False)
+    status_id = db.Column(db.Integer, nullable=False)
+    category = db.Column(db.String(20), nullable=False)  # repair, resale
+    employee_id = db.Column(db.Integer, nullable=False, default=0)  # 0 — мастер не назначен
+    orders_count = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(Money, nullable=False, default=0)
+    expenses = db.Column(Money, nullable=False, default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint('day', 'status_id', 'category', 'employee_id', name='uq_order_rollup_key'),
+    )
+class Job(db.Model):
+    """Фоновая задача: отчет или выгрузка, выполняется пулом процессов"""
+    id = db.Column(db.String(32), primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)  # report, export
+    params = db.Column(db.Text, nullable=False)  # JSON
+    params_key = db.Column(db.String(64), nullable=False)  # хэш вида и параметров для повторного использования
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, done, failed, cancelled
+    progress = db.Column(db.Integer, nullable=False, default=0)
+    message = db.Column(db.String(200))
+    cancel_requested = db.Column(db.Boolean, nullable=False, default=False)
+    result = db.Column(db.Text)  # JSON отчета
+    result_path = db.Column(db.String(255))  # файл выгрузки
+    error = db.Column(db.Text)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    # Пул, которому отдана задача (хост:pid:метка), и его последний сигнал жизни
+    executor = db.Column(db.String(100))
+    heartbeat_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_job_params_key_status', 'params_key', 'status', 'finished_at'),
+        db.Index('ix_job_user_status', 'user_id', 'status'),
+    )
+
+
+class BuyRequest(db.Model):
+    """Публичная заявка на скупку: сохраняется до ответа посетителю, заказ из нее создает фоновый поток"""
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    phone = db.Column(db.String(20), nullable=False)
+    phone_normalized = db.Column(db.String(20), nullable=False)
+    model = db.Column(db.String(100), nullable=False)
+    condition = db.Column(db.Text)
+    description = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    processed_at = db.Column(db.DateTime)  # пусто, пока заявка ждет обработки
+    order_id = db.Column(db.Integer, db.ForeignKey('order.id'))
+    error = db.Column(db.String(200))  # заявка, которую не удалось сохранить заказом
+
+    __table_args__ = (
+        db.Index('ix_buy_request_pending', 'processed_at', 'id'),
+    )
+
+
+class DataVersion(db.Model):
+    """Счетчик изменений таблицы: растет при каждом коммите, который ее менял (httpcache)"""
+    name = db.Column(db.String(50), primary_key=True)  # имя таблицы
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
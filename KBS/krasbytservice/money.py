@@ -0,0 +1,89 @@
+"""Денежные суммы: в коде — рубли Decimal, в базе — целые копейки.
+
+Тип Money переводит значения на границе с базой, поэтому суммы в SQL
+складываются точно, а модели и шаблоны работают с рублями как раньше.
+"""
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import BigInteger
+from sqlalchemy.sql import operators
+from sqlalchemy.types import TypeDecorator
+
+
+CENT = Decimal('0.01')
+ZERO = Decimal('0.00')
+
+# Для этих операций второй операнд — число (количество, делитель), а не сумма в рублях
+_SCALAR_OPERATORS = (operators.mul, operators.truediv, operators.floordiv, operators.mod)
+
+
+def to_money(value):
+    """Рубли Decimal с точностью до копейки; float переводится через строку, без хвостов двоичной дроби"""
+    if value is None:
+        return None
+    if isinstance(value, float):
+        value = repr(value)
+    try:
+        return Decimal(value).quantize(CENT, rounding=ROUND_HALF_UP)
+    except InvalidOperation:
+        raise ValueError('Некорректная сумма: {}'.format(value))
+
+
+def to_kopecks(value):
+    """Целые копейки из рублей (Decimal, int, float или строки)"""
+    return None if value is None else int(to_money(value) * 100)
+
+
+def from_kopecks(value):
+    """Рубли Decimal из копеек; дробные копейки (AVG в SQL) округляются"""
+    if value is None:
+        return None
+    if isinstance(value, int):
+        return Decimal(value).scaleb(-2)
+    return to_money(to_money(value).scaleb(-2))
+
+
+def parse_money(value):
+    """Сумма из поля формы или файла импорта: пробелы между разрядами и запятая допускаются.
+
+    Подходит как type= для request.form.get: некорректное значение дает ValueError.
+    """
+    if isinstance(value, str):
+        value = value.replace('\xa0', '').replace(' ', '').replace(',', '.')
+    return to_money(value)
+
+
+class Money(TypeDecorator):
+    """Колонка с суммой: целые копейки в базе, рубли Decimal в Python"""
+    impl = BigInteger
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return to_kopecks(value)
+
+    def process_result_value(self, value, dialect):
+        return from_kopecks(value)
+
+    def coerce_compared_value(self, op, value):
+        # Order.sale_price > 1000 — сравнение с рублями, а quantity * 2 — умножение на число
+        if op in _SCALAR_OPERATORS:
+            return BigInteger()
+        return self
+
+
+def json_default(value):
+    """Для json.dumps: суммы — числом, остальное (даты) — строкой"""
+    if isinstance(value, Decimal):
+        return float(value)
+    return str(value)
+
+
+class MoneyJSONProvider(DefaultJSONProvider):
+    """jsonify отдает суммы числами, как до перевода денег в Decimal (по умолчанию Flask пишет строку)"""
+
+    @staticmethod
+    def default(value):
+        if isinstance(value, Decimal):
+            return float(value)
+        return DefaultJSONProvider.default(value)
@@ -0,0 +1,246 @@
+import base64
+import logging
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from flask import g, has_app_context, request
+from sqlalchemy import and_, event, func, or_, type_coerce
+from sqlalchemy.orm import contains_eager, joinedload, selectinload
+
+from models import db, Client, Order
+from money import Money, ZERO, to_money
+from search import order_search_condition
+from lookups import badge_class, status_name
+
+
+logger = logging.getLogger(__name__)
+
+
+ORDERS_PER_PAGE = 50
+MAX_ORDERS_PER_PAGE = 200
+
+
+def encode_cursor(order):
+    """Курсор страницы: (created_at, id) последнего заказа"""
+    raw = '{}|{}'.format(order.created_at.isoformat(), order.id)
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Разбор курсора, None если курсор пустой или поврежден"""
+    if not cursor:
+        return None
+    try:
+        created_at, order_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(created_at), int(order_id)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def parse_order_filters(args):
+    """Фильтры списка заказов из параметров запроса"""
+    filters = {
+        'status_id': args.get('status_id', type=int),
+        'employee_id': args.get('employee_id', type=int),
+        'search': (args.get('q') or '').strip(),
+        'date_from': None,
+        'date_to': None
+    }
+    for key in ('date_from', 'date_to'):
+        try:
+            filters[key] = datetime.strptime(args.get(key, ''), '%Y-%m-%d')
+        except ValueError:
+            pass
+    return filters
+
+
+def filtered_orders_query(**filters):
+    """Запрос заказов с фильтрами; клиент загружается тем же JOIN, статус берется из справочника"""
+    query = (Order.query
+             .join(Order.client)
+             .options(contains_eager(Order.client)))
+    return apply_order_filters(query, **filters)
+
+
+def apply_order_filters(query, status_id=None, search='', date_from=None, date_to=None, employee_id=None):
+    """Фильтры списка заказов; запрос должен уже содержать JOIN с клиентом"""
+    if status_id:
+        query = query.filter(Order.status_id == status_id)
+    if employee_id:
+        query = query.filter(Order.employee_id == employee_id)
+    if date_from:
+        query = query.filter(Order.created_at >= date_from)
+    if date_to:
+        # Дата "по" включительно
+        query = query.filter(Order.created_at < date_to + timedelta(days=1))
+    if search:
+        query = query.filter(order_search_condition(search))
+    return query
+
+
+def paginate_orders(cursor=None, limit=ORDERS_PER_PAGE, **filters):
+    """Страница заказов от новых к старым по курсору (created_at, id).
+
+    Возвращает (заказы, курсор следующей страницы или None).
+    """
+    limit = max(1, min(limit or ORDERS_PER_PAGE, MAX_ORDERS_PER_PAGE))
+    query = filtered_orders_query(**filters)
+
+    position = decode_cursor(cursor)
+    if position:
+        created_at, order_id = position
+        query = query.filter(or_(
+            Order.created_at < created_at,
+            and_(Order.created_at == created_at, Order.id < order_id)
+        ))
+
+    # Берем на одну запись больше, чтобы узнать, есть ли следующая страница
+    rows = query.order_by(Order.created_at.desc(), Order.id.desc()).limit(limit + 1).all()
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+def count_orders_by_status():
+    """Количество заказов по каждому статусу одним запросом"""
+    rows = db.session.query(Order.status_id, func.count(Order.id)).group_by(Order.status_id).all()
+    return {status_id: count for status_id, count in rows}
+
+
+def client_choices():
+    """Клиенты для выпадающего списка: только нужные колонки"""
+    return db.session.query(Client.id, Client.name, Client.phone).order_by(Client.name).all()
+
+
+def serialize_order_row(order):
+    """Строка списка заказов для JSON API"""
+    return {
+        'id': order.id,
+        'client_name': order.client.name,
+        'client_phone': order.client.phone,
+        'model': order.washing_machine_model,
+        'description': order.description,
+        'status_id': order.status_id,
+        'status': status_name(order.status_id),
+        'status_class': badge_class(order.status_id),
+        'created_date': order.created_at.strftime('%d.%m.%Y'),
+        'amount': order.sale_price or order.repair_costs or ZERO,
+        'profit': (order.sale_price or ZERO) - (order.repair_costs or ZERO) - (order.purchase_price or ZERO)
+    }
+
+
+# Формы загрузки: каждое представление заранее объявляет, какие связи ему нужны,
+# чтобы шаблоны и JSON API не вызывали ленивые запросы на каждую строку.
+# Статусы не загружаются: названия и цвета берутся из кэшированного справочника (lookups)
+
+def order_with_refs():
+    """Заказ вместе с клиентом"""
+    return (joinedload(Order.client),)
+
+
+def client_with_orders():
+    """Клиент вместе с заказами"""
+    return (selectinload(Client.orders),)
+
+
+def get_order(order_id, *shape):
+    """Заказ по id с указанными связями"""
+    return Order.query.options(*shape).filter(Order.id == order_id).first()
+
+
+def get_client(client_id, *shape):
+    """Клиент по id с указанными связями"""
+    return Client.query.options(*shape).filter(Client.id == client_id).first()
+
+
+def recent_orders(limit=5):
+    """Последние заказы вместе с клиентом"""
+    return Order.query.options(*order_with_refs()).order_by(Order.created_at.desc(), Order.id.desc()).limit(limit).all()
+
+
+# Статистика клиентов считается в SQL одним сгруппированным запросом
+
+ClientStats = namedtuple('ClientStats', 'orders_count total_amount avg_order last_order')
+EMPTY_CLIENT_STATS = ClientStats(0, ZERO, ZERO, None)
+
+
+def order_amount():
+    """Сумма заказа: цена продажи, иначе затраты на ремонт, иначе 0"""
+    # NULLIF теряет тип колонки: без Money сумма пришла бы в копейках
+    return type_coerce(func.coalesce(func.nullif(Order.sale_price, 0), func.nullif(Order.repair_costs, 0), 0), Money())
+
+
+def client_stats_subquery():
+    """Количество заказов, сумма и дата последнего заказа по каждому клиенту"""
+    return (db.session.query(Order.client_id.label('client_id'),
+                             func.count(Order.id).label('orders_count'),
+                             func.sum(order_amount()).label('total_amount'),
+                             func.max(Order.created_at).label('last_order'))
+            .group_by(Order.client_id)
+            .subquery())
+
+
+def _make_stats(orders_count, total_amount, last_order):
+    if not orders_count:
+        return EMPTY_CLIENT_STATS
+    total_amount = total_amount or ZERO
+    return ClientStats(orders_count, total_amount, to_money(total_amount / orders_count), last_order)
+
+
+def clients_with_stats():
+    """Все клиенты со статистикой заказов: список пар (клиент, ClientStats)"""
+    stats = client_stats_subquery()
+    rows = (db.session.query(Client, stats.c.orders_count, stats.c.total_amount, stats.c.last_order)
+            .outerjoin(stats, stats.c.client_id == Client.id)
+            .order_by(Client.id)
+            .all())
+    return [(client, _make_stats(count, total, last)) for client, count, total, last in rows]
+
+
+def get_client_stats(client_id):
+    """Статистика заказов одного клиента"""
+    row = (db.session.query(func.count(Order.id), func.sum(order_amount()), func.max(Order.created_at))
+           .filter(Order.client_id == client_id)
+           .one())
+    return _make_stats(*row)
+
+
+# Подсчет SQL-запросов на HTTP-запрос
+
+def query_budget(limit):
+    """Декоратор: максимальное число SQL-запросов для представления"""
+    def decorator(view):
+        view.query_budget = limit
+        return view
+    return decorator
+
+
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    if has_app_context():
+        g.sql_statements = g.get('sql_statements', 0) + 1
+
+
+def init_query_counter(app):
+    """Считает SQL-запросы каждого HTTP-запроса.
+
+    Лимит берется из декоратора query_budget или из SQL_QUERY_BUDGET.
+    Превышение пишется в лог, а в режиме TESTING вызывает ошибку,
+    чтобы представление с N+1 не проходило тесты.
+    """
+    with app.app_context():
+        for engine in db.engines.values():
+            event.listen(engine, 'before_cursor_execute', _count_statement)
+
+    @app.after_request
+    def check_query_budget(response):
+        count = g.get('sql_statements', 0)
+        if app.debug or app.testing:
+            response.headers['X-SQL-Queries'] = str(count)
+
+        view = app.view_functions.get(request.endpoint)
+        budget = getattr(view, 'query_budget', app.config.get('SQL_QUERY_BUDGET'))
+        if budget is not None and count > budget:
+            message = '{} {}: {} SQL-запросов (лимит {})'.format(request.method, request.path, count, budget)
+            if app.testing:
+                raise AssertionError(message)
+            logger.warning(message)
+        return response
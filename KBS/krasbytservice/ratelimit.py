@@ -0,0 +1,117 @@
+import math
+import threading
+import time
+from functools import wraps
+
+from flask import current_app, flash, jsonify, make_response, render_template, request
+
+
+# Лимиты публичных форм: (токенов в минуту, емкость корзины)
+DEFAULT_RATE_LIMITS = {
+    'buy_request': (6, 3),
+    'check_status': (30, 10)
+}
+# Сколько публичных запросов может обрабатываться одновременно, остальное — 503
+PUBLIC_MAX_CONCURRENCY = 4
+
+
+class TokenBucket:
+    """Корзина токенов на каждый ключ (IP-адрес, телефон).
+
+    Токены пополняются со скоростью rate в секунду до capacity; каждый запрос
+    забирает один токен. Давно не использованные ключи удаляются.
+    """
+
+    def __init__(self, rate_per_minute, capacity, max_keys=10000):
+        self.rate = rate_per_minute / 60
+        self.capacity = capacity
+        self.max_keys = max_keys
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def allow(self, key):
+        """(разрешено, через сколько секунд появится следующий токен)"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (self.capacity, now))
+            tokens = min(self.capacity, tokens + (now - updated_at) * self.rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._prune(now)
+        return allowed, 0 if allowed else math.ceil((1 - tokens) / self.rate)
+
+    def _prune(self, now):
+        # Полные корзины ничем не отличаются от отсутствующих
+        full_after = self.capacity / self.rate
+        for key, (_, updated_at) in list(self._buckets.items()):
+            if now - updated_at >= full_after:
+                del self._buckets[key]
+
+
+class PublicLimits:
+    def __init__(self, config):
+        limits = dict(DEFAULT_RATE_LIMITS, **config.get('PUBLIC_RATE_LIMITS', {}))
+        self.buckets = {(name, scope): TokenBucket(rate, capacity)
+                        for name, (rate, capacity) in limits.items() for scope in ('ip', 'phone')}
+        self.slots = threading.BoundedSemaphore(config.get('PUBLIC_MAX_CONCURRENCY', PUBLIC_MAX_CONCURRENCY))
+
+    def allow(self, name, scope, key):
+        bucket = self.buckets.get((name, scope))
+        return bucket.allow(key) if bucket else (True, 0)
+
+
+def init_rate_limits(app):
+    """Лимиты публичных страниц: PUBLIC_RATE_LIMITS и PUBLIC_MAX_CONCURRENCY"""
+    app.extensions['public_limits'] = PublicLimits(app.config)
+
+
+def client_ip():
+    return request.remote_addr or 'unknown'
+
+
+def limit_response(message, status, retry_after=None, template=None):
+    if template:
+        flash(message)
+        response = make_response(render_template(template), status)
+    else:
+        response = make_response(jsonify({'success': False, 'error': message}), status)
+    if retry_after:
+        response.headers['Retry-After'] = str(retry_after)
+    return response
+
+
+def check_phone_limit(name, phone, template=None):
+    """Ответ 429, если с этого телефона слишком много запросов, иначе None"""
+    if not phone:
+        return None
+    allowed, retry_after = current_app.extensions['public_limits'].allow(name, 'phone', phone)
+    if allowed:
+        return None
+    return limit_response('Слишком много запросов с этим номером, попробуйте через {} с'.format(retry_after),
+                          429, retry_after, template)
+
+
+def public_endpoint(name, template=None):
+    """Декоратор публичной страницы: лимит по IP для POST и ограничение одновременных запросов,
+    чтобы всплеск публичного трафика не занимал все обработчики сотрудников"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method != 'POST':
+                return view(*args, **kwargs)
+            limits = current_app.extensions['public_limits']
+            allowed, retry_after = limits.allow(name, 'ip', client_ip())
+            if not allowed:
+                return limit_response('Слишком много запросов, попробуйте через {} с'.format(retry_after),
+                                      429, retry_after, template)
+            if not limits.slots.acquire(blocking=False):
+                return limit_response('Сервис перегружен, попробуйте позже', 503, 1, template)
+            try:
+                return view(*args, **kwargs)
+            finally:
+                limits.slots.release()
+        return wrapper
+    return decorator
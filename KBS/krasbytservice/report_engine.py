@@ -0,0 +1,185 @@
+from collections import defaultdict
+from datetime import date, datetime
+
+from sqlalchemy import case, func
+
+from models import db, Client, OrderRollup, SparePart
+from money import ZERO, to_money
+from finance import money_sum
+from ledger import compute_rollups
+from lifecycle import status_durations, turnaround
+from lookups import status_names
+
+
+REPORT_TYPES = ('financial', 'sales', 'repairs', 'warehouse', 'clients')
+
+CATEGORY_NAMES = {
+    'resale': 'Скупка и продажа техники',
+    'repair': 'Ремонтные услуги'
+}
+
+# Отчет по продажам и по ремонтам — это финансовый отчет по одной категории
+REPORT_CATEGORIES = {
+    'sales': 'resale',
+    'repairs': 'repair'
+}
+
+
+def collect_rollups(date_from, date_to, status_id=None, category=None, employee_id=None):
+    """Дневные итоги за период: [(день, статус, категория, count, revenue, expenses)].
+
+    Прошедшие дни читаются из OrderRollup. Если период захватывает сегодня,
+    сегодняшний день досчитывается по заказам напрямую: это небольшой хвост,
+    который читается по индексу created_at.
+    """
+    today = date.today()
+    query = OrderRollup.query.filter(OrderRollup.day >= date_from,
+                                     OrderRollup.day <= date_to,
+                                     OrderRollup.day < today)
+    if status_id:
+        query = query.filter(OrderRollup.status_id == status_id)
+    if category:
+        query = query.filter(OrderRollup.category == category)
+    if employee_id:
+        query = query.filter(OrderRollup.employee_id == employee_id)
+
+    rows = [(row.day, row.status_id, row.category, row.orders_count, row.revenue, row.expenses)
+            for row in query.all()]
+
+    if date_from <= today <= date_to:
+        since = datetime.combine(today, datetime.min.time())
+        for (day, row_status, row_category, row_employee), values in compute_rollups(since=since).items():
+            if ((not status_id or row_status == status_id) and (not category or row_category == category)
+                    and (not employee_id or row_employee == employee_id)):
+                rows.append((day, row_status, row_category) + values)
+    return rows
+
+
+def _share(part, total):
+    return round(part * 100 / total) if total else 0
+
+
+def summarize(rows):
+    """Итоги, разбивка по категориям, статусам и месяцам"""
+    names = status_names()
+    totals = [0, ZERO, ZERO]
+    by_category = defaultdict(lambda: [0, ZERO, ZERO])
+    by_status = defaultdict(lambda: [0, ZERO, ZERO])
+    by_month = defaultdict(lambda: [0, ZERO, ZERO])
+
+    for day, status_id, category, orders_count, revenue, expenses in rows:
+        for bucket in (totals, by_category[category], by_status[status_id], by_month[day.strftime('%Y-%m')]):
+            bucket[0] += orders_count
+            bucket[1] += revenue
+            bucket[2] += expenses
+
+    total_orders, total_revenue, total_expenses = totals
+    return {
+        'total_revenue': total_revenue,
+        'total_profit': total_revenue - total_expenses,
+        'total_orders': total_orders,
+        'avg_order': to_money(total_revenue / total_orders) if total_orders else ZERO,
+        'categories': [{
+            'name': CATEGORY_NAMES.get(category, category),
+            'count': values[0],
+            'amount': values[1],
+            'profit': values[1] - values[2],
+            'percentage': _share(values[1], total_revenue)
+        } for category, values in sorted(by_category.items())],
+        'statuses': [{
+            'name': names.get(status_id, str(status_id)),
+            'count': values[0],
+            'amount': values[1],
+            'profit': values[1] - values[2],
+            'percentage': _share(values[0], total_orders)
+        } for status_id, values in sorted(by_status.items())],
+        'monthly': [{
+            'month': month,
+            'count': values[0],
+            'revenue': values[1],
+            'profit': values[1] - values[2]
+        } for month, values in sorted(by_month.items())]
+    }
+
+
+def warehouse_report(stock_level='all'):
+    """Состояние склада одним агрегирующим запросом"""
+    level = case((SparePart.quantity <= 0, 'out'),
+                 (SparePart.quantity <= SparePart.min_stock, 'low'),
+                 else_='normal')
+    rows = (db.session.query(level,
+                             func.count(SparePart.id),
+                             func.sum(SparePart.quantity),
+                             money_sum(SparePart.quantity * SparePart.cost_price),
+                             money_sum(SparePart.quantity * SparePart.retail_price))
+            .group_by(level)
+            .all())
+
+    names = {'normal': 'Нормальный запас', 'low': 'Низкий запас', 'out': 'Нет в наличии'}
+    levels = [{
+        'level': key,
+        'name': names[key],
+        'count': count,
+        'quantity': quantity or 0,
+        'cost_value': cost_value,
+        'retail_value': retail_value
+    } for key, count, quantity, cost_value, retail_value in rows if stock_level in ('all', key)]
+
+    return {
+        'total_parts': sum(item['count'] for item in levels),
+        'total_cost_value': sum((item['cost_value'] for item in levels), ZERO),
+        'total_retail_value': sum((item['retail_value'] for item in levels), ZERO),
+        'levels': levels
+    }
+
+
+def clients_report(date_from, date_to):
+    """Новые клиенты за период и заказы за период по дневным итогам"""
+    report = summarize(collect_rollups(date_from, date_to))
+    period_start = datetime.combine(date_from, datetime.min.time())
+    period_end = datetime.combine(date_to, datetime.max.time())
+    report['new_clients'] = (Client.query
+                             .filter(Client.created_at >= period_start, Client.created_at <= period_end)
+                             .count())
+    report['total_clients'] = Client.query.count()
+    return report
+
+
+def _id_param(value):
+    return int(value) if value not in (None, '', 'all') else None
+
+
+def _no_progress(percent, message=None):
+    pass
+
+
+def build_report(report_type, date_from, date_to, params=None, progress=_no_progress):
+    """Формирует отчет указанного типа за период [date_from, date_to].
+
+    progress(процент, сообщение) вызывается между этапами: так фоновая задача
+    показывает ход выполнения и может быть отменена.
+    """
+    params = params or {}
+    if report_type not in REPORT_TYPES:
+        raise ValueError('Неизвестный тип отчета: {}'.format(report_type))
+    if date_from > date_to:
+        raise ValueError('Дата начала периода позже даты окончания')
+
+    if report_type == 'warehouse':
+        progress(10, 'Остатки склада')
+        return warehouse_report(params.get('stock_level') or 'all')
+    if report_type == 'clients':
+        progress(10, 'Клиенты и заказы')
+        return clients_report(date_from, date_to)
+
+    status_id = _id_param(params.get('status_id'))
+    employee_id = _id_param(params.get('employee_id'))
+    category = REPORT_CATEGORIES.get(report_type)
+    progress(10, 'Итоги по дням')
+    rows = collect_rollups(date_from, date_to, status_id=status_id, category=category, employee_id=employee_id)
+    report = summarize(rows)
+    # Сроки: от создания до выполнения и время в каждом статусе за период
+    progress(60, 'Сроки выполнения')
+    report['turnaround'] = turnaround(date_from, date_to, category, employee_id)
+    report['status_durations'] = status_durations(date_from, date_to, employee_id)
+    return report
@@ -0,0 +1,212 @@
+import re
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import bindparam, column, inspect, or_, text
+
+from models import db, normalize_phone, Client, Order, OrderStatus
+
+
+# Полнотекстовые индексы SQLite FTS5 поверх таблиц client и order (external content).
+# Триггеры держат их в актуальном состоянии при любой вставке, изменении и удалении,
+# в том числе при массовой загрузке в обход ORM.
+SQLITE_SEARCH_SCHEMA = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS client_fts USING fts5(
+        name, address, content='client', content_rowid='id', tokenize='unicode61 remove_diacritics 2')""",
+    """CREATE VIRTUAL TABLE IF NOT EXISTS order_fts USING fts5(
+        washing_machine_model, description, condition,
+        content='order', content_rowid='id', tokenize='unicode61 remove_diacritics 2')""",
+    # Триграммы позволяют искать по любому фрагменту номера от трех цифр
+    """CREATE VIRTUAL TABLE IF NOT EXISTS client_phone_fts USING fts5(
+        phone_normalized, content='client', content_rowid='id', tokenize='trigram')""",
+
+    """CREATE TRIGGER IF NOT EXISTS client_search_insert AFTER INSERT ON client BEGIN
+        INSERT INTO client_fts(rowid, name, address) VALUES (new.id, new.name, new.address);
+        INSERT INTO client_phone_fts(rowid, phone_normalized) VALUES (new.id, new.phone_normalized);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS client_search_delete AFTER DELETE ON client BEGIN
+        INSERT INTO client_fts(client_fts, rowid, name, address) VALUES ('delete', old.id, old.name, old.address);
+        INSERT INTO client_phone_fts(client_phone_fts, rowid, phone_normalized)
+            VALUES ('delete', old.id, old.phone_normalized);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS client_search_update AFTER UPDATE ON client BEGIN
+        INSERT INTO client_fts(client_fts, rowid, name, address) VALUES ('delete', old.id, old.name, old.address);
+        INSERT INTO client_phone_fts(client_phone_fts, rowid, phone_normalized)
+            VALUES ('delete', old.id, old.phone_normalized);
+        INSERT INTO client_fts(rowid, name, address) VALUES (new.id, new.name, new.address);
+        INSERT INTO client_phone_fts(rowid, phone_normalized) VALUES (new.id, new.phone_normalized);
+    END""",
+
+    """CREATE TRIGGER IF NOT EXISTS order_search_insert AFTER INSERT ON "order" BEGIN
+        INSERT INTO order_fts(rowid, washing_machine_model, description, condition)
+            VALUES (new.id, new.washing_machine_model, new.description, new.condition);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS order_search_delete AFTER DELETE ON "order" BEGIN
+        INSERT INTO order_fts(order_fts, rowid, washing_machine_model, description, condition)
+            VALUES ('delete', old.id, old.washing_machine_model, old.description, old.condition);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS order_search_update
+        AFTER UPDATE OF washing_machine_model, description, condition ON "order" BEGIN
+        INSERT INTO order_fts(order_fts, rowid, washing_machine_model, description, condition)
+            VALUES ('delete', old.id, old.washing_machine_model, old.description, old.condition);
+        INSERT INTO order_fts(rowid, washing_machine_model, description, condition)
+            VALUES (new.id, new.washing_machine_model, new.description, new.condition);
+    END"""
+]
+
+FTS_TABLES = ('client_fts', 'order_fts', 'client_phone_fts')
+
+# Минимальная длина фрагмента телефона для поиска по триграммам
+MIN_PHONE_FRAGMENT = 3
+SEARCH_LIMIT = 20
+
+
+def fts_enabled():
+    return db.engine.dialect.name == 'sqlite'
+
+
+def init_search_index():
+    """Создает колонку нормализованного телефона и индексы поиска, если их еще нет"""
+    columns = {column['name'] for column in inspect(db.engine).get_columns('client')}
+    if 'phone_normalized' not in columns:
+        # База создана до появления колонки: добавляем и заполняем ее
+        with db.engine.begin() as connection:
+            connection.execute(text('ALTER TABLE client ADD COLUMN phone_normalized VARCHAR(20)'))
+            connection.execute(text('CREATE INDEX IF NOT EXISTS ix_client_phone_normalized '
+                                    'ON client (phone_normalized)'))
+        backfill_phones()
+
+    if not fts_enabled():
+        return
+    existing = set(inspect(db.engine).get_table_names())
+    with db.engine.begin() as connection:
+        for statement in SQLITE_SEARCH_SCHEMA:
+            connection.execute(text(statement))
+    if not existing.issuperset(FTS_TABLES):
+        rebuild_search_index()
+
+
+def backfill_phones():
+    """Заполняет phone_normalized у клиентов, где он пустой"""
+    rows = db.session.query(Client.id, Client.phone).filter(Client.phone_normalized.is_(None)).all()
+    if rows:
+        db.session.execute(Client.__table__.update()
+                           .where(Client.__table__.c.id == bindparam('client_id'))
+                           .values(phone_normalized=bindparam('normalized')),
+                           [{'client_id': client_id, 'normalized': normalize_phone(phone)}
+                            for client_id, phone in rows])
+        db.session.commit()
+    return len(rows)
+
+
+def rebuild_search_index():
+    """Перестраивает полнотекстовые индексы по текущему содержимому таблиц"""
+    with db.engine.begin() as connection:
+        for table in FTS_TABLES:
+            connection.execute(text("INSERT INTO {0}({0}) VALUES ('rebuild')".format(table)))
+
+
+def fts_query(search):
+    """Запрос FTS5 из пользовательского текста: все слова по префиксу"""
+    words = re.findall(r'\w+', search.lower())
+    return ' '.join('"{}"*'.format(word) for word in words)
+
+
+def phone_fragment(search):
+    digits = re.sub(r'\D', '', search)
+    if len(digits) < MIN_PHONE_FRAGMENT:
+        return ''
+    # Номер целиком в любом формате приводится к виду, в котором хранится
+    return normalize_phone(digits) if len(digits) >= 10 else digits
+
+
+def _fts_rowids(table, match):
+    # Подзапрос rowid из полнотекстового индекса для использования в IN (...)
+    return (text('SELECT rowid FROM {0} WHERE {0} MATCH :{0}_match'.format(table))
+            .bindparams(**{table + '_match': match})
+            .columns(column('rowid')))
+
+
+def order_search_condition(search):
+    """Условие поиска заказов по клиенту, телефону, модели, описанию и состоянию.
+
+    Запрос должен содержать JOIN с клиентом.
+    """
+    phone = phone_fragment(search)
+    if not fts_enabled():
+        pattern = '%{}%'.format(search)
+        conditions = [Client.name.ilike(pattern), Order.washing_machine_model.ilike(pattern),
+                      Order.description.ilike(pattern), Order.condition.ilike(pattern)]
+        # Телефон ищется в нормализованном виде, как и в полнотекстовом индексе: формат ввода не важен
+        if phone:
+            conditions.append(Client.phone_normalized.like('%{}%'.format(phone)))
+        return or_(*conditions)
+
+    conditions = []
+    match = fts_query(search)
+    if match:
+        conditions.append(Order.id.in_(_fts_rowids('order_fts', match)))
+        conditions.append(Client.id.in_(_fts_rowids('client_fts', match)))
+    if phone:
+        conditions.append(Client.id.in_(_fts_rowids('client_phone_fts', '"{}"'.format(phone))))
+    return or_(*conditions) if conditions else Order.id.is_(None)
+
+
+def _ranked_ids(table, match, limit):
+    rows = db.session.execute(text('SELECT rowid FROM {0} WHERE {0} MATCH :match ORDER BY rank LIMIT :limit'
+                                   .format(table)), {'match': match, 'limit': limit})
+    return [row[0] for row in rows]
+
+
+def search_clients(search, limit=SEARCH_LIMIT):
+    """Клиенты по телефону (любой фрагмент) и по имени или адресу, лучшие совпадения первыми"""
+    phone = phone_fragment(search)
+    match = fts_query(search)
+
+    if not fts_enabled():
+        pattern = '%{}%'.format(search)
+        conditions = [Client.name.ilike(pattern), Client.address.ilike(pattern)]
+        if phone:
+            conditions.append(Client.phone_normalized.like('%{}%'.format(phone)))
+        return Client.query.filter(or_(*conditions)).limit(limit).all()
+
+    ids = []
+    if phone:
+        ids += _ranked_ids('client_phone_fts', '"{}"'.format(phone), limit)
+    if match:
+        ids += [client_id for client_id in _ranked_ids('client_fts', match, limit) if client_id not in ids]
+    ids = ids[:limit]
+    clients = {client.id: client for client in Client.query.filter(Client.id.in_(ids))} if ids else {}
+    return [clients[client_id] for client_id in ids if client_id in clients]
+
+
+def search_orders(search, limit=SEARCH_LIMIT):
+    """Заказы по модели, описанию и состоянию, лучшие совпадения первыми"""
+    query = (db.session.query(Order, Client.name, Client.phone, OrderStatus.name)
+             .join(Client, Order.client_id == Client.id)
+             .join(OrderStatus, Order.status_id == OrderStatus.id))
+    match = fts_query(search)
+
+    if not fts_enabled():
+        pattern = '%{}%'.format(search)
+        return query.filter(or_(Order.washing_machine_model.ilike(pattern), Order.description.ilike(pattern),
+                                Order.condition.ilike(pattern))).limit(limit).all()
+    if not match:
+        return []
+
+    ids = _ranked_ids('order_fts', match, limit)
+    rows = {row[0].id: row for row in query.filter(Order.id.in_(ids))} if ids else {}
+    return [rows[order_id] for order_id in ids if order_id in rows]
+
+
+search_cli = AppGroup('search', help='Поисковые индексы клиентов и заказов.')
+
+
+@search_cli.command('rebuild')
+def rebuild_command():
+    """Создать и перестроить поисковые индексы."""
+    init_search_index()
+    click.echo('Телефонов нормализовано: {}'.format(backfill_phones()))
+    if fts_enabled():
+        rebuild_search_index()
+        click.echo('Полнотекстовые индексы перестроены')
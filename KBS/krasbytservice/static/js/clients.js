@@ -0,0 +1,129 @@
+// Заполнение формы редактирования
+function fillEditForm(id, name, phone, email, address) {
+    document.getElementById('editClientId').value = id;
+    document.getElementById('editName').value = name;
+    document.getElementById('editPhone').value = phone;
+    document.getElementById('editEmail').value = email || '';
+    document.getElementById('editAddress').value = address || '';
+}
+
+// Подтверждение удаления
+function confirmDelete(clientId, clientName) {
+    if (confirm(`Вы уверены, что хотите удалить клиента "${clientName}"? Все связанные заказы также будут удалены.`)) {
+        fetch(`/delete_client/${clientId}`, {
+            method: 'DELETE',
+        })
+        .then(response => response.json())
+        .then(data => {
+            if (data.success) {
+                location.reload();
+            } else {
+                alert('Ошибка при удалении клиента: ' + data.error);
+            }
+        });
+    }
+}
+
+// Просмотр информации о клиенте
+function viewClient(clientId) {
+    fetch(`/api/client_details/${clientId}`)
+        .then(response => response.json())
+        .then(data => {
+            if (data.success) {
+                document.getElementById('clientDetails').innerHTML = `
+                    <div class="row">
+                        <div class="col-md-6">
+                            <h6>Основная информация</h6>
+                            <p><strong>ФИО:</strong> ${data.client.name}</p>
+                            <p><strong>Телефон:</strong> ${data.client.phone}</p>
+                            <p><strong>Email:</strong> ${data.client.email || 'Не указан'}</p>
+                            <p><strong>Адрес:</strong> ${data.client.address || 'Не указан'}</p>
+                            <p><strong>Дата регистрации:</strong> ${data.client.created_at}</p>
+                        </div>
+                        <div class="col-md-6">
+                            <h6>Статистика</h6>
+                            <p><strong>Всего заказов:</strong> ${data.client.orders_count}</p>
+                            <p><strong>Общая сумма:</strong> ${data.client.total_amount} ₽</p>
+                            <p><strong>Средний чек:</strong> ${data.client.avg_order} ₽</p>
+                            <p><strong>Последний заказ:</strong> ${data.client.last_order || 'Нет'}</p>
+                        </div>
+                    </div>
+                    ${data.client.orders_count > 0 ? `
+                    <hr>
+                    <h6>История заказов</h6>
+                    <div class="table-responsive">
+                        <table class="table table-sm">
+                            <thead>
+                                <tr>
+                                    <th>№ заказа</th>
+                                    <th>Дата</th>
+                                    <th>Услуга</th>
+                                    <th>Сумма</th>
+                                    <th>Статус</th>
+                                </tr>
+                            </thead>
+                            <tbody>
+                                ${data.orders.map(order => `
+                                    <tr>
+                                        <td>${order.id}</td>
+                                        <td>${order.date}</td>
+                                        <td>${order.service}</td>
+                                        <td>${order.amount} ₽</td>
+                                        <td><span class="badge bg-${order.status_class}">${order.status}</span></td>
+                                    </tr>
+                                `).join('')}
+                            </tbody>
+                        </table>
+                    </div>
+                    ` : ''}
+                `;
+            } else {
+                document.getElementById('clientDetails').innerHTML = `
+                    <div class="alert alert-danger">Ошибка загрузки данных</div>
+                `;
+            }
+        });
+}
+
+// Поиск клиентов
+document.getElementById('searchInput').addEventListener('input', function() {
+    const searchText = this.value.toLowerCase();
+    const rows = document.querySelectorAll('.client-row');
+
+    rows.forEach(row => {
+        const name = row.getAttribute('data-name');
+        const phone = row.getAttribute('data-phone');
+        const email = row.getAttribute('data-email');
+
+        const matches = name.includes(searchText) ||
+                       phone.includes(searchText) ||
+                       email.includes(searchText);
+
+        row.style.display = matches ? '' : 'none';
+    });
+});
+
+function clearSearch() {
+    document.getElementById('searchInput').value = '';
+    const rows = document.querySelectorAll('.client-row');
+    rows.forEach(row => row.style.display = '');
+}
+
+// Сортировка клиентов
+function sortClients() {
+    const sortBy = document.getElementById('sortSelect').value;
+    // Реализация сортировки будет добавлена позже
+    alert('Функция сортировки будет реализована в следующей версии');
+}
+
+// Экспорт клиентов
+function exportClients() {
+    window.location = '/export/clients';
+}
+
+// Показать статистику
+function showStatistics() {
+    const statsSection = document.getElementById('clientStats');
+    statsSection.style.display = statsSection.style.display === 'none' ? 'flex' : 'none';
+}
+
@@ -0,0 +1,32 @@
+// Счетчики и последние заказы обновляются без перезагрузки страницы
+const DASHBOARD_REFRESH_MS = 60000;
+
+function escapeHtml(value) {
+    const div = document.createElement('div');
+    div.textContent = value == null ? '' : value;
+    return div.innerHTML;
+}
+
+function refreshDashboard() {
+    fetch('/api/dashboard_stats')
+        .then(response => response.json())
+        .then(data => {
+            if (!data.success) {
+                return;
+            }
+            document.getElementById('total-orders').textContent = data.counters.total_orders;
+            document.getElementById('active-orders').textContent = data.counters.active_orders;
+            document.getElementById('total-clients').textContent = data.counters.total_clients;
+            document.getElementById('low-stock-parts').textContent = data.counters.low_stock_parts;
+            document.getElementById('recentOrders').innerHTML = data.recent_orders.map(order => `
+                <tr>
+                    <td>${order.id}</td>
+                    <td>${escapeHtml(order.client_name)}</td>
+                    <td>${escapeHtml(order.model)}</td>
+                    <td><span class="badge bg-${escapeHtml(order.status_class)}">${escapeHtml(order.status)}</span></td>
+                </tr>`).join('');
+        })
+        .catch(error => console.error('Ошибка обновления панели:', error));
+}
+
+setInterval(refreshDashboard, DASHBOARD_REFRESH_MS);
@@ -0,0 +1,170 @@
+// Заполнение формы редактирования
+function fillEditForm(id, name, position, phone, email, salary, hireDate, isActive) {
+    document.getElementById('editEmployeeId').value = id;
+    document.getElementById('editName').value = name;
+    document.getElementById('editPosition').value = position;
+    document.getElementById('editPhone').value = phone || '';
+    document.getElementById('editEmail').value = email || '';
+    document.getElementById('editSalary').value = salary || '';
+    document.getElementById('editHireDate').value = hireDate || '';
+    document.getElementById('editIsActive').checked = isActive === 'true';
+}
+
+// Подтверждение удаления
+function confirmDelete(employeeId, employeeName) {
+    if (confirm(`Вы уверены, что хотите удалить сотрудника "${employeeName}"?`)) {
+        fetch(`/delete_employee/${employeeId}`, {
+            method: 'DELETE',
+        })
+        .then(response => response.json())
+        .then(data => {
+            if (data.success) {
+                location.reload();
+            } else {
+                alert('Ошибка при удалении сотрудника: ' + data.error);
+            }
+        });
+    }
+}
+
+// Просмотр информации о сотруднике
+function viewEmployee(employeeId) {
+    fetch(`/api/employee_details/${employeeId}?${periodParams()}`)
+        .then(response => response.json())
+        .then(data => {
+            if (data.success) {
+                document.getElementById('employeeDetails').innerHTML = `
+                    <div class="row">
+                        <div class="col-md-6">
+                            <h6>Основная информация</h6>
+                            <p><strong>ФИО:</strong> ${data.employee.name}</p>
+                            <p><strong>Должность:</strong> <span class="badge bg-${data.employee.position_class}">${data.employee.position}</span></p>
+                            <p><strong>Статус:</strong> <span class="badge bg-${data.employee.is_active ? 'success' : 'secondary'}">${data.employee.is_active ? 'Активен' : 'Не активен'}</span></p>
+                            <p><strong>Дата приема:</strong> ${data.employee.hire_date || 'Не указана'}</p>
+                            <p><strong>Зарплата:</strong> ${data.employee.salary ? data.employee.salary + ' ₽' : 'Не указана'}</p>
+                        </div>
+                        <div class="col-md-6">
+                            <h6>Контактная информация</h6>
+                            <p><strong>Телефон:</strong> ${data.employee.phone || 'Не указан'}</p>
+                            <p><strong>Email:</strong> ${data.employee.email || 'Не указан'}</p>
+                        </div>
+                    </div>
+
+                    <hr>
+                    <h6>Статистика работы</h6>
+                    <div class="row">
+                        <div class="col-md-4 text-center">
+                            <div class="card bg-light">
+                                <div class="card-body py-2">
+                                    <h6 class="card-title">Всего заказов</h6>
+                                    <h4 class="text-primary">${data.employee.total_orders}</h4>
+                                </div>
+                            </div>
+                        </div>
+                        <div class="col-md-4 text-center">
+                            <div class="card bg-light">
+                                <div class="card-body py-2">
+                                    <h6 class="card-title">В работе</h6>
+                                    <h4 class="text-warning">${data.employee.active_orders}</h4>
+                                </div>
+                            </div>
+                        </div>
+                        <div class="col-md-4 text-center">
+                            <div class="card bg-light">
+                                <div class="card-body py-2">
+                                    <h6 class="card-title">Завершено</h6>
+                                    <h4 class="text-success">${data.employee.completed_orders}</h4>
+                                </div>
+                            </div>
+                        </div>
+                    </div>
+
+                    <p class="mt-3 mb-0">
+                        <strong>За период:</strong> выполнено ${data.employee.period_completed},
+                        выручка ${data.employee.period_revenue} ₽,
+                        средний срок ${data.employee.period_avg_days !== null ? data.employee.period_avg_days + ' дн.' : '—'}
+                    </p>
+
+                    ${data.employee.total_orders > 0 ? `
+                    <div class="text-center mt-3">
+                        <button class="btn btn-outline-primary btn-sm" onclick="viewEmployeeOrders(${data.employee.id})">
+                            <i class="bi bi-list-check"></i> Показать все заказы
+                        </button>
+                    </div>
+                    ` : ''}
+                `;
+            } else {
+                document.getElementById('employeeDetails').innerHTML = `
+                    <div class="alert alert-danger">Ошибка загрузки данных сотрудника</div>
+                `;
+            }
+        });
+}
+
+function viewEmployeeOrders(employeeId) {
+    window.location = '/orders?employee_id=' + employeeId;
+}
+
+// Карточка сотрудника показывает выработку за тот же период, что и таблица
+function periodParams() {
+    return new URLSearchParams(new FormData(document.getElementById('periodForm'))).toString();
+}
+
+// Поиск сотрудников
+document.getElementById('searchInput').addEventListener('input', function() {
+    const searchText = this.value.toLowerCase();
+    const rows = document.querySelectorAll('.employee-row');
+
+    rows.forEach(row => {
+        const name = row.getAttribute('data-name');
+        const position = row.getAttribute('data-position');
+        const phone = row.getAttribute('data-phone');
+        const email = row.getAttribute('data-email');
+
+        const matches = name.includes(searchText) ||
+                       position.includes(searchText) ||
+                       phone.includes(searchText) ||
+                       email.includes(searchText);
+
+        row.style.display = matches ? '' : 'none';
+    });
+});
+
+function clearSearch() {
+    document.getElementById('searchInput').value = '';
+    const rows = document.querySelectorAll('.employee-row');
+    rows.forEach(row => row.style.display = '');
+}
+
+// Фильтрация по должности
+function filterEmployees() {
+    const positionFilter = document.getElementById('positionFilter').value;
+    const searchText = document.getElementById('searchInput').value.toLowerCase();
+
+    const rows = document.querySelectorAll('.employee-row');
+
+    rows.forEach(row => {
+        const position = row.getAttribute('data-position');
+        const name = row.getAttribute('data-name');
+        const phone = row.getAttribute('data-phone');
+        const email = row.getAttribute('data-email');
+
+        const matchesPosition = positionFilter === 'all' || position.includes(positionFilter);
+        const matchesSearch = !searchText ||
+                            name.includes(searchText) ||
+                            position.includes(searchText) ||
+                            phone.includes(searchText) ||
+                            email.includes(searchText);
+
+        row.style.display = (matchesPosition && matchesSearch) ? '' : 'none';
+    });
+}
+
+function exportEmployees() {
+    alert('Функция экспорта сотрудников будет реализована в следующей версии');
+}
+
+function showStatistics() {
+    const statsSection = document.getElementById('employeeStats');
+    statsSection.style.display = statsSection.style.display === 'none' ? 'flex' : 'none';
+}
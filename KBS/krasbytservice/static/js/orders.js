@@ -0,0 +1,174 @@
+// Функция для переключения полей в зависимости от типа заказа
+function toggleOrderFields() {
+    const orderType = document.getElementById('orderType').value;
+    const priceFields = document.getElementById('priceFields');
+
+    // Можно добавить логику скрытия/показа определенных полей
+    console.log('Тип заказа изменен на:', orderType);
+}
+
+// Заполнение формы редактирования
+function fillEditForm(orderId) {
+    // Загрузка данных заказа и заполнение формы
+    alert('Функция редактирования будет реализована в следующей версии');
+}
+
+// Подтверждение удаления
+function confirmDelete(orderId) {
+    if (confirm('Вы уверены, что хотите удалить этот заказ?')) {
+        fetch(`/delete_order/${orderId}`, {
+            method: 'DELETE',
+        })
+        .then(response => response.json())
+        .then(data => {
+            if (data.success) {
+                location.reload();
+            } else {
+                alert('Ошибка при удалении заказа: ' + data.error);
+            }
+        });
+    }
+}
+
+// Просмотр информации о заказе
+function viewOrder(orderId) {
+    fetch(`/api/order_details/${orderId}`)
+        .then(response => response.json())
+        .then(data => {
+            if (data.success) {
+                document.getElementById('viewOrderId').textContent = data.order.id;
+                document.getElementById('orderDetails').innerHTML = `
+                    <div class="row">
+                        <div class="col-md-6">
+                            <h6>Информация о клиенте</h6>
+                            <p><strong>ФИО:</strong> ${data.order.client_name}</p>
+                            <p><strong>Телефон:</strong> ${data.order.client_phone}</p>
+                            <p><strong>Email:</strong> ${data.order.client_email || 'Не указан'}</p>
+                            <p><strong>Адрес:</strong> ${data.order.client_address || 'Не указан'}</p>
+                        </div>
+                        <div class="col-md-6">
+                            <h6>Информация о заказе</h6>
+                            <p><strong>Модель:</strong> ${data.order.model}</p>
+                            <p><strong>Статус:</strong> <span class="badge bg-${data.order.status_class}">${data.order.status}</span></p>
+                            <p><strong>Мастер:</strong> ${data.order.master || 'Не назначен'}</p>
+                            <div class="input-group input-group-sm mb-3">
+                                <select class="form-select" id="orderMaster">
+                                    ${masterOptions(data.order.employee_id)}
+                                </select>
+                                <button class="btn btn-outline-primary" onclick="assignMaster(${data.order.id})">
+                                    <i class="bi bi-person-check"></i> Назначить
+                                </button>
+                            </div>
+                            <p><strong>Дата создания:</strong> ${data.order.created_date}</p>
+                        </div>
+                    </div>
+
+                    ${data.order.description ? `
+                    <hr>
+                    <h6>Описание</h6>
+                    <p>${data.order.description}</p>
+                    ` : ''}
+
+                    <hr>
+                    <h6>Финансовая информация</h6>
+                    <div class="row">
+                        <div class="col-md-4">
+                            <p><strong>Цена выкупа:</strong> ${data.order.purchase_price || '0'} ₽</p>
+                        </div>
+                        <div class="col-md-4">
+                            <p><strong>Затраты на ремонт:</strong> ${data.order.repair_costs || '0'} ₽</p>
+                        </div>
+                        <div class="col-md-4">
+                            <p><strong>Цена продажи:</strong> ${data.order.sale_price || '0'} ₽</p>
+                        </div>
+                    </div>
+                    <div class="alert alert-${data.order.profit >= 0 ? 'success' : 'danger'}">
+                        <strong>Прибыль:</strong> ${data.order.profit} ₽
+                    </div>
+
+                    <h6>История статусов</h6>
+                    <ul class="list-unstyled small mb-3">
+                        ${data.order.history.map(item => `
+                            <li>${item.changed_at} — ${item.status}${item.comment ? ` (${item.comment})` : ''}</li>
+                        `).join('')}
+                    </ul>
+
+                    ${data.order.transitions.length ? `
+                    <div class="input-group input-group-sm justify-content-end">
+                        <select class="form-select flex-grow-0 w-auto" id="nextStatus">
+                            ${data.order.transitions.map(item => `<option value="${item.id}">${item.name}</option>`).join('')}
+                        </select>
+                        <button class="btn btn-outline-primary" onclick="changeStatus(${data.order.id})">
+                            <i class="bi bi-arrow-repeat"></i> Изменить статус
+                        </button>
+                    </div>
+                    ` : ''}
+                `;
+            } else {
+                document.getElementById('orderDetails').innerHTML = `
+                    <div class="alert alert-danger">Ошибка загрузки данных заказа</div>
+                `;
+            }
+        });
+}
+
+// Фильтрация заказов выполняется на сервере: отправляем форму фильтров
+function filterOrders() {
+    document.getElementById('ordersFilterForm').submit();
+}
+
+// Поиск с задержкой, чтобы не отправлять запрос на каждое нажатие
+let searchTimer = null;
+function searchOrders() {
+    clearTimeout(searchTimer);
+    searchTimer = setTimeout(filterOrders, 500);
+}
+
+function resetFilters() {
+    window.location = '/orders';
+}
+
+// Экспорт с теми же фильтрами, что и у списка
+function exportOrders() {
+    const params = new URLSearchParams(new FormData(document.getElementById('ordersFilterForm')));
+    window.location = '/export/orders?' + params.toString();
+}
+
+// Мастера для переназначения берутся из формы нового заказа: там они уже отсортированы по загрузке
+function masterOptions(employeeId) {
+    return Array.from(document.querySelectorAll('#newOrderMaster option')).map(option => `
+        <option value="${option.value}" ${option.value === String(employeeId ?? '') ? 'selected' : ''}>${option.innerHTML.trim()}</option>
+    `).join('');
+}
+
+function assignMaster(orderId) {
+    fetch(`/api/orders/${orderId}/master`, {
+        method: 'POST',
+        headers: {'Content-Type': 'application/json'},
+        body: JSON.stringify({employee_id: document.getElementById('orderMaster').value || null})
+    })
+    .then(response => response.json())
+    .then(data => {
+        if (data.success) {
+            location.reload();
+        } else {
+            alert(data.error || 'Ошибка при назначении мастера');
+        }
+    });
+}
+
+function changeStatus(orderId) {
+    fetch(`/api/orders/${orderId}/status`, {
+        method: 'POST',
+        headers: {'Content-Type': 'application/json'},
+        body: JSON.stringify({status_id: document.getElementById('nextStatus').value})
+    })
+    .then(response => response.json())
+    .then(data => {
+        if (data.success) {
+            location.reload();
+        } else {
+            alert(data.error || 'Ошибка при изменении статуса');
+        }
+    });
+}
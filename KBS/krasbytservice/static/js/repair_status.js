@@ -0,0 +1,25 @@
+document.getElementById('statusForm').addEventListener('submit', function(e) {
+    e.preventDefault();
+
+    const formData = new FormData();
+    formData.append('order_id', document.getElementById('order_id').value);
+    formData.append('phone', document.getElementById('phone').value);
+
+    fetch('/api/check_status', {
+        method: 'POST',
+        body: formData
+    })
+    .then(response => response.json())
+    .then(data => {
+        if (data.error) {
+            document.getElementById('statusResult').style.display = 'none';
+            document.getElementById('errorResult').style.display = 'block';
+        } else {
+            document.getElementById('statusText').textContent = data.status;
+            document.getElementById('modelText').textContent = data.model;
+            document.getElementById('descText').textContent = data.description;
+            document.getElementById('statusResult').style.display = 'block';
+            document.getElementById('errorResult').style.display = 'none';
+        }
+    });
+});
@@ -0,0 +1,362 @@
+// Переменные для хранения данных и графиков
+let categoryChart = null;
+let monthlyChart = null;
+
+// Функция переключения дополнительных параметров
+function toggleReportParams() {
+    const reportType = document.getElementById('reportType').value;
+    const additionalParams = document.getElementById('additionalParams');
+    const paramStatus = document.getElementById('paramStatus');
+    const paramEmployee = document.getElementById('paramEmployee');
+    const paramStockLevel = document.getElementById('paramStockLevel');
+
+    // Скрываем все параметры
+    paramStatus.style.display = 'none';
+    paramEmployee.style.display = 'none';
+    paramStockLevel.style.display = 'none';
+    additionalParams.style.display = 'none';
+
+    // Показываем нужные параметры
+    switch(reportType) {
+        case 'sales':
+        case 'repairs':
+            paramStatus.style.display = 'block';
+            paramEmployee.style.display = 'block';
+            additionalParams.style.display = 'block';
+            break;
+        case 'warehouse':
+            paramStockLevel.style.display = 'block';
+            additionalParams.style.display = 'block';
+            break;
+        case 'clients':
+            additionalParams.style.display = 'block';
+            break;
+    }
+}
+
+// Отчеты и выгрузки формируются фоновыми задачами: ставим задачу и опрашиваем ее статус
+const JOB_POLL_MS = 1000;
+let currentJobId = null;
+
+function submitJob(kind, params) {
+    return fetch('/api/jobs', {
+        method: 'POST',
+        headers: {'Content-Type': 'application/json'},
+        body: JSON.stringify({kind: kind, params: params})
+    })
+    .then(response => response.json())
+    .then(data => {
+        if (!data.success) {
+            throw new Error(data.error);
+        }
+        return data.job;
+    });
+}
+
+function waitForJob(job, onProgress) {
+    currentJobId = job.id;
+    return new Promise((resolve, reject) => {
+        const poll = job => {
+            if (job.id !== currentJobId) {
+                return reject(new Error('Задача заменена новой'));
+            }
+            if (job.status === 'done') {
+                currentJobId = null;
+                return resolve(job);
+            }
+            if (job.status === 'failed' || job.status === 'cancelled') {
+                currentJobId = null;
+                return reject(new Error(job.error || job.message || 'Задача отменена'));
+            }
+            onProgress(job);
+            setTimeout(() => {
+                fetch(`/api/jobs/${job.id}`)
+                    .then(response => response.json())
+                    .then(data => poll(data.job))
+                    .catch(() => reject(new Error('Сервер недоступен')));
+            }, JOB_POLL_MS);
+        };
+        poll(job);
+    });
+}
+
+function cancelCurrentJob() {
+    if (currentJobId) {
+        fetch(`/api/jobs/${currentJobId}/cancel`, {method: 'POST'});
+    }
+}
+
+function showReportProgress(job) {
+    document.getElementById('reportTable').innerHTML = `
+        <tr>
+            <td colspan="4" class="text-center">
+                <div class="spinner-border text-primary" role="status">
+                    <span class="visually-hidden">Загрузка...</span>
+                </div>
+                <p class="mt-2">Формирование отчета... ${job ? job.progress + '%' : ''} ${job && job.message ? job.message : ''}</p>
+                <button type="button" class="btn btn-sm btn-outline-secondary" onclick="cancelCurrentJob()">Отменить</button>
+            </td>
+        </tr>
+    `;
+}
+
+// Функция генерации отчета
+function generateReport() {
+    const reportType = document.getElementById('reportType').value;
+
+    showReportProgress(null);
+
+    submitJob('report', {
+        type: reportType,
+        date_from: document.getElementById('dateFrom').value,
+        date_to: document.getElementById('dateTo').value,
+        status_id: document.getElementById('orderStatus').value,
+        employee_id: document.getElementById('employee').value,
+        stock_level: document.getElementById('stockLevel').value
+    })
+    .then(job => waitForJob(job, showReportProgress))
+    .then(job => fetch(`/api/jobs/${job.id}/result`))
+    .then(response => response.json())
+    .then(data => {
+        if (!data.success) {
+            throw new Error(data.error);
+        }
+
+        // Заголовок отчета
+        document.getElementById('reportTitle').textContent = getReportTitle(reportType);
+
+        fillReportTable(reportType, data.data);
+        updateSummaryStats(reportType, data.data);
+        showCharts(reportType, data.data);
+    })
+    .catch(error => showReportError(error.message));
+}
+
+function showReportError(message) {
+    document.getElementById('reportTable').innerHTML = `
+        <tr>
+            <td colspan="4" class="text-center text-danger">Ошибка формирования отчета: ${message}</td>
+        </tr>
+    `;
+}
+
+function getReportTitle(type) {
+    const titles = {
+        'financial': 'Финансовый отчет',
+        'sales': 'Отчет по продажам',
+        'repairs': 'Отчет по ремонтам',
+        'warehouse': 'Отчет по складу',
+        'clients': 'Отчет по клиентам'
+    };
+    return titles[type] || 'Отчет';
+}
+
+function formatMoney(value) {
+    return Math.round(value).toLocaleString('ru-RU') + ' ₽';
+}
+
+function fillReportTable(reportType, report) {
+    let tableContent = '';
+
+    if (reportType === 'warehouse') {
+        tableContent = `
+            <thead>
+                <tr>
+                    <th>Уровень запаса</th>
+                    <th>Позиций</th>
+                    <th>Количество</th>
+                    <th>Себестоимость</th>
+                    <th>Розничная стоимость</th>
+                </tr>
+            </thead>
+            <tbody>
+                ${report.levels.map(item => `
+                    <tr>
+                        <td>${item.name}</td>
+                        <td>${item.count}</td>
+                        <td>${item.quantity}</td>
+                        <td>${formatMoney(item.cost_value)}</td>
+                        <td>${formatMoney(item.retail_value)}</td>
+                    </tr>
+                `).join('')}
+                <tr class="table-primary fw-bold">
+                    <td>Итого</td>
+                    <td>${report.total_parts}</td>
+                    <td></td>
+                    <td>${formatMoney(report.total_cost_value)}</td>
+                    <td>${formatMoney(report.total_retail_value)}</td>
+                </tr>
+            </tbody>
+        `;
+    } else {
+        // Финансовые отчеты: разбивка по категориям и по статусам
+        const rows = items => items.map(item => `
+            <tr>
+                <td>${item.name}</td>
+                <td>${item.count}</td>
+                <td>${formatMoney(item.amount)}</td>
+                <td>${formatMoney(item.profit)}</td>
+                <td>${item.percentage}%</td>
+            </tr>
+        `).join('');
+
+        tableContent = `
+            <thead>
+                <tr>
+                    <th>Категория</th>
+                    <th>Количество</th>
+                    <th>Сумма (₽)</th>
+                    <th>Прибыль (₽)</th>
+                    <th>Доля (%)</th>
+                </tr>
+            </thead>
+            <tbody>
+                ${rows(report.categories)}
+                <tr class="table-primary fw-bold">
+                    <td>Итого</td>
+                    <td>${report.total_orders}</td>
+                    <td>${formatMoney(report.total_revenue)}</td>
+                    <td>${formatMoney(report.total_profit)}</td>
+                    <td>100%</td>
+                </tr>
+                <tr class="table-light"><td colspan="5"><strong>По статусам</strong></td></tr>
+                ${rows(report.statuses)}
+                ${report.turnaround ? `
+                <tr class="table-light"><td colspan="5"><strong>Сроки выполнения</strong></td></tr>
+                <tr>
+                    <td>Выполнено за период</td>
+                    <td>${report.turnaround.count}</td>
+                    <td colspan="3">в среднем ${report.turnaround.avg_days} дн., максимум ${report.turnaround.max_days} дн.</td>
+                </tr>
+                ${report.status_durations.map(item => `
+                    <tr>
+                        <td>${item.name}</td>
+                        <td>${item.count}</td>
+                        <td colspan="3">в среднем ${item.avg_days} дн., максимум ${item.max_days} дн.</td>
+                    </tr>
+                `).join('')}
+                ` : ''}
+                ${reportType === 'clients' ? `
+                <tr class="table-light"><td colspan="5"><strong>Клиенты</strong></td></tr>
+                <tr><td>Новых за период</td><td colspan="4">${report.new_clients}</td></tr>
+                <tr><td>Всего клиентов</td><td colspan="4">${report.total_clients}</td></tr>
+                ` : ''}
+            </tbody>
+        `;
+    }
+
+    document.getElementById('reportTable').innerHTML = tableContent;
+}
+
+function updateSummaryStats(reportType, report) {
+    if (reportType === 'warehouse') {
+        document.getElementById('totalRevenue').textContent = formatMoney(report.total_retail_value);
+        document.getElementById('totalProfit').textContent = formatMoney(report.total_retail_value - report.total_cost_value);
+        document.getElementById('totalOrders').textContent = report.total_parts;
+        document.getElementById('avgOrder').textContent = '—';
+        return;
+    }
+    document.getElementById('totalRevenue').textContent = formatMoney(report.total_revenue);
+    document.getElementById('totalProfit').textContent = formatMoney(report.total_profit);
+    document.getElementById('totalOrders').textContent = report.total_orders;
+    document.getElementById('avgOrder').textContent = formatMoney(report.avg_order);
+}
+
+function showCharts(reportType, report) {
+    const chartsSection = document.getElementById('chartsSection');
+
+    // Уничтожаем старые графики если они есть
+    if (categoryChart) categoryChart.destroy();
+    if (monthlyChart) monthlyChart.destroy();
+
+    if (reportType === 'warehouse') {
+        chartsSection.style.display = 'none';
+        return;
+    }
+    chartsSection.style.display = 'flex';
+
+    // Создаем график категорий
+    const categoryCtx = document.getElementById('categoryChart').getContext('2d');
+    categoryChart = new Chart(categoryCtx, {
+        type: 'pie',
+        data: {
+            labels: report.categories.map(item => item.name),
+            datasets: [{
+                data: report.categories.map(item => item.percentage),
+                backgroundColor: ['#0d6efd', '#198754', '#ffc107']
+            }]
+        },
+        options: {
+            responsive: true,
+            plugins: {
+                legend: {
+                    position: 'bottom'
+                }
+            }
+        }
+    });
+
+    // Создаем график по месяцам
+    const monthlyCtx = document.getElementById('monthlyChart').getContext('2d');
+    monthlyChart = new Chart(monthlyCtx, {
+        type: 'line',
+        data: {
+            labels: report.monthly.map(item => item.month),
+            datasets: [{
+                label: 'Выручка (тыс. ₽)',
+                data: report.monthly.map(item => Math.round(item.revenue / 1000)),
+                borderColor: '#0d6efd',
+                tension: 0.1
+            }]
+        },
+        options: {
+            responsive: true,
+            scales: {
+                y: {
+                    beginAtZero: true
+                }
+            }
+        }
+    });
+}
+
+function printReport() {
+    window.print();
+}
+
+// Выгрузка данных за выбранный период: склад — запчасти, остальные отчеты — заказы.
+// Файл собирается фоновой задачей и скачивается, когда она выполнена
+function exportToExcel() {
+    const reportType = document.getElementById('reportType').value;
+    const params = {kind: 'orders', format: 'xlsx', args: {}};
+
+    if (reportType === 'warehouse') {
+        params.kind = 'spare_parts';
+        params.args.stock_level = document.getElementById('stockLevel').value;
+    } else {
+        params.args.date_from = document.getElementById('dateFrom').value;
+        params.args.date_to = document.getElementById('dateTo').value;
+        const statusId = document.getElementById('orderStatus').value;
+        if (statusId !== 'all') {
+            params.args.status_id = statusId;
+        }
+    }
+    submitJob('export', params)
+        .then(job => waitForJob(job, () => {}))
+        .then(job => { window.location = `/api/jobs/${job.id}/result`; })
+        .catch(error => alert('Ошибка выгрузки: ' + error.message));
+}
+
+// Инициализация при загрузке страницы
+document.addEventListener('DOMContentLoaded', function() {
+    // Устанавливаем даты по умолчанию (текущий месяц)
+    const today = new Date();
+    const firstDay = new Date(today.getFullYear(), today.getMonth(), 1);
+    const lastDay = new Date(today.getFullYear(), today.getMonth() + 1, 0);
+
+    document.getElementById('dateFrom').value = firstDay.toISOString().split('T')[0];
+    document.getElementById('dateTo').value = lastDay.toISOString().split('T')[0];
+
+    // Показываем параметры для текущего типа отчета
+    toggleReportParams();
+});
@@ -0,0 +1,77 @@
+// Функция для заполнения формы редактирования
+function fillEditForm(button) {
+    const partId = button.getAttribute('data-id');
+    const name = button.getAttribute('data-name');
+    const article = button.getAttribute('data-article');
+    const quantity = button.getAttribute('data-quantity');
+    const costPrice = button.getAttribute('data-cost');
+    const retailPrice = button.getAttribute('data-retail');
+    const minStock = button.getAttribute('data-minstock');
+
+    document.getElementById('editPartId').value = partId;
+    document.getElementById('editName').value = name;
+    document.getElementById('editArticle').value = article || '';
+    document.getElementById('editQuantity').value = quantity;
+    document.getElementById('editOriginalQuantity').value = quantity;
+    document.getElementById('editCostPrice').value = costPrice;
+    document.getElementById('editRetailPrice').value = retailPrice;
+    document.getElementById('editMinStock').value = minStock;
+}
+
+// Функция подтверждения удаления
+function confirmDelete(partId, partName) {
+    if (confirm(`Вы уверены, что хотите удалить запчасть "${partName}"?`)) {
+        fetch(`/delete_spare_part/${partId}`, {
+            method: 'DELETE',
+        })
+        .then(response => response.json())
+        .then(data => {
+            if (data.success) {
+                location.reload();
+            } else {
+                alert('Ошибка при удалении запчасти');
+            }
+        });
+    }
+}
+
+// Фильтрация и поиск
+document.getElementById('searchInput').addEventListener('input', filterTable);
+document.getElementById('stockFilter').addEventListener('change', filterTable);
+
+function filterTable() {
+    const searchText = document.getElementById('searchInput').value.toLowerCase();
+    const stockFilter = document.getElementById('stockFilter').value;
+
+    const rows = document.querySelectorAll('.spare-part-row');
+
+    rows.forEach(row => {
+        const name = row.getAttribute('data-name');
+        const article = row.getAttribute('data-article');
+        const stock = parseInt(row.getAttribute('data-stock'));
+
+        const matchesSearch = name.includes(searchText) || article.includes(searchText);
+        let matchesStock = true;
+
+        if (stockFilter === 'low') {
+            const minStock = parseInt(row.getAttribute('data-min-stock'));
+            matchesStock = stock > 0 && stock <= minStock;
+        } else if (stockFilter === 'out') {
+            matchesStock = stock === 0;
+        }
+
+        row.style.display = (matchesSearch && matchesStock) ? '' : 'none';
+    });
+}
+
+function resetFilters() {
+    document.getElementById('searchInput').value = '';
+    document.getElementById('stockFilter').value = 'all';
+    filterTable();
+}
+
+// Экспорт склада с текущим фильтром по запасу
+function exportSpareParts() {
+    const params = new URLSearchParams({stock_level: document.getElementById('stockFilter').value});
+    window.location = '/export/spare_parts?' + params.toString();
+}
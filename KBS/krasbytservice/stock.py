@@ -0,0 +1,160 @@
+from datetime import datetime
+
+from sqlalchemy import update
+from sqlalchemy.orm import joinedload
+
+from models import db, SparePart, StockMovement, StockReservation
+
+
+class StockError(ValueError):
+    """Операцию со складом нельзя выполнить: нет запчасти, остатка или резерва"""
+
+
+def low_stock_condition():
+    """Низкий запас; совпадает с условием частичного индекса ix_spare_part_low_stock"""
+    return SparePart.quantity <= SparePart.min_stock
+
+
+def _change(part_id, quantity_delta, reserved_delta=0):
+    """Атомарно меняет свободный остаток и резерв одним UPDATE.
+
+    Уменьшение проходит только при достаточном остатке: условие проверяется
+    в том же запросе, поэтому два одновременных резерва не уводят остаток в минус.
+    Возвращает новый свободный остаток или None, если условие не выполнено.
+    """
+    statement = (update(SparePart)
+                 .where(SparePart.id == part_id)
+                 .values(quantity=SparePart.quantity + quantity_delta,
+                         reserved=SparePart.reserved + reserved_delta)
+                 .returning(SparePart.quantity)
+                 .execution_options(synchronize_session=False))
+    if quantity_delta < 0:
+        statement = statement.where(SparePart.quantity >= -quantity_delta)
+    if reserved_delta < 0:
+        statement = statement.where(SparePart.reserved >= -reserved_delta)
+    return db.session.execute(statement).scalar()
+
+
+def _log(part_id, kind, quantity, balance, order_id=None, reservation_id=None, user_id=None, comment=None):
+    movement = StockMovement(spare_part_id=part_id, kind=kind, quantity=quantity, balance=balance,
+                             order_id=order_id, reservation_id=reservation_id, user_id=user_id, comment=comment)
+    db.session.add(movement)
+    return movement
+
+
+def _positive(quantity):
+    quantity = int(quantity)
+    if quantity <= 0:
+        raise StockError('Количество должно быть больше нуля')
+    return quantity
+
+
+def _missing_part(part_id):
+    if db.session.get(SparePart, part_id) is None:
+        return StockError('Запчасть не найдена')
+    return StockError('Недостаточно запчастей на складе')
+
+
+def receive(part_id, quantity, user_id=None, comment=None):
+    """Поступление на склад"""
+    quantity = _positive(quantity)
+    balance = _change(part_id, quantity)
+    if balance is None:
+        raise StockError('Запчасть не найдена')
+    return _log(part_id, 'receipt', quantity, balance, user_id=user_id, comment=comment)
+
+
+def adjust(part_id, delta, user_id=None, comment=None):
+    """Корректировка по инвентаризации на delta штук (со знаком)"""
+    delta = int(delta)
+    if not delta:
+        return None
+    balance = _change(part_id, delta)
+    if balance is None:
+        raise _missing_part(part_id)
+    return _log(part_id, 'adjust', delta, balance, user_id=user_id, comment=comment)
+
+
+def write_off(part_id, quantity, user_id=None, comment=None):
+    """Списание брака или потерь"""
+    quantity = _positive(quantity)
+    balance = _change(part_id, -quantity)
+    if balance is None:
+        raise _missing_part(part_id)
+    return _log(part_id, 'writeoff', -quantity, balance, user_id=user_id, comment=comment)
+
+
+def reserve(order_id, part_id, quantity, user_id=None):
+    """Резервирует запчасти под заказ; StockError, если свободного остатка не хватает"""
+    quantity = _positive(quantity)
+    balance = _change(part_id, -quantity, reserved_delta=quantity)
+    if balance is None:
+        raise _missing_part(part_id)
+    reservation = StockReservation(order_id=order_id, spare_part_id=part_id, quantity=quantity)
+    db.session.add(reservation)
+    db.session.flush()
+    _log(part_id, 'reserve', -quantity, balance, order_id=order_id, reservation_id=reservation.id, user_id=user_id)
+    return reservation
+
+
+def _close(reservation_id, status):
+    # Резерв закрывается условным UPDATE: повторное закрытие не меняет остаток второй раз
+    closed = (StockReservation.query
+              .filter(StockReservation.id == reservation_id, StockReservation.status == 'active')
+              .update({StockReservation.status: status, StockReservation.closed_at: datetime.now()},
+                      synchronize_session=False))
+    if not closed:
+        raise StockError('Резерв не найден или уже закрыт')
+    return db.session.get(StockReservation, reservation_id, populate_existing=True)
+
+
+def release(reservation_id, user_id=None):
+    """Снимает резерв: запчасти возвращаются в свободный остаток"""
+    reservation = _close(reservation_id, 'released')
+    balance = _change(reservation.spare_part_id, reservation.quantity, reserved_delta=-reservation.quantity)
+    _log(reservation.spare_part_id, 'release', reservation.quantity, balance, order_id=reservation.order_id,
+         reservation_id=reservation.id, user_id=user_id)
+    return reservation
+
+
+def consume(reservation_id, user_id=None):
+    """Запчасти из резерва установлены: резерв уменьшается, свободный остаток не меняется"""
+    reservation = _close(reservation_id, 'consumed')
+    balance = _change(reservation.spare_part_id, 0, reserved_delta=-reservation.quantity)
+    _log(reservation.spare_part_id, 'consume', 0, balance, order_id=reservation.order_id,
+         reservation_id=reservation.id, user_id=user_id,
+         comment='Установлено {} шт. из резерва'.format(reservation.quantity))
+    return reservation
+
+
+def release_order(order_id, user_id=None):
+    """Снимает все активные резервы заказа и удаляет их строки (перед удалением заказа)"""
+    reservation_ids = [reservation_id for (reservation_id,) in
+                       db.session.query(StockReservation.id)
+                       .filter(StockReservation.order_id == order_id, StockReservation.status == 'active')]
+    for reservation_id in reservation_ids:
+        release(reservation_id, user_id)
+    StockReservation.query.filter_by(order_id=order_id).delete(synchronize_session=False)
+    return len(reservation_ids)
+
+
+def order_reservations(order_id):
+    return (StockReservation.query
+            .options(joinedload(StockReservation.spare_part))
+            .filter_by(order_id=order_id)
+            .order_by(StockReservation.id)
+            .all())
+
+
+def low_stock_parts(limit=None):
+    """Позиции с низким запасом по частичному индексу, сначала закончившиеся"""
+    query = SparePart.query.filter(low_stock_condition()).order_by(SparePart.quantity, SparePart.id)
+    return query.limit(limit).all() if limit else query.all()
+
+
+def part_movements(part_id, limit=100):
+    return (StockMovement.query
+            .filter_by(spare_part_id=part_id)
+            .order_by(StockMovement.created_at.desc(), StockMovement.id.desc())
+            .limit(limit)
+            .all())
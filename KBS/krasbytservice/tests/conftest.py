@@ -0,0 +1,141 @@
+"""Общие фикстуры тестов: приложение на временной базе SQLite, клиент с входом и счетчик SQL-запросов.
+
+Запуск из каталога KBS/krasbytservice: python -m pytest tests
+"""
+import os
+import shutil
+import sqlite3
+import sys
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event, text
+from sqlalchemy.engine import make_url
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app  # noqa: E402
+from models import db  # noqa: E402
+from datagen import generate  # noqa: E402
+import dashboard_stats  # noqa: E402
+import httpcache  # noqa: E402
+import intake  # noqa: E402
+import lookups  # noqa: E402
+
+
+ADMIN = ('admin', 'admin123')
+
+# Объем синтетических данных: достаточно, чтобы у списков были страницы, а у клиентов — заказы
+SEED_ORDERS = 300
+
+
+def make_app(database_path, **config):
+    # Файлы выгрузок и профили пишутся рядом с временной базой, а не в instance/ исходников
+    return create_app(dict({
+        'TESTING': True,
+        'SECRET_KEY': 'test',
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + str(database_path),
+        'JOBS_DIR': str(database_path.parent / 'jobs'),
+        'PROFILE_DIR': str(database_path.parent / 'profiles'),
+        'JOBS_EXECUTOR': 'thread',
+        'INTAKE_ASYNC': False
+    }, **config))
+
+
+def close_app(app):
+    """Закрывает соединения приложения, чтобы файл базы можно было скопировать или удалить"""
+    with app.app_context():
+        db.session.remove()
+        for engine in db.engines.values():
+            with engine.connect() as connection:
+                if engine.dialect.name == 'sqlite':
+                    connection.execute(text('PRAGMA wal_checkpoint(TRUNCATE)'))
+            engine.dispose()
+
+
+def reset_caches():
+    """Очищает кэши процесса: следующий запрос выполняется «холодным», как первый после запуска воркера"""
+    lookups.lookup_cache.clear()
+    lookups.user_cache.clear()
+    httpcache.version_cache.clear()
+    httpcache.fragment_cache.clear()
+    intake.status_cache.clear()
+    dashboard_stats.snapshot_cache.clear()
+
+
+def commit_elsewhere(app, tables, *statements):
+    """Коммит другого воркера: SQL и рост версий таблиц в обход сессии и кэшей этого процесса"""
+    with sqlite3.connect(make_url(app.config['SQLALCHEMY_DATABASE_URI']).database) as connection:
+        for statement in statements:
+            connection.execute(statement)
+        for table in tables:
+            connection.execute("INSERT INTO data_version (name, version, updated_at) VALUES (?, 1, datetime('now')) "
+                               "ON CONFLICT (name) DO UPDATE SET version = version + 1", (table,))
+    connection.close()
+
+
+@pytest.fixture(scope='session')
+def seeded_database(tmp_path_factory):
+    """Файл базы после flask init-db и генерации данных; создается один раз на запуск тестов"""
+    path = tmp_path_factory.mktemp('seed') / 'seed.db'
+    app = make_app(path)
+    result = app.test_cli_runner().invoke(args=['init-db'])
+    assert result.exit_code == 0, result.output
+    with app.app_context():
+        generate(SEED_ORDERS, seed=1)
+    close_app(app)
+    return path
+
+
+@pytest.fixture
+def app(seeded_database, tmp_path):
+    """Приложение на своей копии заполненной базы: тесты не видят изменений друг друга"""
+    path = tmp_path / 'test.db'
+    shutil.copyfile(seeded_database, path)
+    reset_caches()
+    app = make_app(path)
+    yield app
+    app.extensions['jobs'].shutdown()
+    close_app(app)
+    reset_caches()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def auth_client(client):
+    """Клиент, вошедший под администратором"""
+    response = client.post('/login', data={'username': ADMIN[0], 'password': ADMIN[1]})
+    assert response.status_code == 302
+    return client
+
+
+@pytest.fixture
+def count_queries(app):
+    """Контекстный менеджер, собирающий SQL-запросы всех баз приложения внутри блока:
+
+        with count_queries() as statements:
+            client.get('/orders')
+        assert len(statements) <= 10
+    """
+    with app.app_context():
+        engines = list(db.engines.values())
+
+    @contextmanager
+    def counter():
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        for engine in engines:
+            event.listen(engine, 'before_cursor_execute', record)
+        try:
+            yield statements
+        finally:
+            for engine in engines:
+                event.remove(engine, 'before_cursor_execute', record)
+    return counter
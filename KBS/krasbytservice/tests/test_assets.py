@@ -0,0 +1,138 @@
+"""Сжатие скриптов и стилей и сборка пакетов статики с манифестом"""
+import gzip
+import os
+import shutil
+import subprocess
+
+import pytest
+
+import assets
+from assets import minify_css, minify_js
+
+
+def js(source):
+    return minify_js(source).strip()
+
+
+@pytest.mark.parametrize('source, expected', [
+    # / после значения — деление, после оператора или ключевого слова — регулярное выражение
+    ('var x = a / b / c;', 'var x=a / b / c;'),
+    ('var x = (a + b) / 2;', 'var x=(a + b)/ 2;'),
+    ('var re = /a b\\/[/]/g;', 'var re=/a b\\/[/]/g;'),
+    ('if (!/^\\d+$/.test(s)) return /x  y/i;', 'if(!/^\\d+$/.test(s))return /x  y/i;'),
+    ('var n = i++ / 2, m = j-- / 2;', 'var n=i++ / 2,m=j-- / 2;'),
+    ('var n = a + +/x/.test(s);', 'var n=a + +/x/.test(s);'),
+    ('x = a\n/ b / c;', 'x=a\n/ b / c;'),
+])
+def test_regex_or_division(source, expected):
+    assert js(source) == expected
+
+
+@pytest.mark.parametrize('source, expected', [
+    ('var s = `a  // not a comment ${b}  /* nor this */`;', 'var s=`a  // not a comment ${b}  /* nor this */`;'),
+    # Текст шаблона копируется как есть, код во вставках ${...} сжимается
+    ('var s = `outer ${items.map(item => `<li>${item}  </li>`).join("")} tail  `;',
+     'var s=`outer ${items.map(item=>`<li>${item}  </li>`).join("")} tail  `;'),
+    ('var s = `${ {a: "}"}.a } and ${"`"}`;', 'var s=`${{a:"}"}.a} and ${"`"}`;'),
+    ('var s = `line1\n    line2 \\` still`;', 'var s=`line1\n    line2 \\` still`;'),
+])
+def test_template_literals_kept(source, expected):
+    assert js(source) == expected
+
+
+@pytest.mark.parametrize('source, text', [
+    ('var url = "http://example.com/*x*/";', '"http://example.com/*x*/"'),
+    ("var s = '// kept', t = 1; // removed", "'// kept'"),
+    ('var s = "a \\" /* b */ c";', '"a \\" /* b */ c"'),
+])
+def test_comment_markers_in_strings(source, text):
+    result = js(source)
+    assert text in result
+    assert 'removed' not in result
+
+
+def test_comments_removed():
+    assert js('/* header */\nvar a = 1; // one\n/* two\nlines */ var b = 2;') == 'var a=1;var b=2;'
+
+
+@pytest.mark.parametrize('source, expected', [
+    # Перевод строки заканчивает инструкцию: return без значения, ++ относится к b
+    ('function f() {\n  return\n  x;\n}', 'function f(){return\nx;}'),
+    ('a\n++b', 'a\n++b'),
+    ('a\n--b', 'a\n--b'),
+    ('var a = b\n(c)', 'var a=b\n(c)'),
+    ('x = 1\n[1, 2].forEach(f)', 'x=1\n[1,2].forEach(f)'),
+    # Внутри выражения перевод строки не нужен
+    ('var a = [\n  1,\n  2\n];', 'var a=[1,2];'),
+    ('a = b +\n  +c', 'a=b +\n+c'),
+    ('x = a\n  .b()', 'x=a .b()'),
+])
+def test_line_breaks_preserve_asi(source, expected):
+    assert js(source) == expected
+
+
+def test_js_bundles_parse(app):
+    node = shutil.which('node')
+    if node is None:
+        pytest.skip('Для проверки синтаксиса нужен node')
+    for name in assets.BUNDLES:
+        if name.endswith('.js'):
+            result = subprocess.run([node, '--check'], input=minify_js(assets.bundle_source(app, name)),
+                                    capture_output=True, text=True)
+            assert result.returncode == 0, (name, result.stderr)
+
+
+@pytest.mark.parametrize('source, expected', [
+    ('a  >  b , c { color: red ; margin: 0 auto; }', 'a>b,c{color:red;margin:0 auto}'),
+    # Пробел перед двоеточием в селекторе значим: потомок, а не сам элемент
+    ('div :first-child { top: 0 }', 'div :first-child{top:0}'),
+    ('/* c */ .a:hover { width: calc(100% - 2px) }', '.a:hover{width:calc(100% - 2px)}'),
+    ('.a::before { content: "/* not a comment */  { ; }" }', '.a::before{content:"/* not a comment */  { ; }"}'),
+    ("a { background: url('x y.png') }", "a{background:url('x y.png')}"),
+    ('@media (max-width: 600px) {\n  .a { display: none; }\n}', '@media (max-width:600px){.a{display:none}}'),
+])
+def test_minify_css(source, expected):
+    assert minify_css(source) == expected
+
+
+def test_build_writes_hashed_bundles_and_manifest(app, tmp_path):
+    # Сборка во временной копии static, а не в дереве исходников
+    static = tmp_path / 'static'
+    shutil.copytree(os.path.join(app.static_folder, 'js'), static / 'js')
+    shutil.copytree(os.path.join(app.static_folder, 'css'), static / 'css')
+    app.static_folder = str(static)
+
+    report = assets.build(app)
+    manifest = assets.read_manifest(app)
+    assert sorted(manifest) == sorted(assets.BUNDLES) == [name for name, *_ in report]
+    for name, filename, source_size, size, variants in report:
+        assert manifest[name] == filename
+        stem, extension = os.path.splitext(name)
+        assert filename.startswith(stem + '.') and filename.endswith(extension)
+        data = (static / 'dist' / filename).read_bytes()
+        assert len(data) == size
+        if source_size:  # script.js пока пустой
+            assert size < source_size
+        for suffix, variant_size in variants.items():
+            assert variant_size < size
+        if '.gz' in variants:
+            assert gzip.decompress((static / 'dist' / (filename + '.gz')).read_bytes()) == data
+
+    # Сборка без изменений дает те же имена; --clean удаляет файлы прежних сборок
+    stale = static / 'dist' / 'app.000000000000.js'
+    stale.write_text('old')
+    assert assets.build(app, clean=True) == report
+    assert not stale.exists()
+
+    app.config['ASSETS_DEBUG'] = False
+    app.extensions['assets'] = manifest
+    client = app.test_client()
+    with app.test_request_context():
+        url = assets.asset_url('orders.js')
+    assert url == '/assets/' + manifest['orders.js']
+    response = client.get(url, headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.cache_control.immutable and response.cache_control.max_age == assets.CACHE_MAX_AGE
+    assert 'Accept-Encoding' in response.vary
+    response.close()
+    assert client.get('/assets/' + assets.MANIFEST).status_code == 404
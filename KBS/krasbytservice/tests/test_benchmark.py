@@ -0,0 +1,61 @@
+"""Нагрузочный замер на тестовой базе против сохраненной базовой линии (benchmark_baseline.json).
+
+Сравнение то же, что у flask bench run: p99 с допуском на медленные машины, среднее
+число SQL-запросов на запрос и ошибки. Обновить базовую линию после намеренного изменения:
+
+    KBS_BENCH_SAVE=1 python -m pytest tests/test_benchmark.py
+"""
+import json
+import os
+
+import pytest
+
+from benchmark import DEFAULT_SCENARIOS, SCENARIOS, WRITE_SCENARIOS, QueryCounter, collect_sample, compare, run_scenario
+from conftest import ADMIN
+from models import db
+
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'benchmark_baseline.json')
+REQUESTS = 40
+CONCURRENCY = 2
+# Допустимый рост p99: замер на 40 запросах шумный, ловятся кратные замедления
+TOLERANCE = 2.0
+# Замеров на сценарий; берется лучший по p99, чтобы одна пауза сборщика мусора не считалась регрессией
+RUNS = 3
+
+READ_SCENARIOS = [name for name in DEFAULT_SCENARIOS if name not in WRITE_SCENARIOS]
+
+
+def run_benchmark(app):
+    with app.app_context():
+        sample = collect_sample()
+        engines = list(db.engines.values())
+    results = {}
+    with QueryCounter(engines) as counter:
+        for name in READ_SCENARIOS:
+            # Прогрев: первый запрос компилирует шаблоны и заполняет кэши процесса
+            run_scenario(app, SCENARIOS[name], sample, CONCURRENCY, CONCURRENCY, ADMIN, counter)
+            results[name] = min((run_scenario(app, SCENARIOS[name], sample, REQUESTS, CONCURRENCY, ADMIN, counter)
+                                 for _ in range(RUNS)), key=lambda result: result['p99_ms'])
+    return results
+
+
+def test_benchmark_against_baseline(app):
+    results = run_benchmark(app)
+    if os.environ.get('KBS_BENCH_SAVE'):
+        with open(BASELINE_PATH, 'w', encoding='utf-8') as file:
+            json.dump({'requests': REQUESTS, 'concurrency': CONCURRENCY, 'results': results}, file,
+                      ensure_ascii=False, indent=2)
+        pytest.skip('Базовая линия сохранена')
+
+    with open(BASELINE_PATH, encoding='utf-8') as file:
+        baseline = json.load(file)['results']
+    assert set(baseline) == set(READ_SCENARIOS)
+    assert compare(results, baseline, TOLERANCE) == []
+
+
+def test_compare_reports_regressions():
+    base = {'p99_ms': 10.0, 'queries_per_request': 3.0, 'errors': 0}
+    assert compare({'orders': dict(base, p99_ms=14.0)}, {'orders': base}, 0.5) == []
+    assert [name for name, _ in compare({'orders': dict(base, p99_ms=40.0, queries_per_request=4.0, errors=1)},
+                                        {'orders': base}, 0.5)] == ['orders', 'orders', 'orders']
@@ -0,0 +1,16 @@
+"""Снимок панели управления следует за версиями таблиц, а не только за изменениями своего процесса"""
+from conftest import commit_elsewhere
+import httpcache
+
+
+def test_snapshot_follows_data_version(app, auth_client):
+    before = auth_client.get('/api/dashboard_stats').get_json()['counters']['total_clients']
+
+    commit_elsewhere(app, ['client'],
+                     "INSERT INTO client (name, phone, phone_normalized, created_at) "
+                     "VALUES ('Сидоров Олег', '+7 900 555-00-11', '79005550011', '2024-05-01 12:00:00')")
+    # Тот же снимок, пока версии в кэше процесса не истекли
+    assert auth_client.get('/api/dashboard_stats').get_json()['counters']['total_clients'] == before
+
+    httpcache.version_cache.clear()  # прошло VERSION_TTL
+    assert auth_client.get('/api/dashboard_stats').get_json()['counters']['total_clients'] == before + 1
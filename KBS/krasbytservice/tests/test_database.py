@@ -0,0 +1,76 @@
+"""Настройки базы: явно переданный config важнее переменных окружения, в SQLite читатель не ждет писателя"""
+import shutil
+import threading
+import time
+
+from flask import Flask
+from sqlalchemy import text
+
+from conftest import close_app, make_app
+from database import REPLICA_BIND, configure_database
+from models import db
+
+
+def configured(monkeypatch, config, environ):
+    for name, value in environ.items():
+        monkeypatch.setenv(name, value)
+    app = Flask(__name__)
+    app.config.update(config)
+    configure_database(app)
+    return app.config
+
+
+ENVIRON = {'DATABASE_URL': 'postgres://env/kbs', 'DATABASE_REPLICA_URL': 'postgres://env-replica/kbs',
+           'DB_POOL_SIZE': '3'}
+
+
+def test_explicit_config_wins_over_environment(monkeypatch):
+    config = configured(monkeypatch, {'SQLALCHEMY_DATABASE_URI': 'postgresql://config/kbs',
+                                      'DATABASE_REPLICA_URL': 'postgresql://config-replica/kbs',
+                                      'DB_POOL_SIZE': 7}, ENVIRON)
+    assert config['SQLALCHEMY_DATABASE_URI'] == 'postgresql://config/kbs'
+    assert config['SQLALCHEMY_ENGINE_OPTIONS']['pool_size'] == 7
+    assert config['SQLALCHEMY_BINDS'][REPLICA_BIND]['url'] == 'postgresql://config-replica/kbs'
+
+
+def test_environment_is_fallback(monkeypatch):
+    config = configured(monkeypatch, {}, ENVIRON)
+    assert config['SQLALCHEMY_DATABASE_URI'] == 'postgresql://env/kbs'
+    assert config['SQLALCHEMY_ENGINE_OPTIONS']['pool_size'] == 3
+    assert config['SQLALCHEMY_BINDS'][REPLICA_BIND]['url'] == 'postgresql://env-replica/kbs'
+
+
+def test_sqlite_reader_not_blocked_by_open_write(seeded_database, tmp_path):
+    path = tmp_path / 'wal.db'
+    shutil.copyfile(seeded_database, path)
+    app = make_app(path, SQLITE_BUSY_TIMEOUT=5000)
+    with app.app_context():
+        engine = db.engine
+        with engine.connect() as writer, engine.connect() as reader, engine.connect() as second_writer:
+            for connection in (writer, reader):
+                assert connection.execute(text('PRAGMA journal_mode')).scalar() == 'wal'
+                assert connection.execute(text('PRAGMA busy_timeout')).scalar() == 5000
+            name = reader.execute(text('SELECT name FROM client WHERE id = 1')).scalar()
+            reader.commit()
+
+            writer.execute(text("UPDATE client SET name = 'Запись' WHERE id = 1"))
+            # Запись не зафиксирована: читатель сразу получает прежнее значение, а не ждет блокировку
+            started = time.monotonic()
+            assert reader.execute(text('SELECT name FROM client WHERE id = 1')).scalar() == name
+            assert time.monotonic() - started < 1
+            reader.commit()
+
+            # Второй писатель ждет по busy_timeout, а не падает с "database is locked"
+            def write():
+                second_writer.execute(text("UPDATE client SET address = 'Второй' WHERE id = 1"))
+                second_writer.commit()
+            thread = threading.Thread(target=write)
+            thread.start()
+            time.sleep(0.3)
+            writer.commit()
+            thread.join(10)
+            assert not thread.is_alive()
+
+            row = reader.execute(text('SELECT name, address FROM client WHERE id = 1')).one()
+            assert tuple(row) == ('Запись', 'Второй')
+    close_app(app)
@@ -0,0 +1,43 @@
+"""Статистика сотрудников и счетчики мастеров"""
+from decimal import Decimal
+
+from models import db, Employee, Order
+import employees as workload
+from lifecycle import NEW_STATUS_ID, PROCESSING_STATUS_ID, COMPLETED_STATUS_ID
+
+
+def test_average_salary_in_rubles():
+    employees = [Employee(salary=Decimal('50000.00')), Employee(salary=Decimal('60000.01')), Employee(salary=None)]
+    assert workload.average_salary(employees) == Decimal('55000.01')
+    assert workload.average_salary([Employee(salary=None)]) is None
+
+
+def test_counters_match_recompute_after_each_change(app, auth_client):
+    with app.app_context():
+        first, second = [row[0] for row in db.session.query(Employee.id).filter(Employee.is_active.is_(True))
+                         .order_by(Employee.id).limit(2)]
+        last_id = db.session.query(db.func.max(Order.id)).scalar()
+
+    def assert_no_drift():
+        with app.app_context():
+            assert workload.verify() == []
+
+    auth_client.post('/add_order', data={'client_id': 1, 'model': 'Bosch WLG 20160', 'status_id': NEW_STATUS_ID,
+                                         'employee_id': first, 'sale_price': '4000,10'})
+    with app.app_context():
+        order_id = db.session.query(db.func.max(Order.id)).scalar()
+        assert order_id > last_id
+    assert_no_drift()
+
+    # Выполнение добавляет заказ в выработку мастера за день
+    for status_id in (PROCESSING_STATUS_ID, COMPLETED_STATUS_ID):
+        response = auth_client.post('/api/orders/{}/status'.format(order_id), json={'status_id': status_id})
+        assert response.get_json()['success']
+        assert_no_drift()
+
+    response = auth_client.post('/api/orders/{}/master'.format(order_id), json={'employee_id': second})
+    assert response.get_json()['success']
+    assert_no_drift()
+
+    assert auth_client.delete('/delete_order/{}'.format(order_id)).get_json()['success']
+    assert_no_drift()
@@ -0,0 +1,42 @@
+"""Потоковая выгрузка: память не растет вместе с числом строк"""
+import tracemalloc
+
+from sqlalchemy import insert, select
+
+from export import BATCH_SIZE, iter_csv
+from models import db, Order
+
+
+# Заказов в выгрузке: копии заказов тестовой базы, пока их не станет не меньше
+LARGE_EXPORT_ORDERS = 20000
+# Пик памяти при выгрузке: порция строк, буфер CSV и кэши SQLAlchemy, но не весь файл.
+# Пик около 3 МБ и не меняется от 10 до 40 тысяч заказов, а файл растет с 3 до 14 МБ
+PEAK_MEMORY_LIMIT = 4 * 1024 * 1024
+
+
+def multiply_orders(count):
+    # INSERT ... SELECT удваивает заказы за один запрос; генератор данных на таком объеме медленный
+    columns = [column for column in Order.__table__.columns if column.name != 'id']
+    while db.session.query(Order.id).count() < count:
+        db.session.execute(insert(Order).from_select([column.name for column in columns], select(*columns)))
+    db.session.commit()
+
+
+def test_large_export_streams_in_bounded_memory(app):
+    with app.app_context():
+        multiply_orders(LARGE_EXPORT_ORDERS)
+
+        tracemalloc.start()
+        try:
+            size = chunks = 0
+            for chunk in iter_csv('orders'):
+                size += len(chunk.encode('utf-8'))
+                chunks += 1
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+    assert chunks > LARGE_EXPORT_ORDERS // BATCH_SIZE
+    # Файл больше границы: собранная в памяти целиком выгрузка ее бы превысила
+    assert size > 1.5 * PEAK_MEMORY_LIMIT
+    assert peak < PEAK_MEMORY_LIMIT, 'пик {} байт при выгрузке {} байт'.format(peak, size)
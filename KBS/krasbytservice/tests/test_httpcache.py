@@ -0,0 +1,86 @@
+"""Условные GET и кэш фрагментов по версиям таблиц"""
+from models import db, Client, DataVersion, SparePart
+from httpcache import cached_fragment
+
+
+def get_warehouse(client, **headers):
+    return client.get('/warehouse', headers=headers)
+
+
+def bump_spare_part(app):
+    with app.app_context():
+        part = SparePart.query.order_by(SparePart.id).first()
+        part.min_stock += 1
+        db.session.commit()
+
+
+def version(app, table):
+    with app.app_context():
+        row = db.session.get(DataVersion, table)
+        return row.version if row else 0
+
+
+def test_matching_etag_returns_304(auth_client):
+    first = get_warehouse(auth_client)
+    assert first.status_code == 200 and first.headers['ETag']
+    again = get_warehouse(auth_client, **{'If-None-Match': first.headers['ETag']})
+    assert again.status_code == 304
+    assert again.headers['ETag'] == first.headers['ETag']
+    assert again.get_data() == b''
+
+
+def test_if_modified_since_returns_304(auth_client):
+    first = get_warehouse(auth_client)
+    assert first.headers['Last-Modified']
+    again = get_warehouse(auth_client, **{'If-Modified-Since': first.headers['Last-Modified']})
+    assert again.status_code == 304
+
+
+def test_commit_to_tracked_table_changes_etag(app, auth_client):
+    first = get_warehouse(auth_client)
+    before = version(app, 'spare_part')
+    # before_commit увеличивает версию таблицы в той же транзакции, что и изменение
+    bump_spare_part(app)
+    assert version(app, 'spare_part') == before + 1
+
+    second = get_warehouse(auth_client, **{'If-None-Match': first.headers['ETag']})
+    assert second.status_code == 200
+    assert second.headers['ETag'] != first.headers['ETag']
+
+
+def test_flash_message_bypasses_cache(auth_client):
+    first = get_warehouse(auth_client)
+    with auth_client.session_transaction() as session:
+        session['_flashes'] = [('message', 'Запчасть сохранена')]
+    response = get_warehouse(auth_client, **{'If-None-Match': first.headers['ETag']})
+    # Страница с сообщением отдается целиком и не получает ETag: при обновлении сообщения уже не будет
+    assert response.status_code == 200
+    assert 'Запчасть сохранена' in response.get_data(as_text=True)
+    assert 'ETag' not in response.headers
+
+
+def test_cached_fragment_invalidated_by_its_tables_only(app):
+    calls = []
+
+    def render():
+        calls.append(1)
+        return 'fragment {}'.format(len(calls))
+
+    def fragment():
+        with app.test_request_context('/warehouse'):
+            return cached_fragment('test_fragment', ('spare_part',), None, render)
+
+    assert fragment() == 'fragment 1'
+    assert fragment() == 'fragment 1'
+
+    # Изменение другой отслеживаемой таблицы фрагмент не сбрасывает
+    before = version(app, 'client')
+    with app.app_context():
+        db.session.get(Client, 1).address = 'Новый адрес'
+        db.session.commit()
+    assert version(app, 'client') == before + 1
+    assert fragment() == 'fragment 1'
+
+    bump_spare_part(app)
+    assert fragment() == 'fragment 2'
+    assert len(calls) == 2
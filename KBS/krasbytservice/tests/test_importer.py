@@ -0,0 +1,87 @@
+"""Загрузка файлов: запчасти меняют остаток только через движения склада"""
+import io
+
+from sqlalchemy import func
+
+from models import db, normalize_phone, Client, Order, SparePart, StockMovement
+from export import iter_csv
+from importer import run_import
+import stock
+
+
+HEADER = 'Артикул;Наименование;Количество;Мин. запас\n'
+
+
+def load(text):
+    return run_import('spare_parts', io.StringIO(text))
+
+
+def movements_total(part_id):
+    return db.session.query(func.coalesce(func.sum(StockMovement.quantity), 0)).filter_by(spare_part_id=part_id).scalar()
+
+
+def reserved_part(article, received, reserved):
+    part = SparePart(name='Насос слива', article=article, quantity=0, min_stock=1)
+    db.session.add(part)
+    db.session.flush()
+    stock.receive(part.id, received)
+    stock.reserve(db.session.query(Order.id).limit(1).scalar(), part.id, reserved)
+    db.session.commit()
+    return part
+
+
+def test_import_adjusts_stock_through_movements(app):
+    with app.app_context():
+        part = reserved_part('IMP-1', received=10, reserved=3)
+        result = load(HEADER + 'IMP-1;Насос слива;6;2\nIMP-NEW;Манжета люка;4;1\n')
+        assert result.errors == []
+        assert (result.updated, result.inserted) == (1, 1)
+
+        db.session.refresh(part)
+        assert (part.quantity, part.reserved, part.min_stock) == (3, 3, 2)
+        assert movements_total(part.id) == part.quantity
+
+        new_part = SparePart.query.filter_by(article='IMP-NEW').one()
+        assert new_part.quantity == 4
+        assert [movement.kind for movement in StockMovement.query.filter_by(spare_part_id=new_part.id)] == ['receipt']
+
+
+def test_import_rejects_quantity_below_reserved(app):
+    with app.app_context():
+        part = reserved_part('IMP-2', received=10, reserved=5)
+        result = load(HEADER + 'IMP-2;Насос слива;4;1\n;Без артикула;-1;1\n')
+        assert [row_number for row_number, _ in result.sorted_errors()] == [2, 3]
+
+        db.session.refresh(part)
+        assert (part.quantity, part.reserved) == (5, 5)
+        assert movements_total(part.id) == part.quantity
+
+
+def test_exported_stock_loads_back_unchanged(app):
+    with app.app_context():
+        reserved_part('IMP-3', received=7, reserved=2)
+        before = dict(db.session.query(SparePart.id, SparePart.quantity))
+        movements = StockMovement.query.count()
+
+        result = load(''.join(iter_csv('spare_parts')).lstrip('﻿'))
+        assert result.errors == []
+        assert dict(db.session.query(SparePart.id, SparePart.quantity)) == before
+        assert StockMovement.query.count() == movements
+
+
+def test_orders_link_to_clients_created_by_the_import(app):
+    rows = ['Клиент;Телефон;Модель;Статус',
+            'Орлов Петр;+7 901 111-22-33;LG F2J3;Новая',
+            'Орлова Анна;8 (902) 444-55-66;Bosch WLG;Новая',
+            'Орлов Петр;+7 (901) 111-22-33;Indesit IWSB;Новая']
+    with app.app_context():
+        result = run_import('orders', io.StringIO('\n'.join(rows) + '\n'))
+        assert result.errors == []
+        assert result.inserted == 3
+
+        imported = (db.session.query(Order.washing_machine_model, Client.phone_normalized)
+                    .join(Client, Order.client_id == Client.id)
+                    .order_by(Order.id.desc()).limit(3).all())
+        assert sorted(imported) == sorted([('LG F2J3', normalize_phone('+7 901 111-22-33')),
+                                           ('Bosch WLG', normalize_phone('8 (902) 444-55-66')),
+                                           ('Indesit IWSB', normalize_phone('+7 901 111-22-33'))])
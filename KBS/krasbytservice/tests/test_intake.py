@@ -0,0 +1,69 @@
+"""Публичные заявки: сохраняются в базе до ответа, в журнал не попадают данные посетителей"""
+import logging
+
+from sqlalchemy.exc import IntegrityError
+
+from models import db, BuyRequest, Client, Order
+import intake
+
+
+FORM = {'name': 'Сидоров Семен', 'phone': '+7 (912) 345-67-89', 'model': 'Indesit IWSB 5085',
+        'condition': 'Не сливает воду', 'description': 'Тестовая заявка'}
+
+
+def post_request(client):
+    response = client.post('/buy_request', data=FORM)
+    assert response.status_code == 302
+
+
+def test_request_survives_worker_that_never_ran(app, client, monkeypatch):
+    app.config['INTAKE_ASYNC'] = True
+    # Воркер остановлен сразу после ответа: поток так и не запустился
+    monkeypatch.setattr(intake.IntakeQueue, '_ensure_worker', lambda self: None)
+    post_request(client)
+
+    with app.app_context():
+        request = BuyRequest.query.one()
+        assert request.processed_at is None and request.order_id is None
+        orders = Order.query.count()
+
+        # Брошенную заявку забирает поток любого другого воркера
+        assert intake.process_buy_requests() == 1
+        request = db.session.get(BuyRequest, request.id)
+        order = db.session.get(Order, request.order_id)
+        assert Order.query.count() == orders + 1
+        assert order.washing_machine_model == FORM['model']
+        assert db.session.get(Client, order.client_id).phone_normalized == '79123456789'
+        assert intake.process_buy_requests() == 0
+
+
+def test_stop_processes_pending_requests(app, client):
+    app.config['INTAKE_ASYNC'] = True
+    post_request(client)
+    app.extensions['intake'].stop()
+
+    with app.app_context():
+        request = BuyRequest.query.one()
+        assert request.processed_at is not None and request.order_id is not None
+
+
+def test_failed_request_is_logged_without_personal_data(app, client, monkeypatch, caplog):
+    app.config['INTAKE_ASYNC'] = True
+    monkeypatch.setattr(intake.IntakeQueue, '_ensure_worker', lambda self: None)
+    post_request(client)
+    post_request(client)
+
+    def fail(items):
+        raise IntegrityError('INSERT INTO client', [FORM['name'], FORM['phone']], Exception(FORM['phone']))
+    monkeypatch.setattr(intake, '_create_orders', fail)
+
+    with app.app_context(), caplog.at_level(logging.ERROR, logger='intake'):
+        assert intake.process_buy_requests() == 2
+        requests = BuyRequest.query.order_by(BuyRequest.id).all()
+
+    # Каждая заявка отмечена ошибкой и больше не забирается; в журнале только число, id и тип ошибки
+    assert [request.error for request in requests] == ['IntegrityError', 'IntegrityError']
+    assert all(request.order_id is None for request in requests)
+    assert str(requests[0].id) in caplog.text
+    for value in (FORM['name'], FORM['phone'], '79123456789', FORM['model']):
+        assert value not in caplog.text
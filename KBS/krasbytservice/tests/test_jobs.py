@@ -0,0 +1,125 @@
+"""Фоновые задачи: доступ только владельцу, задачи остановленного пула не переиспользуются"""
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+from werkzeug.security import generate_password_hash
+
+from models import db, Job, User
+import jobs
+
+
+REPORT = {'kind': 'report', 'params': {'type': 'financial', 'date_from': '2024-01-01', 'date_to': '2024-12-31'}}
+
+
+def add_user(app, username, role):
+    with app.app_context():
+        db.session.add(User(username=username, password_hash=generate_password_hash('secret'), role=role))
+        db.session.commit()
+
+
+def login(client, username, password='secret'):
+    assert client.post('/login', data={'username': username, 'password': password}).status_code == 302
+
+
+def dead_pid():
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+
+def stored_job(app, executor, heartbeat_at, user_id=1, status='running'):
+    """Активная задача, как ее оставил пул другого процесса"""
+    with app.app_context():
+        params = jobs.normalize_params(REPORT['kind'], REPORT['params'])
+        job = Job(id=jobs.uuid.uuid4().hex, kind=REPORT['kind'], params=json.dumps(params),
+                  params_key=jobs.params_key(REPORT['kind'], params), status=status, user_id=user_id,
+                  executor=executor, heartbeat_at=heartbeat_at, created_at=datetime.now())
+        db.session.add(job)
+        db.session.commit()
+        return job.id
+
+
+def job_status(app, job_id):
+    with app.app_context():
+        return db.session.get(Job, job_id).status
+
+
+def test_job_is_visible_only_to_owner_and_admin(app, auth_client):
+    response = auth_client.post('/api/jobs', json={'kind': 'report', 'params': REPORT['params']})
+    assert response.status_code == 202
+    job_id = response.get_json()['job']['id']
+
+    add_user(app, 'manager1', 'manager')
+    other = app.test_client()
+    login(other, 'manager1')
+    for url in ('/api/jobs/{}', '/api/jobs/{}/result'):
+        assert other.get(url.format(job_id)).status_code == 404
+    assert other.post('/api/jobs/{}/cancel'.format(job_id)).status_code == 404
+
+    # Такой же отчет другого пользователя — своя задача, а не чужая
+    own = other.post('/api/jobs', json={'kind': 'report', 'params': REPORT['params']}).get_json()['job']['id']
+    assert own != job_id
+    assert other.get('/api/jobs/{}'.format(own)).status_code == 200
+    assert auth_client.get('/api/jobs/{}'.format(own)).status_code == 200
+
+
+def test_jobs_of_dead_executor_are_failed_not_reused(app):
+    now = datetime.now()
+    host = socket.gethostname()
+    dead_process = stored_job(app, '{}:{}:00000000'.format(host, dead_pid()), now)
+    silent_host = stored_job(app, 'other-host:1234:00000000', now - timedelta(minutes=10), status='queued')
+    before_migration = stored_job(app, None, None)
+    alive_host = stored_job(app, 'other-host:1234:11111111', now)
+
+    with app.test_request_context():
+        job = jobs.submit_job(REPORT['kind'], REPORT['params'], user_id=1)
+        assert job.id == alive_host  # живой пул на другом хосте: задача переиспользуется
+    for job_id in (dead_process, silent_host, before_migration):
+        assert job_status(app, job_id) == 'failed'
+    assert job_status(app, alive_host) == 'running'
+
+
+def test_dead_jobs_do_not_count_against_user_limit(app):
+    app.config['JOBS_PER_USER'] = 2
+    for _ in range(2):
+        stored_job(app, 'other-host:1234:00000000', datetime.now() - timedelta(hours=1))
+    with app.test_request_context():
+        job_id = jobs.submit_job('export', {'kind': 'clients'}, user_id=1).id
+
+    # Файл выгрузки с данными клиентов пишется в JOBS_DIR, а не в instance/ исходников
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        with app.app_context():
+            job = db.session.get(Job, job_id)
+            if job.status in ('done', 'failed'):
+                break
+        time.sleep(0.05)
+    assert job.status == 'done'
+    assert os.path.dirname(job.result_path) == app.config['JOBS_DIR']
+
+
+def test_runner_heartbeat_marks_its_jobs_alive(app):
+    runner = app.extensions['jobs']
+    runner.heartbeat = 0.05
+    started = datetime.now() - timedelta(minutes=5)
+    job_id = stored_job(app, runner.executor_id, started)
+    runner._futures[job_id] = None  # задача в пуле этого процесса
+    runner._get_executor()
+    try:
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            with app.app_context():
+                if db.session.get(Job, job_id).heartbeat_at > started:
+                    break
+            time.sleep(0.05)
+        with app.app_context():
+            job = db.session.get(Job, job_id)
+            assert job.heartbeat_at > started
+            assert jobs.executor_alive(job)
+    finally:
+        runner._futures.pop(job_id, None)
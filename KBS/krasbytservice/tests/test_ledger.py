@@ -0,0 +1,62 @@
+"""Журнал прибыли и дневные итоги совпадают с полным пересчетом после каждого изменения заказа"""
+from datetime import datetime
+
+from models import db, Employee, Order, OrderRollup, ProfitLedger
+import ledger
+from lifecycle import NEW_STATUS_ID, PROCESSING_STATUS_ID
+
+
+def active_employees():
+    return [row[0] for row in db.session.query(Employee.id).filter(Employee.is_active.is_(True))
+            .order_by(Employee.id).limit(2)]
+
+
+def test_ledger_matches_recompute_after_each_change(app, auth_client):
+    with app.app_context():
+        first, second = active_employees()
+        last_id = db.session.query(db.func.max(Order.id)).scalar()
+
+    response = auth_client.post('/add_order', data={'client_id': 1, 'model': 'Bosch WLG 20160',
+                                                    'status_id': NEW_STATUS_ID, 'employee_id': first,
+                                                    'purchase_price': '1500,50', 'sale_price': '4000'})
+    assert response.status_code == 302
+    with app.app_context():
+        order_id = db.session.query(db.func.max(Order.id)).scalar()
+        assert order_id > last_id
+        assert ledger.verify() == []
+
+    response = auth_client.post('/api/orders/{}/status'.format(order_id), json={'status_id': PROCESSING_STATUS_ID})
+    assert response.get_json()['success']
+    with app.app_context():
+        assert ledger.verify() == []
+
+    response = auth_client.post('/api/orders/{}/master'.format(order_id), json={'employee_id': second})
+    assert response.get_json()['success']
+    with app.app_context():
+        assert ledger.verify() == []
+
+    assert auth_client.delete('/delete_order/{}'.format(order_id)).get_json()['success']
+    with app.app_context():
+        assert ledger.verify() == []
+
+
+def day_row():
+    return (db.session.query(ProfitLedger.period, ProfitLedger.orders_count, ProfitLedger.revenue)
+            .filter_by(period_key='1999-01-02').one())
+
+
+def test_increment_creates_then_accumulates(app):
+    with app.app_context():
+        # Дня нет в журнале: первая запись вставляет строку, вторая прибавляет к ней
+        order = Order(client_id=1, washing_machine_model='Bosch', status_id=NEW_STATUS_ID, sale_price=100,
+                      created_at=datetime(1999, 1, 2, 10))
+        ledger.record_order(order)
+        ledger.record_order(order)
+        assert day_row() == ('day', 2, 200)
+        rollup = OrderRollup.query.filter_by(day=order.created_at.date()).one()
+        assert (rollup.employee_id, rollup.orders_count) == (ledger.NO_EMPLOYEE, 2)
+
+        ledger.record_order(order, sign=-1)
+        ledger.record_order(order, sign=-1)
+        assert day_row() == ('day', 0, 0)
+        db.session.rollback()
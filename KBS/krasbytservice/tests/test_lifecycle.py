@@ -0,0 +1,109 @@
+"""Статусы заказа: разрешенные переходы, дата выполнения, гонка переходов, история и зависшие заказы"""
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import text
+
+from models import db, Order, OrderStatusHistory
+import ledger
+import lifecycle
+from lifecycle import (NEW_STATUS_ID, PROCESSING_STATUS_ID, REPAIR_STATUS_ID, COMPLETED_STATUS_ID,
+                       CANCELLED_STATUS_ID, TransitionError)
+
+
+def new_order(status_id=NEW_STATUS_ID, created_at=None):
+    order = Order(client_id=1, washing_machine_model='Bosch WLG 20160', description='', status_id=status_id,
+                  created_at=created_at or datetime.now())
+    db.session.add(order)
+    lifecycle.open_history(order)
+    ledger.record_order(order)
+    db.session.commit()
+    return order
+
+
+def change(order, status_id):
+    lifecycle.change_status(order, status_id, user_id=1)
+    db.session.commit()
+
+
+def test_transition_table(app):
+    with app.app_context():
+        for from_status, allowed in lifecycle.TRANSITIONS.items():
+            for status_id in lifecycle.TRANSITIONS:
+                order = new_order(from_status)
+                if status_id in allowed:
+                    change(order, status_id)
+                    assert db.session.get(Order, order.id).status_id == status_id
+                else:
+                    with pytest.raises(TransitionError):
+                        lifecycle.change_status(order, status_id)
+                    db.session.rollback()
+                    assert db.session.get(Order, order.id).status_id == from_status
+        assert ledger.verify() == []
+
+
+def test_forbidden_transition_is_rejected_by_api(app, auth_client):
+    with app.app_context():
+        order_id = new_order().id
+    response = auth_client.post('/api/orders/{}/status'.format(order_id), json={'status_id': COMPLETED_STATUS_ID})
+    assert response.status_code == 400
+    assert not response.get_json()['success']
+    response = auth_client.post('/api/orders/{}/status'.format(order_id), json={'status_id': PROCESSING_STATUS_ID})
+    assert response.get_json()['status_id'] == PROCESSING_STATUS_ID
+
+
+def test_completed_at_set_on_completion_and_cleared_on_reopen(app):
+    with app.app_context():
+        order = new_order(PROCESSING_STATUS_ID)
+        assert order.completed_at is None
+        change(order, COMPLETED_STATUS_ID)
+        assert db.session.get(Order, order.id).completed_at is not None
+        # Гарантийный возврат в ремонт: заказ снова не выполнен
+        change(order, REPAIR_STATUS_ID)
+        assert db.session.get(Order, order.id).completed_at is None
+
+
+def test_concurrent_change_loses_the_race(app):
+    with app.app_context():
+        order = new_order()
+        # Другой пользователь уже перевел заказ, а эта сессия видит прежний статус
+        with db.engine.begin() as connection:
+            connection.execute(text('UPDATE "order" SET status_id = :status WHERE id = :id'),
+                               {'status': PROCESSING_STATUS_ID, 'id': order.id})
+        assert order.status_id == NEW_STATUS_ID
+        with pytest.raises(TransitionError, match='другим пользователем'):
+            lifecycle.change_status(order, CANCELLED_STATUS_ID)
+        db.session.rollback()
+        assert db.session.get(Order, order.id).status_id == PROCESSING_STATUS_ID
+
+
+def test_history_records_each_transition(app):
+    with app.app_context():
+        order = new_order()
+        for status_id in (PROCESSING_STATUS_ID, REPAIR_STATUS_ID, COMPLETED_STATUS_ID):
+            change(order, status_id)
+
+        history = [transition for transition, _ in lifecycle.order_history(order.id)]
+        assert [(item.from_status_id, item.to_status_id) for item in history] == [
+            (None, NEW_STATUS_ID), (NEW_STATUS_ID, PROCESSING_STATUS_ID),
+            (PROCESSING_STATUS_ID, REPAIR_STATUS_ID), (REPAIR_STATUS_ID, COMPLETED_STATUS_ID)]
+        # Открыт только текущий период, каждый закрытый кончается началом следующего
+        assert [item.left_at is None for item in history] == [False, False, False, True]
+        for previous, current in zip(history, history[1:]):
+            assert previous.left_at == current.changed_at
+        assert all(item.user_id == 1 for item in history[1:])
+
+
+def test_stuck_orders(app):
+    with app.app_context():
+        stuck = new_order(REPAIR_STATUS_ID, created_at=datetime.now() - timedelta(days=10))
+        fresh = new_order(REPAIR_STATUS_ID, created_at=datetime.now() - timedelta(days=2))
+        # Давно был в ремонте, но уже вышел из него: период закрыт
+        left = new_order(REPAIR_STATUS_ID, created_at=datetime.now() - timedelta(days=10))
+        change(left, COMPLETED_STATUS_ID)
+
+        ids = {row[0] for row in lifecycle.stuck_orders(limit=10000)}
+        assert stuck.id in ids
+        assert fresh.id not in ids and left.id not in ids
+        assert fresh.id in {row[0] for row in lifecycle.stuck_orders(days=1, limit=10000)}
+        assert OrderStatusHistory.query.filter_by(order_id=left.id, left_at=None).count() == 1
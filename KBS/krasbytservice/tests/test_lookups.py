@@ -0,0 +1,38 @@
+"""Справочники и пользователь сессии: изменения другого воркера видны после истечения кэша версий"""
+from werkzeug.security import generate_password_hash
+
+from conftest import commit_elsewhere
+from models import db, User
+import httpcache
+import lookups
+
+
+def test_deleted_user_is_logged_out(app, client):
+    with app.app_context():
+        db.session.add(User(username='master1', password_hash=generate_password_hash('secret'), role='master'))
+        db.session.commit()
+    assert client.post('/login', data={'username': 'master1', 'password': 'secret'}).status_code == 302
+    assert client.get('/dashboard').status_code == 200
+
+    commit_elsewhere(app, ['user'], "DELETE FROM user WHERE username = 'master1'")
+    httpcache.version_cache.clear()  # прошло VERSION_TTL, а не USER_TTL
+    response = client.get('/dashboard')
+    assert response.status_code == 302
+    assert '/login' in response.headers['Location']
+
+
+def test_renamed_status_is_seen_by_other_workers(app):
+    with app.app_context():
+        assert lookups.status_name(1) != 'Принята'
+    commit_elsewhere(app, ['order_status'], "UPDATE order_status SET name = 'Принята' WHERE id = 1")
+    httpcache.version_cache.clear()
+    with app.app_context():
+        assert lookups.status_name(1) == 'Принята'
+
+
+def test_employee_name_by_id(app):
+    with app.app_context():
+        employee = lookups.employees()[0]
+        assert lookups.employee_name(employee.id) == employee.name
+        assert lookups.employee_name(None) is None
+        assert lookups.employee_name(10 ** 6) is None
@@ -0,0 +1,73 @@
+"""Метрики: доступ администратору или сборщику с токеном, сумма по воркерам, в журнале нет данных посетителей"""
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+
+from sqlalchemy import select
+
+from conftest import close_app, make_app
+from models import db, Client
+import metrics
+
+
+def test_metrics_closed_to_anonymous(client):
+    assert client.get('/metrics').status_code == 403
+
+
+def test_metrics_for_admin(auth_client):
+    response = auth_client.get('/metrics')
+    assert response.status_code == 200
+    assert 'kbs_http_requests_total' in response.get_data(as_text=True)
+
+
+def test_metrics_with_token(app, client):
+    app.config['METRICS_TOKEN'] = 'scrape-secret'
+    assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 403
+    assert client.get('/metrics', headers={'Authorization': 'Bearer scrape-secret'}).status_code == 200
+
+
+def test_metrics_public_only_when_configured(app, client):
+    app.config['METRICS_PUBLIC'] = True
+    assert client.get('/metrics').status_code == 200
+
+
+def test_slow_query_log_has_no_parameter_values(seeded_database, tmp_path, caplog):
+    path = tmp_path / 'slow.db'
+    shutil.copyfile(seeded_database, path)
+    app = make_app(path, SLOW_QUERY_MS=0)
+    with app.app_context(), caplog.at_level(logging.WARNING, logger='metrics'):
+        db.session.execute(select(Client.id).where(Client.phone == '+7 (912) 345-67-89', Client.name == 'Сидоров'))
+    close_app(app)
+
+    assert 'Медленный SQL' in caplog.text
+    assert 'параметров: 2' in caplog.text
+    assert '345-67-89' not in caplog.text and 'Сидоров' not in caplog.text
+
+
+def worker_file(directory, pid, exceptions):
+    """Снимок метрик другого воркера: только счетчик исключений выдуманного представления"""
+    with open(os.path.join(directory, '{}.json'.format(pid)), 'w', encoding='utf-8') as file:
+        json.dump({metrics.EXCEPTIONS.name: [[['other_view'], exceptions]]}, file)
+
+
+def test_metrics_are_summed_across_workers(seeded_database, tmp_path):
+    path = tmp_path / 'workers.db'
+    shutil.copyfile(seeded_database, path)
+    directory = tmp_path / 'metrics'
+    app = make_app(path, METRICS_DIR=str(directory), METRICS_PUBLIC=True)
+    worker_file(directory, os.getppid(), 3)
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    worker_file(directory, process.pid, 4)
+
+    client = app.test_client()
+    for _ in range(2):
+        # Второй сбор: числа завершившегося воркера уже в архиве и не теряются
+        text = client.get('/metrics').get_data(as_text=True)
+        assert 'kbs_http_exceptions_total{endpoint="other_view"} 7' in text
+    assert sorted(os.listdir(directory)) == sorted([metrics.ARCHIVE_NAME, '.lock', '{}.json'.format(os.getppid()),
+                                                    '{}.json'.format(os.getpid())])
+    close_app(app)
@@ -0,0 +1,108 @@
+"""Миграции схемы: новая база совпадает с моделями, старая база обновляется с данными"""
+from decimal import Decimal
+
+import sqlalchemy
+from sqlalchemy import inspect, text
+
+from conftest import close_app, make_app
+from models import db, Client, Order, OrderStatus, OrderStatusHistory, SparePart
+import migrations
+
+
+# Схема базы до появления миграций (create_all по первым моделям)
+LEGACY_SCHEMA = [
+    'CREATE TABLE user (id INTEGER PRIMARY KEY, username VARCHAR(80) NOT NULL UNIQUE, '
+    'password_hash VARCHAR(120) NOT NULL, role VARCHAR(20) NOT NULL)',
+    'CREATE TABLE client (id INTEGER PRIMARY KEY, name VARCHAR(100) NOT NULL, phone VARCHAR(20) NOT NULL, '
+    'email VARCHAR(100), address TEXT, created_at DATETIME)',
+    'CREATE TABLE order_status (id INTEGER PRIMARY KEY, name VARCHAR(50) NOT NULL, description TEXT)',
+    'CREATE TABLE "order" (id INTEGER PRIMARY KEY, client_id INTEGER NOT NULL REFERENCES client (id), '
+    'washing_machine_model VARCHAR(100) NOT NULL, condition TEXT, description TEXT, purchase_price FLOAT, '
+    'repair_costs FLOAT, sale_price FLOAT, status_id INTEGER NOT NULL REFERENCES order_status (id), '
+    'created_at DATETIME, completed_at DATETIME)',
+    'CREATE TABLE spare_part (id INTEGER PRIMARY KEY, name VARCHAR(100) NOT NULL, article VARCHAR(50) UNIQUE, '
+    'quantity INTEGER, cost_price FLOAT, retail_price FLOAT, min_stock INTEGER)',
+    'CREATE TABLE employee (id INTEGER PRIMARY KEY, name VARCHAR(100) NOT NULL, position VARCHAR(50), '
+    'phone VARCHAR(20), email VARCHAR(100), salary FLOAT, hire_date DATETIME)',
+]
+
+LEGACY_DATA = [
+    "INSERT INTO client VALUES (1, 'Иванов Иван', '8 (900) 123-45-67', '', '', '2024-01-10 10:00:00')",
+    "INSERT INTO order_status VALUES (1, 'Новая', ''), (4, 'Выполнена', '')",
+    "INSERT INTO \"order\" VALUES (1, 1, 'Bosch WLG 20160', '', '', 1000.1, 200.2, 3000.3, 4, "
+    "'2024-01-10 10:00:00', '2024-01-12 18:00:00')",
+    "INSERT INTO spare_part VALUES (1, 'Тэн', 'TEN-1', 7, 450.5, 900.0, 2)",
+    "INSERT INTO employee VALUES (1, 'Петров Петр', 'Мастер', '', '', 60000.0, '2023-05-01 00:00:00')",
+]
+
+
+def model_schema():
+    return {table.name: ({column.name for column in table.columns}, {index.name for index in table.indexes})
+            for table in db.metadata.sorted_tables}
+
+
+def database_schema(table_names):
+    inspector = inspect(db.engine)
+    return {name: ({column['name'] for column in inspector.get_columns(name)},
+                   {index['name'] for index in inspector.get_indexes(name)})
+            for name in table_names}
+
+
+def init_db(app):
+    result = app.test_cli_runner().invoke(args=['init-db'])
+    assert result.exit_code == 0, result.output
+
+
+def test_hot_queries_use_indexes(app):
+    with app.app_context():
+        failed = [(name, index, plan) for name, index, plan, ok in migrations.check_indexes() if not ok]
+    assert failed == []
+
+
+def test_fresh_database_matches_models(tmp_path):
+    app = make_app(tmp_path / 'fresh.db')
+    init_db(app)
+    with app.app_context():
+        expected = model_schema()
+        assert database_schema(expected) == expected
+        assert migrations.current_version() == migrations.MIGRATIONS[-1].version
+    close_app(app)
+
+
+def test_downgrade_to_initial_schema_refuses(app):
+    with app.app_context():
+        version = migrations.current_version()
+        orders = Order.query.count()
+    result = app.test_cli_runner().invoke(args=['schema', 'downgrade', '0'])
+    assert result.exit_code != 0
+    assert 'необратима' in result.output
+    with app.app_context():
+        # Отказ до первого шага: ни одна миграция не откачена
+        assert migrations.current_version() == version
+        assert Order.query.count() == orders
+
+
+def test_legacy_database_upgrades_with_data(tmp_path):
+    path = tmp_path / 'legacy.db'
+    engine = sqlalchemy.create_engine('sqlite:///' + str(path))
+    with engine.begin() as connection:
+        for statement in LEGACY_SCHEMA + LEGACY_DATA:
+            connection.execute(text(statement))
+    engine.dispose()
+
+    app = make_app(path)
+    init_db(app)
+    with app.app_context():
+        expected = model_schema()
+        assert database_schema(expected) == expected
+
+        order = db.session.get(Order, 1)
+        assert (order.purchase_price, order.repair_costs, order.sale_price) == (
+            Decimal('1000.10'), Decimal('200.20'), Decimal('3000.30'))
+        assert db.session.get(Client, 1).phone_normalized == '79001234567'
+        part = db.session.get(SparePart, 1)
+        assert (part.quantity, part.reserved, part.cost_price) == (7, 0, Decimal('450.50'))
+        assert OrderStatusHistory.query.filter_by(order_id=1).count() == 1
+        badges = dict(db.session.query(OrderStatus.id, OrderStatus.badge_class))
+        assert (badges[1], badges[4]) == ('primary', 'success')
+    close_app(app)
@@ -0,0 +1,90 @@
+"""Денежные суммы: копейки в базе, рубли Decimal в коде и перевод колонок миграцией 0004"""
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import text
+
+from models import db, Order
+from money import from_kopecks, parse_money, to_kopecks, to_money
+import migrations
+
+
+@pytest.mark.parametrize('rubles, kopecks', [
+    (Decimal('0.00'), 0),
+    (Decimal('0.01'), 1),
+    (Decimal('1234.50'), 123450),
+    (Decimal('-99.99'), -9999),
+    (Decimal('92233720368547758.07'), 2 ** 63 - 1),
+])
+def test_kopecks_round_trip(rubles, kopecks):
+    assert to_kopecks(rubles) == kopecks
+    assert from_kopecks(kopecks) == rubles
+    assert to_kopecks(None) is None and from_kopecks(None) is None
+
+
+def test_float_converted_without_binary_tail():
+    assert to_money(0.1 + 0.2) == Decimal('0.30')
+    assert to_kopecks(0.1 + 0.2) == 30
+    # AVG в SQL дает дробные копейки
+    assert from_kopecks(12.5) == Decimal('0.13')
+
+
+def test_money_column_round_trip(app):
+    with app.app_context():
+        order = db.session.get(Order, 1)
+        order.sale_price = Decimal('12345678901.23')
+        order.repair_costs = 0.1 + 0.2
+        db.session.commit()
+        stored = db.session.execute(text('SELECT sale_price, repair_costs FROM "order" WHERE id = 1')).one()
+        assert tuple(stored) == (1234567890123, 30)
+        db.session.expire_all()
+        order = db.session.get(Order, 1)
+        assert (order.sale_price, order.repair_costs) == (Decimal('12345678901.23'), Decimal('0.30'))
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('1500', Decimal('1500.00')),
+    ('1 234,5', Decimal('1234.50')),
+    ('1\xa0234,56', Decimal('1234.56')),
+    ('0,005', Decimal('0.01')),  # половина копейки округляется вверх, а не к четному
+    ('2.675', Decimal('2.68')),
+    ('-10,125', Decimal('-10.13')),
+    (2.675, Decimal('2.68')),
+])
+def test_parse_money_rounds_half_up(value, expected):
+    assert parse_money(value) == expected
+
+
+@pytest.mark.parametrize('value', ['', 'abc', '12,34,56', '1e', '--5'])
+def test_parse_money_rejects_garbage(value):
+    with pytest.raises(ValueError):
+        parse_money(value)
+
+
+def test_money_migration_keeps_values(app):
+    amounts = {'sale_price': 0.1 + 0.2, 'repair_costs': 12345678901.23, 'purchase_price': 1000.1}
+    with app.app_context():
+        db.session.remove()
+        migrations.downgrade(3)
+        assert migrations.current_version() == 3
+        db.session.execute(text('UPDATE "order" SET sale_price = :sale_price, repair_costs = :repair_costs, '
+                                'purchase_price = :purchase_price WHERE id = 1'), amounts)
+        db.session.commit()
+        db.session.remove()
+
+        migrations.upgrade()
+        stored = db.session.execute(text('SELECT sale_price, repair_costs, purchase_price FROM "order" '
+                                         'WHERE id = 1')).one()
+        assert tuple(stored) == (30, 1234567890123, 100010)
+        order = db.session.get(Order, 1)
+        assert (order.sale_price, order.repair_costs, order.purchase_price) == (
+            Decimal('0.30'), Decimal('12345678901.23'), Decimal('1000.10'))
+        db.session.remove()
+
+        # Обратно в рубли Float: те же суммы
+        migrations.downgrade(3)
+        stored = db.session.execute(text('SELECT sale_price, repair_costs, purchase_price FROM "order" '
+                                         'WHERE id = 1')).one()
+        assert tuple(stored) == (0.3, 12345678901.23, 1000.1)
+        db.session.remove()
+        migrations.upgrade()
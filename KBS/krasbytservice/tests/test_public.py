@@ -0,0 +1,90 @@
+"""Публичные страницы: лимиты запросов, ограничение одновременных запросов и кэш статусов заказов"""
+from models import db, Client, Order
+import intake
+import ratelimit
+from ratelimit import TokenBucket
+
+
+def check_status(client, order_id, phone):
+    return client.post('/api/check_status', data={'order_id': order_id, 'phone': phone})
+
+
+def order_with_phone(app):
+    with app.app_context():
+        order = Order.query.order_by(Order.id).first()
+        return order.id, order.client_id, db.session.get(Client, order.client_id).phone
+
+
+def test_token_bucket_refills(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(ratelimit.time, 'monotonic', lambda: now[0])
+    bucket = TokenBucket(rate_per_minute=6, capacity=2)
+    assert bucket.allow('ip') == (True, 0)
+    assert bucket.allow('ip') == (True, 0)
+    # Токен появляется раз в 10 секунд
+    assert bucket.allow('ip') == (False, 10)
+    assert bucket.allow('other') == (True, 0)
+    now[0] += 10
+    assert bucket.allow('ip') == (True, 0)
+
+
+def test_ip_limit_returns_429_with_retry_after(client):
+    capacity = ratelimit.DEFAULT_RATE_LIMITS['check_status'][1]
+    for number in range(capacity):
+        assert check_status(client, 1, '+7 900 000-00-{:02d}'.format(number)).status_code == 200
+    response = check_status(client, 1, '+7 900 000-00-99')
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) >= 1
+    assert not response.get_json()['success']
+
+
+def test_phone_limit_returns_429(app, client):
+    app.extensions['public_limits'].buckets[('check_status', 'ip')] = TokenBucket(1000, 1000)
+    capacity = ratelimit.DEFAULT_RATE_LIMITS['check_status'][1]
+    for _ in range(capacity):
+        check_status(client, 1, '+7 900 111-22-33')
+    response = check_status(client, 1, '8 (900) 111-22-33')
+    assert response.status_code == 429
+    assert 'Retry-After' in response.headers
+
+
+def test_busy_public_slots_return_503(app, client):
+    slots = app.extensions['public_limits'].slots
+    for _ in range(ratelimit.PUBLIC_MAX_CONCURRENCY):
+        assert slots.acquire(blocking=False)
+    try:
+        response = check_status(client, 1, '+7 900 000-00-00')
+        assert response.status_code == 503
+        assert response.headers['Retry-After'] == '1'
+    finally:
+        for _ in range(ratelimit.PUBLIC_MAX_CONCURRENCY):
+            slots.release()
+    assert check_status(client, 1, '+7 900 000-00-00').status_code == 200
+
+
+def test_status_is_cached(app, client, count_queries):
+    order_id, _, phone = order_with_phone(app)
+    assert 'status' in check_status(client, order_id, phone).get_json()
+    with count_queries() as statements:
+        assert 'status' in check_status(client, order_id, phone).get_json()
+        # Чужой телефон проверяется по тому же кэшу и заказ не раскрывает
+        assert check_status(client, order_id, '+7 999 999-99-99').get_json() == {'error': 'Заказ не найден'}
+    assert statements == []
+
+    # Отсутствующий заказ тоже кэшируется
+    check_status(client, 10 ** 9, phone)
+    with count_queries() as statements:
+        assert check_status(client, 10 ** 9, phone).get_json() == {'error': 'Заказ не найден'}
+    assert statements == []
+
+
+def test_changed_phone_no_longer_opens_status(app, client, auth_client):
+    order_id, client_id, old_phone = order_with_phone(app)
+    assert 'status' in check_status(client, order_id, old_phone).get_json()
+
+    response = auth_client.post('/edit_client', data={'client_id': client_id, 'name': 'Новое имя',
+                                                      'phone': '+7 (911) 000-11-22'})
+    assert response.status_code == 302
+    assert intake.status_cache.get(order_id) is None
+    assert check_status(client, order_id, old_phone).get_json() == {'error': 'Заказ не найден'}
+    assert 'status' in check_status(client, order_id, '89110001122').get_json()
@@ -0,0 +1,82 @@
+"""Постраничный вывод заказов по курсору (created_at, id)"""
+import base64
+from datetime import datetime
+
+import pytest
+
+from models import db, Order
+from queries import decode_cursor, encode_cursor, filtered_orders_query, paginate_orders
+import lifecycle
+from lifecycle import NEW_STATUS_ID
+
+
+def add_same_time_orders(count, created_at=datetime(2024, 3, 1, 12, 0)):
+    # Заказы с одинаковым временем создания: порядок между ними задает только id
+    orders = [Order(client_id=1, washing_machine_model='Bosch WLG 20160', description='', status_id=NEW_STATUS_ID,
+                    created_at=created_at) for _ in range(count)]
+    db.session.add_all(orders)
+    db.session.flush()
+    for order in orders:
+        lifecycle.open_history(order)
+    db.session.commit()
+    return [order.id for order in orders]
+
+
+def walk(limit, **filters):
+    ids, cursor, pages = [], None, 0
+    while True:
+        orders, cursor = paginate_orders(cursor=cursor, limit=limit, **filters)
+        ids.extend(order.id for order in orders)
+        pages += 1
+        if cursor is None:
+            return ids, pages
+
+
+def expected_ids(**filters):
+    return [order.id for order in filtered_orders_query(**filters)
+            .order_by(Order.created_at.desc(), Order.id.desc())]
+
+
+def test_pages_cover_all_orders_once_with_equal_timestamps(app):
+    with app.app_context():
+        same_time = add_same_time_orders(10)
+        # Граница страницы проходит внутри группы с одинаковым created_at
+        ids, pages = walk(limit=7)
+        assert ids == expected_ids()
+        assert len(set(ids)) == len(ids) == Order.query.count()
+        assert pages == -(-len(ids) // 7)
+        position = ids.index(max(same_time))
+        assert ids[position:position + 10] == sorted(same_time, reverse=True)
+
+
+def test_filters_combine_with_cursor(app):
+    with app.app_context():
+        add_same_time_orders(5)
+        status_id = db.session.query(Order.status_id).filter_by(client_id=1).limit(1).scalar()
+        for filters in ({'status_id': status_id}, {'search': 'Bosch'}, {'status_id': status_id, 'search': 'Bosch'}):
+            ids, _ = walk(limit=3, **filters)
+            assert ids == expected_ids(**filters)
+            assert ids
+
+
+@pytest.mark.parametrize('cursor', [
+    'garbage',
+    '!!!',
+    base64.urlsafe_b64encode(b'2024-01-01T00:00:00').decode(),
+    base64.urlsafe_b64encode(b'not-a-date|5').decode(),
+    base64.urlsafe_b64encode(b'2024-01-01T00:00:00|abc').decode(),
+    base64.urlsafe_b64encode(b'2024-01-01|1|2').decode(),
+    base64.urlsafe_b64encode(b'\xff\xfe|1').decode(),
+])
+def test_tampered_cursor_returns_first_page(app, auth_client, cursor):
+    assert decode_cursor(cursor) is None
+    first = auth_client.get('/api/orders?limit=5').get_json()
+    response = auth_client.get('/api/orders', query_string={'limit': 5, 'cursor': cursor})
+    assert response.status_code == 200
+    assert response.get_json() == first
+
+
+def test_cursor_round_trip(app):
+    with app.app_context():
+        order = Order.query.first()
+        assert decode_cursor(encode_cursor(order)) == (order.created_at, order.id)
@@ -0,0 +1,62 @@
+"""Число SQL-запросов представлений не превышает их query_budget.
+
+Страницы открываются с пустыми кэшами процесса: так выглядит первый запрос
+после запуска воркера, и именно он должен укладываться в бюджет.
+"""
+import pytest
+
+from conftest import reset_caches
+
+
+# Представления с query_budget: GET-запросы с типичными параметрами
+BUDGETED_URLS = [
+    '/orders',
+    '/orders?status_id=3',
+    '/orders?q=LG',
+    '/api/orders',
+    '/api/orders?limit=200',
+    '/api/order_details/1',
+    '/dashboard',
+    '/api/dashboard_stats',
+    '/clients',
+    '/api/client_details/1',
+    '/employees',
+    '/employees?date_from=2020-01-01&date_to=2030-12-31',
+    '/api/employee_details/1',
+    '/warehouse',
+    '/api/search?q=Bosch',
+    '/api/search?q=900',
+    '/api/profit_ledger',
+    '/api/profit_ledger?period=day',
+]
+
+
+def query_budget(app, url, method='GET'):
+    endpoint, _ = app.url_map.bind('localhost').match(url.split('?')[0], method=method)
+    return app.view_functions[endpoint].query_budget
+
+
+@pytest.mark.parametrize('url', BUDGETED_URLS)
+def test_cold_render_within_query_budget(app, auth_client, count_queries, url):
+    reset_caches()
+    with count_queries() as statements:
+        response = auth_client.get(url)
+    assert response.status_code == 200
+    assert len(statements) <= query_budget(app, url), '\n'.join(statements)
+
+
+@pytest.mark.parametrize('url', BUDGETED_URLS)
+def test_repeated_render_within_query_budget(app, auth_client, count_queries, url):
+    auth_client.get(url)
+    with count_queries() as statements:
+        response = auth_client.get(url)
+    assert response.status_code in (200, 304)
+    assert len(statements) <= query_budget(app, url), '\n'.join(statements)
+
+
+def test_check_status_within_query_budget(app, client, count_queries):
+    reset_caches()
+    with count_queries() as statements:
+        response = client.post('/api/check_status', data={'order_id': 1, 'phone': '+7 900 000-00-00'})
+    assert response.status_code == 200
+    assert len(statements) <= query_budget(app, '/api/check_status', 'POST')
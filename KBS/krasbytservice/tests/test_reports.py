@@ -0,0 +1,65 @@
+"""Отчеты по дневным итогам: фильтр по мастеру и перенос итогов при смене мастера"""
+from datetime import date, timedelta
+
+from sqlalchemy import func
+
+from models import db, Employee, Order, OrderRollup
+from report_engine import build_report
+import ledger
+import migrations
+
+
+DATE_FROM = date.today() - timedelta(days=3 * 365)
+DATE_TO = date.today()
+
+
+def repair_orders(employee_id=None):
+    query = Order.query.filter(ledger.order_category_expr() == 'repair',
+                               func.date(Order.created_at) >= DATE_FROM.isoformat())
+    if employee_id:
+        query = query.filter(Order.employee_id == employee_id)
+    return query.count()
+
+
+def test_report_filters_by_employee(app):
+    with app.app_context():
+        employee_id = db.session.query(Order.employee_id).filter(Order.employee_id.isnot(None)).limit(1).scalar()
+        everyone = build_report('repairs', DATE_FROM, DATE_TO, {'employee_id': 'all'})
+        one = build_report('repairs', DATE_FROM, DATE_TO, {'employee_id': str(employee_id)})
+
+        assert everyone['total_orders'] == repair_orders()
+        assert one['total_orders'] == repair_orders(employee_id)
+        assert 0 < one['total_orders'] < everyone['total_orders']
+
+
+def test_assigning_master_moves_rollup(app, auth_client):
+    with app.app_context():
+        order = Order.query.filter(Order.employee_id.isnot(None)).order_by(Order.id).first()
+        order_id, old_employee = order.id, order.employee_id
+        new_employee = (db.session.query(Employee.id)
+                        .filter(Employee.id != old_employee, Employee.is_active.is_(True)).limit(1).scalar())
+
+    response = auth_client.post('/api/orders/{}/master'.format(order_id), json={'employee_id': new_employee})
+    assert response.get_json()['success']
+
+    with app.app_context():
+        assert ledger.verify() == []
+        order = db.session.get(Order, order_id)
+        rollup = OrderRollup.query.filter_by(day=order.created_at.date(), status_id=order.status_id,
+                                             category=ledger.order_category(order), employee_id=new_employee).one()
+        assert rollup.orders_count >= 1
+
+
+def test_rollup_migration_round_trip(app):
+    with app.app_context():
+        totals = db.session.query(func.sum(OrderRollup.orders_count), func.sum(OrderRollup.revenue)).one()
+        db.session.remove()
+        migrations.downgrade(7)
+        assert 'employee_id' not in migrations._columns('order_rollup')
+        merged = db.session.execute(db.text('SELECT SUM(orders_count), COUNT(*) FROM order_rollup')).one()
+        assert merged[0] == totals[0]
+        db.session.remove()
+
+        migrations.upgrade()
+        assert ledger.verify() == []
+        assert db.session.query(func.sum(OrderRollup.orders_count), func.sum(OrderRollup.revenue)).one() == totals
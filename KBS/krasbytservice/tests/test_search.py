@@ -0,0 +1,34 @@
+"""Поиск заказов по телефону: с полнотекстовым индексом и без него результат один и тот же"""
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from models import db, Client, Order
+from queries import filtered_orders_query
+import search
+
+
+@pytest.mark.parametrize('fts', [True, False])
+def test_order_search_by_phone_in_any_format(app, monkeypatch, fts):
+    monkeypatch.setattr(search, 'fts_enabled', lambda: fts)
+    with app.app_context():
+        client = db.session.get(Client, 1)
+        client.phone = '+7 (900) 123-45-67'
+        client.phone_normalized = '79001234567'
+        db.session.commit()
+        expected = {order.id for order in Order.query.filter_by(client_id=1)}
+        assert expected
+
+        for text in ('8 900 123-45-67', '900-123-45', '1234567'):
+            found = {order.id for order in filtered_orders_query(search=text) if order.client_id == 1}
+            assert found == expected, text
+
+
+def test_fallback_condition_matches_normalized_phone(app, monkeypatch):
+    # Без FTS5 (PostgreSQL) телефон сравнивается с нормализованной колонкой, а не с тем, как его ввели
+    monkeypatch.setattr(search, 'fts_enabled', lambda: False)
+    with app.app_context():
+        condition = search.order_search_condition('8 (900) 123-45-67')
+    compiled = condition.compile(dialect=postgresql.dialect())
+    assert 'client.phone_normalized LIKE' in str(compiled)
+    assert 'client.phone LIKE' not in str(compiled)
+    assert '%79001234567%' in compiled.params.values()
@@ -0,0 +1,80 @@
+"""Складские операции: резерв под нагрузкой не уводит остаток в минус, журнал сходится с остатком"""
+import threading
+
+from sqlalchemy import func
+
+from models import db, Order, SparePart, StockMovement
+import stock
+
+
+STOCK = 5
+THREADS = 12
+
+
+def movements_total(part_id):
+    return db.session.query(func.coalesce(func.sum(StockMovement.quantity), 0)).filter_by(spare_part_id=part_id).scalar()
+
+
+def test_concurrent_reserve_does_not_oversell(app):
+    with app.app_context():
+        part = SparePart(name='Тэн 2000 Вт', article='TEST-CONCURRENT', quantity=0, min_stock=1)
+        db.session.add(part)
+        db.session.flush()
+        stock.receive(part.id, STOCK, comment='Тест')
+        db.session.commit()
+        part_id = part.id
+        order_ids = [order_id for (order_id,) in db.session.query(Order.id).order_by(Order.id).limit(THREADS)]
+
+    # Каждый поток — отдельный контекст приложения, своя сессия и свое соединение с базой
+    barrier = threading.Barrier(THREADS)
+    results = []
+    errors = []
+
+    def worker(order_id):
+        with app.app_context():
+            barrier.wait()
+            try:
+                stock.reserve(order_id, part_id, 1)
+                db.session.commit()
+                results.append(order_id)
+            except stock.StockError:
+                db.session.rollback()
+            except Exception as error:
+                db.session.rollback()
+                errors.append(error)
+
+    threads = [threading.Thread(target=worker, args=(order_id,)) for order_id in order_ids]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    with app.app_context():
+        part = db.session.get(SparePart, part_id)
+        assert part.quantity >= 0
+        assert len(results) == min(THREADS, STOCK)
+        assert part.reserved == len(results)
+        assert part.quantity + part.reserved == STOCK
+        assert movements_total(part_id) == part.quantity
+
+
+def test_movements_sum_to_stock_after_each_operation(app):
+    with app.app_context():
+        part = SparePart(name='Ремень привода', article='TEST-LOG', quantity=0, min_stock=1)
+        db.session.add(part)
+        db.session.flush()
+        order_id = db.session.query(Order.id).order_by(Order.id).limit(1).scalar()
+
+        stock.receive(part.id, 10)
+        reservation = stock.reserve(order_id, part.id, 4)
+        stock.write_off(part.id, 1)
+        stock.adjust(part.id, -2)
+        stock.consume(reservation.id)
+        second = stock.reserve(order_id, part.id, 2)
+        stock.release(second.id)
+        db.session.commit()
+
+        db.session.refresh(part)
+        assert (part.quantity, part.reserved) == (3, 0)
+        assert movements_total(part.id) == part.quantity
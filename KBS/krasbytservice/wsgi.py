@@ -0,0 +1,26 @@
+"""Точка входа для продакшен-сервера.
+
+Linux: gunicorn -c gunicorn.conf.py wsgi:app
+Windows (gunicorn там не работает): python wsgi.py — waitress, один процесс с потоками.
+За прокси (nginx) задайте KBS_PROXY_COUNT=1, чтобы лимиты считались по адресам посетителей.
+Перед первым запуском и после обновления: flask --app app init-db и flask --app app assets build
+(скрипты и стили страниц со сжатыми копиями в static/dist; nginx может отдавать их сам:
+location /assets/ { alias .../static/dist/; gzip_static on; expires max; }).
+"""
+import os
+
+from app import create_app
+
+
+app = create_app()
+
+
+if __name__ == '__main__':
+    try:
+        from waitress import serve
+    except ImportError:
+        raise SystemExit('Установите waitress (pip install waitress) или запускайте через gunicorn')
+    serve(app,
+          host=os.environ.get('KBS_HOST', '0.0.0.0'),
+          port=int(os.environ.get('KBS_PORT', 8000)),
+          threads=int(os.environ.get('KBS_THREADS', 8)))